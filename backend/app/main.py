@@ -1,11 +1,72 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from app.routes import (
     students, attendance, classes, class_sessions, recognition_logs, student_embeddings, recognition, auth
 )
+from app.services.face_recognition.executor import run_inference, shutdown_inference_executor
+from app.services.face_recognition.warmup import warm_up_models
+from app.services.face_recognition.process_backend import (
+    process_backend_enabled,
+    get_inference_process_pool,
+    shutdown_inference_processes
+)
+from app.services.gallery_service import get_gallery
+from app.services.recognition_job_service import ensure_recognition_job_indexes, get_recognition_job_workers
+from app.utils.config import WARMUP_ON_STARTUP
+
+logger = logging.getLogger(__name__)
+
+
+async def _warm_up(app: FastAPI):
+    """Load models, run dummy inferences and load the gallery, then mark ready."""
+    try:
+        if process_backend_enabled():
+            # Detection and embedding run in the worker processes; they load the models
+            app.state.warmup_report = await run_inference(get_inference_process_pool().start)
+        else:
+            app.state.warmup_report = await run_inference(warm_up_models)
+        gallery = await get_gallery()
+        app.state.warmup_report["gallery_embeddings"] = len(gallery)
+        app.state.ready = True
+    except Exception as e:
+        logger.error(f"Warm-up failed, replica stays not ready: {e}")
+        app.state.warmup_error = str(e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = not WARMUP_ON_STARTUP
+    app.state.warmup_report = None
+    app.state.warmup_error = None
+
+    # Warm up in the background so liveness checks answer while models load
+    warmup_task = asyncio.create_task(_warm_up(app)) if WARMUP_ON_STARTUP else None
+
+    try:
+        await ensure_recognition_job_indexes()
+    except Exception as e:
+        logger.error(f"Could not create recognition job indexes: {e}")
+    # Picks up queued jobs, including ones left behind by a previous process
+    job_workers = get_recognition_job_workers()
+    job_workers.start()
+
+    yield
+
+    await job_workers.stop()
+    if warmup_task is not None:
+        warmup_task.cancel()
+    shutdown_inference_executor(wait=False)
+    shutdown_inference_processes()
+
+
 app = FastAPI(
     title="Student Attendance System API",
     description="Handles student data management and facial recognition operations.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Register both routers
@@ -21,3 +82,14 @@ app.include_router(auth.router)
 @app.get("/")
 async def root():
     return {"message": "Backend is running successfully"}
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 only once model warm-up has finished."""
+    if not app.state.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "warming_up", "error": app.state.warmup_error}
+        )
+    return {"status": "ready", "warmup": app.state.warmup_report}
@@ -1,32 +1,180 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
-from typing import List
-from app.services.recognition_service import recognize_multiple_images
-from app.services.attendance_service import mark_attendance_from_recognition
+import tempfile
+from typing import AsyncIterator
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from app.services.recognition_service import recognize_multiple_images, recognize_video, get_recognition_stats
+from app.services.recognition_job_service import submit_recognition_job, get_recognition_job_service
+from app.services.attendance_service import mark_attendance_from_recognition, SessionNotFound
 from app.utils.auth_dependency import get_current_user
+from app.utils.rbac import AdminOnly
+from app.utils.multipart_stream import iter_form_parts
+from app.utils.config import MAX_UPLOAD_SIZE, VIDEO_MAX_UPLOAD_SIZE, VIDEO_TEMP_DIR
 
 router = APIRouter(prefix="/recognition", tags=["Recognition"])
 
 
-@router.post("/take-attendance")
+# The body is parsed by hand (streaming), so describe the form for the docs
+_TAKE_ATTENDANCE_FORM = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["class_session_id", "images"],
+                    "properties": {
+                        "class_session_id": {"type": "string"},
+                        "school_fallback": {"type": "boolean"},
+                        "images": {"type": "array", "items": {"type": "string", "format": "binary"}},
+                    },
+                }
+            }
+        },
+    }
+}
+
+_TAKE_ATTENDANCE_VIDEO_FORM = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["class_session_id", "video"],
+                    "properties": {
+                        "class_session_id": {"type": "string"},
+                        "school_fallback": {"type": "boolean"},
+                        "video": {"type": "string", "format": "binary"},
+                    },
+                }
+            }
+        },
+    }
+}
+
+_TRUE_VALUES = {"true", "1", "yes", "on"}
+_FALSE_VALUES = {"false", "0", "no", "off"}
+
+
+def _parse_bool(name: str, value: str) -> bool:
+    value = value.strip().lower()
+    if value in _TRUE_VALUES:
+        return True
+    if value in _FALSE_VALUES:
+        return False
+    raise HTTPException(status_code=422, detail=f"{name} must be a boolean")
+
+
+async def _read_take_attendance_form(request: Request) -> tuple[str, bool | None, AsyncIterator[bytes], dict]:
+    """
+    Stream a take-attendance form: read the text fields up to the first
+    image, then hand the images over as they arrive.
+
+    Returns:
+        (class_session_id, school_fallback, async iterator of image bytes,
+        counter dict whose "images" entry counts the images yielded so far)
+    """
+    parts = iter_form_parts(request, MAX_UPLOAD_SIZE)
+    fields = {}
+    first_image = None
+
+    # Read the text fields up to the first image; images cannot be charged
+    # to a budget before class_session_id is known
+    async for name, filename, data in parts:
+        if filename is None:
+            fields[name] = data.decode("utf-8", "replace")
+        elif name == "images":
+            if "class_session_id" not in fields:
+                raise HTTPException(status_code=400, detail="class_session_id must be sent before the images.")
+            first_image = data
+            break
+
+    class_session_id = fields.get("class_session_id")
+    if class_session_id is None:
+        raise HTTPException(status_code=422, detail="class_session_id is required.")
+    school_fallback = None
+    if "school_fallback" in fields:
+        school_fallback = _parse_bool("school_fallback", fields["school_fallback"])
+
+    counter = {"images": 0}
+
+    async def images():
+        nonlocal first_image
+        if first_image is not None:
+            counter["images"] += 1
+            data, first_image = first_image, None
+            yield data
+
+        async for name, filename, data in parts:
+            if filename is None and name == "school_fallback" and counter["images"] > 0:
+                raise HTTPException(status_code=400, detail="school_fallback must be sent before the images.")
+            if filename is not None and name == "images":
+                counter["images"] += 1
+                yield data
+
+    return class_session_id, school_fallback, images(), counter
+
+
+@router.post("/take-attendance", openapi_extra=_TAKE_ATTENDANCE_FORM)
 async def take_attendance(
-    class_session_id: str = Form(...),
-    images: List[UploadFile] = File(...),
+    request: Request,
+    job: bool = False,
     user = Depends(get_current_user)
 ):
     """
     Upload multiple group photos → recognize → mark attendance.
+    Faces are matched against the session's class roster; set school_fallback
+    to retry unmatched faces against every enrolled student.
+
+    The body is streamed: every image is size-checked while it arrives (413
+    above MAX_UPLOAD_SIZE) and recognized as soon as it is complete. Send
+    class_session_id and school_fallback (in either order) before the images;
+    an image sent ahead of class_session_id, or a school_fallback sent after
+    an image, is rejected with 400.
+
+    With ?job=true the photos are stored and queued instead: the response is
+    202 with the job id, to be polled at GET /recognition/jobs/{job_id}. An
+    identical re-submission for the same session returns the existing job.
     """
+    class_session_id, school_fallback, images, counter = await _read_take_attendance_form(request)
 
-    if len(images) == 0:
-        raise HTTPException(status_code=400, detail="At least one image is required.")
+    if job:
+        try:
+            submitted = await submit_recognition_job(
+                images,
+                class_session_id,
+                school_fallback,
+                submitted_by=user["user_id"]
+            )
+        except HTTPException:
+            raise
+        except SessionNotFound as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Could not queue recognition job: {str(e)}")
 
-    image_bytes_list = [await img.read() for img in images]
+        if submitted is None:
+            raise HTTPException(status_code=400, detail="At least one image is required.")
+        job_view, coalesced = submitted
+        return JSONResponse(status_code=202, content=jsonable_encoder({"job": job_view, "coalesced": coalesced}))
 
     try:
-        result = await recognize_multiple_images(image_bytes_list)
+        result = await recognize_multiple_images(
+            images,
+            class_session_id=class_session_id,
+            school_fallback=school_fallback
+        )
+    except HTTPException:
+        raise
+    except SessionNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Recognition failed: {str(e)}")
 
+    if counter["images"] == 0:
+        raise HTTPException(status_code=400, detail="At least one image is required.")
+
     # Extract detected student IDs from result
     detected_ids = result["detected_students"]
 
@@ -42,5 +190,92 @@ async def take_attendance(
         "detected_students": detected_ids,
         "all_detections": result["all_detections"],
         "vote_counts": result["vote_counts"],
+        "quality_skips": result["quality_skips"],
+        "duplicate_frames": result["duplicate_frames"],
+        "duplicate_frames_skipped": result["duplicate_frames_skipped"],
+        "attendance_summary": attendance_result
+    }
+
+
+@router.post("/take-attendance-video", openapi_extra=_TAKE_ATTENDANCE_VIDEO_FORM)
+async def take_attendance_video(
+    request: Request,
+    user = Depends(get_current_user)
+):
+    """
+    Upload a short classroom video (e.g. a pan across the room) → recognize → mark attendance.
+    Faces are tracked across frames and each track is recognized once from
+    its best crops. The video is spooled to a temporary file while it
+    arrives (413 above VIDEO_MAX_UPLOAD_SIZE).
+    """
+    fields = {}
+    videos = []
+    try:
+        async for name, filename, content in iter_form_parts(
+            request,
+            VIDEO_MAX_UPLOAD_SIZE,
+            file_factory=lambda: tempfile.NamedTemporaryFile(dir=VIDEO_TEMP_DIR)
+        ):
+            if filename is None:
+                fields[name] = content.decode("utf-8", "replace")
+            elif name == "video" and not videos:
+                videos.append(content)
+            else:
+                content.close()
+
+        class_session_id = fields.get("class_session_id")
+        if class_session_id is None:
+            raise HTTPException(status_code=422, detail="class_session_id is required.")
+        if not videos:
+            raise HTTPException(status_code=400, detail="A video file is required.")
+        school_fallback = None
+        if "school_fallback" in fields:
+            school_fallback = _parse_bool("school_fallback", fields["school_fallback"])
+
+        try:
+            result = await recognize_video(videos[0].name, class_session_id=class_session_id, school_fallback=school_fallback)
+        except SessionNotFound as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Recognition failed: {str(e)}")
+    finally:
+        for video in videos:
+            video.close()
+
+    if result is None:
+        raise HTTPException(status_code=400, detail="Could not read the video.")
+
+    detected_ids = result["detected_students"]
+
+    try:
+        attendance_result = await mark_attendance_from_recognition(
+            class_session_id,
+            detected_ids
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Attendance update failed: {str(e)}")
+
+    return {
+        "detected_students": detected_ids,
+        "all_detections": result["all_detections"],
+        "vote_counts": result["vote_counts"],
+        "quality_skips": result["quality_skips"],
+        "video": result["video"],
         "attendance_summary": attendance_result
     }
+
+
+@router.get("/jobs/{job_id}")
+async def get_recognition_job(job_id: str, user = Depends(get_current_user)):
+    """Status and per-image progress of a queued take-attendance job"""
+    job = await get_recognition_job_service(job_id)
+    # Teachers only see their own jobs; hide the others as not found
+    if job is None or (user["role"] != "admin" and job["submitted_by"] != user["user_id"]):
+        raise HTTPException(status_code=404, detail="Recognition job not found")
+    return job
+
+
+@router.get("/stats", dependencies=[Depends(AdminOnly)])
+async def recognition_stats():
+    """Recognition pipeline metrics - Admin only"""
+    return get_recognition_stats()
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from app.services.embedding_service import generate_embedding_from_image
+from app.services.embedding_service import generate_enrollment_embeddings
 from app.services.student_embedding_service import add_student_embedding_service
 from app.utils.rbac import AdminOnly
 
@@ -11,11 +11,11 @@ async def upload_embedding(student_id: str, file: UploadFile = File(...)):
     """Upload student face embedding - Admin only"""
     image_bytes = await file.read()
 
-    embedding = generate_embedding_from_image(image_bytes)
+    embedding, light_embedding = await generate_enrollment_embeddings(image_bytes)
     if embedding is None:
         raise HTTPException(status_code=400, detail="No face detected in the image")
 
-    result = await add_student_embedding_service(student_id, embedding)
+    result = await add_student_embedding_service(student_id, embedding, light_embedding)
     if not result:
         raise HTTPException(
             status_code=404,
@@ -8,6 +8,10 @@ students_collection = db["students"]
 recognition_logs_collection = db["recognition_logs"]
 
 
+class SessionNotFound(ValueError):
+    """class_session_id is malformed or names no class session."""
+
+
 async def mark_attendance_service(student_id: str, status: str):
     """
     Manual attendance marking.
@@ -34,22 +38,35 @@ async def mark_attendance_service(student_id: str, status: str):
     }
 
 
-async def mark_attendance_from_recognition(class_session_id: str, detected_student_ids: list):
+async def get_session_roster(class_session_id: str) -> tuple[str, list[str]]:
     """
-    Marks all class students present/absent based on recognition result.
+    Resolve class_session_id -> class_id -> enrolled student ids.
+
+    Raises:
+        SessionNotFound: Invalid or unknown class_session_id
     """
 
     if not ObjectId.is_valid(class_session_id):
-        raise ValueError("Invalid class_session_id")
+        raise SessionNotFound("Invalid class_session_id")
 
     session = await class_sessions_collection.find_one({"_id": ObjectId(class_session_id)})
     if not session:
-        raise ValueError("Class session not found")
+        raise SessionNotFound("Class session not found")
 
     class_id = session["class_id"]
 
-    students_cursor = students_collection.find({"class_id": class_id})
-    all_students = [str(s["_id"]) async for s in students_cursor]
+    students_cursor = students_collection.find({"class_id": class_id}, {"_id": 1})
+    student_ids = [str(s["_id"]) async for s in students_cursor]
+
+    return class_id, student_ids
+
+
+async def mark_attendance_from_recognition(class_session_id: str, detected_student_ids: list):
+    """
+    Marks all class students present/absent based on recognition result.
+    """
+
+    class_id, all_students = await get_session_roster(class_session_id)
 
     present = []
     absent = []
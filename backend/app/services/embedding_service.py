@@ -6,21 +6,29 @@ import cv2
 import numpy as np
 from app.services.face_recognition import (
     detect_single_face,
-    extract_embedding
+    extract_embedding,
+    run_inference
 )
+from app.services.face_recognition.cascade import cascade_enabled, extract_light_embeddings
 
 
-def generate_embedding_from_image(image_bytes: bytes) -> list[float] | None:
+async def generate_enrollment_embeddings(image_bytes: bytes) -> tuple[list[float] | None, list[float] | None]:
     """
-    Generate face embedding from uploaded student photo.
-    Used during student enrollment by admin.
+    Generate the ArcFace embedding and, when the recognition cascade is
+    enabled, the light-model embedding from one student photo.
     
     Args:
         image_bytes: Image file bytes
         
     Returns:
-        512-dim embedding vector or None if no face detected
+        (embedding, light_embedding) - embedding is None if no face detected,
+        light_embedding is None when the cascade is disabled
     """
+    return await run_inference(_generate_enrollment_embeddings_sync, image_bytes)
+
+
+def _detect_enrollment_face(image_bytes: bytes) -> np.ndarray | None:
+    """Decode a student photo and crop its face (None if no face)."""
     # Decode image
     arr = np.frombuffer(image_bytes, np.uint8)
     img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
@@ -29,10 +37,18 @@ def generate_embedding_from_image(image_bytes: bytes) -> list[float] | None:
         return None
     
     # Detect single face
-    face_crop = detect_single_face(img)
+    return detect_single_face(img)
+
+
+def _generate_enrollment_embeddings_sync(image_bytes: bytes) -> tuple[list[float] | None, list[float] | None]:
+    """
+    Decode, detect and embed a student photo (blocking).
+    One detection serves both the ArcFace and the light model.
+    """
+    face_crop = _detect_enrollment_face(image_bytes)
     if face_crop is None:
-        return None
+        return None, None
     
-    # Extract embedding
     embedding = extract_embedding(face_crop)
-    return embedding
\ No newline at end of file
+    light_embedding = extract_light_embeddings([face_crop])[0] if cascade_enabled() else None
+    return embedding, light_embedding
\ No newline at end of file
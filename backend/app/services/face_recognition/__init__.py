@@ -7,8 +7,12 @@ Modular face detection and recognition system using YOLO and ArcFace.
 Public API:
 - detect_single_face: Detect one face in an image
 - detect_multiple_faces: Detect multiple faces in an image
+- detect_multiple_faces_batch: Detect faces in several images with one YOLO run
 - extract_embedding: Extract embedding from a single face
 - extract_embeddings_batch: Batch extract embeddings from multiple faces
+- FaceGallery: In-memory embedding matrix for vectorized matching
+- run_inference: Await blocking recognition work on the inference executor
+- get_embedding_batcher: Cross-request micro-batcher for ArcFace embeddings
 
 Usage:
     from app.services.face_recognition import detect_multiple_faces, extract_embeddings_batch
@@ -21,14 +25,21 @@ Usage:
     embeddings = extract_embeddings_batch(face_crops)
 """
 
-from .yolo_detector import detect_single_face, detect_multiple_faces
+from .yolo_detector import detect_single_face, detect_multiple_faces, detect_multiple_faces_batch
 from .arcface_embedder import extract_embedding, extract_embeddings_batch
+from .gallery import FaceGallery
+from .executor import run_inference
+from .batcher import get_embedding_batcher
 
 __all__ = [
     "detect_single_face",
     "detect_multiple_faces",
+    "detect_multiple_faces_batch",
     "extract_embedding",
     "extract_embeddings_batch",
+    "FaceGallery",
+    "run_inference",
+    "get_embedding_batcher",
 ]
 
 __version__ = "1.0.0"
@@ -0,0 +1,169 @@
+"""
+Approximate nearest-neighbour search for large face galleries.
+Implements an IVF-flat index (spherical k-means + inverted lists) in NumPy.
+"""
+import os
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class IVFFlatIndex:
+    """
+    Inverted-file index over L2-normalised embeddings.
+
+    Embeddings are partitioned into `nlist` clusters by spherical k-means.
+    A query only scores the rows of its `nprobe` closest clusters, so
+    `nprobe` is the recall/latency knob: nprobe == nlist is exact search.
+
+    The index stores centroids and a per-row cluster assignment; the vectors
+    themselves stay in the owning FaceGallery matrix.
+    """
+
+    def __init__(self, nlist: int, nprobe: int = 16, min_size: int = 20000):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_size = min_size
+        self.centroids = None
+        self.trained_size = 0
+        self._lists_cache = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def is_active(self, gallery_size: int) -> bool:
+        """Use the index only for galleries large enough to benefit from it."""
+        return self.is_trained and gallery_size >= self.min_size
+
+    def train(self, matrix: np.ndarray, iterations: int = 10, max_samples_per_list: int = 64, seed: int = 0):
+        """
+        Learn cluster centroids with spherical k-means.
+
+        Args:
+            matrix: L2-normalised embeddings of shape (N, D)
+            iterations: Number of k-means iterations
+            max_samples_per_list: Training sample cap per cluster
+            seed: RNG seed for reproducible centroids
+        """
+        rng = np.random.default_rng(seed)
+        nlist = min(self.nlist, len(matrix))
+        if nlist == 0:
+            raise ValueError("Cannot train IVF index on an empty gallery")
+
+        sample_size = min(len(matrix), nlist * max_samples_per_list)
+        sample = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+
+            # Re-seed empty clusters with random sample points
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms < 1e-6] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+
+        self.nlist = nlist
+        self.centroids = np.ascontiguousarray(centroids)
+        self.trained_size = len(matrix)
+        self._lists_cache = None
+        logger.info(f"Trained IVF index: {nlist} lists on {sample_size} of {len(matrix)} embeddings")
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Return the closest cluster for each L2-normalised vector."""
+        if len(vectors) == 0:
+            return np.empty(0, dtype=np.int32)
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _inverted_lists(self, assignments: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Row order grouped by cluster plus per-cluster offsets, cached per assignment array."""
+        cache = self._lists_cache
+        if cache is not None and cache[0] is assignments:
+            return cache[1], cache[2]
+
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.searchsorted(assignments[order], np.arange(self.nlist + 1))
+        self._lists_cache = (assignments, order, offsets)
+        return order, offsets
+
+    def search(self, queries: np.ndarray, matrix: np.ndarray, assignments: np.ndarray,
+               nprobe: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate best row for each query.
+
+        Args:
+            queries: L2-normalised queries of shape (Q, D)
+            matrix: Gallery matrix of shape (N, D)
+            assignments: Cluster of each gallery row, shape (N,)
+            nprobe: Clusters to scan per query (index default if None)
+
+        Returns:
+            (best_rows, best_scores) - best_rows is -1 when no candidate was scanned
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        order, offsets = self._inverted_lists(assignments)
+
+        centroid_scores = queries @ self.centroids.T
+        if nprobe < self.nlist:
+            probes = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probes = np.broadcast_to(np.arange(self.nlist), (len(queries), self.nlist))
+
+        best_rows = np.full(len(queries), -1, dtype=np.int64)
+        best_scores = np.zeros(len(queries), dtype=np.float32)
+
+        for qi, query in enumerate(queries):
+            rows = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probes[qi]])
+            if len(rows) == 0:
+                continue
+            scores = matrix[rows] @ query
+            best = int(np.argmax(scores))
+            best_rows[qi] = rows[best]
+            best_scores[qi] = scores[best]
+
+        return best_rows, best_scores
+
+    def save(self, path: str):
+        """Persist trained centroids to disk."""
+        if not self.is_trained:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, trained_size=self.trained_size)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str, dim: int) -> bool:
+        """
+        Load persisted centroids.
+
+        Returns:
+            True if a compatible index was loaded
+        """
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as data:
+                centroids = data["centroids"].astype(np.float32)
+                trained_size = int(data["trained_size"])
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable IVF index at {path}: {e}")
+            return False
+
+        if centroids.ndim != 2 or centroids.shape[1] != dim:
+            logger.warning(f"Ignoring IVF index with incompatible shape {centroids.shape}")
+            return False
+
+        self.centroids = np.ascontiguousarray(centroids)
+        self.nlist = len(centroids)
+        self.trained_size = trained_size
+        self._lists_cache = None
+        logger.info(f"Loaded IVF index from {path}: {self.nlist} lists")
+        return True
@@ -4,7 +4,7 @@ Handles single and batch face embedding generation.
 """
 import numpy as np
 import logging
-from .models import get_arcface_session, get_arcface_input_name
+from .models import get_arcface_pool, get_arcface_input_name
 from .preprocessors import preprocess_for_arcface, preprocess_for_arcface_batch
 
 logger = logging.getLogger(__name__)
@@ -30,9 +30,8 @@ def extract_embedding(face_img: np.ndarray) -> list[float]:
 
     preprocessed = preprocess_for_arcface(face_img)
 
-    arcface_session = get_arcface_session()
     input_name = get_arcface_input_name()
-    embedding = arcface_session.run(None, {input_name: preprocessed})[0]
+    embedding = get_arcface_pool().run(None, {input_name: preprocessed})[0]
 
     # L2 normalization with zero-norm guard
     embedding = embedding.flatten()
@@ -72,10 +71,9 @@ def extract_embeddings_batch(face_imgs: list[np.ndarray]) -> list[list[float]]:
     # Batch preprocess all faces
     preprocessed_batch = preprocess_for_arcface_batch(face_imgs)
 
-    # Run batch inference
-    arcface_session = get_arcface_session()
+    # Run batch inference on a pooled session
     input_name = get_arcface_input_name()
-    embeddings_batch = arcface_session.run(None, {input_name: preprocessed_batch})[0]
+    embeddings_batch = get_arcface_pool().run(None, {input_name: preprocessed_batch})[0]
 
     # L2 normalize each embedding
     normalized_embeddings = []
@@ -0,0 +1,186 @@
+"""
+ONNX Runtime thread auto-tuning.
+Benchmarks intra/inter-op thread combinations on a synthetic input and caches
+the fastest choice on disk, so later starts skip the sweep.
+"""
+import os
+import json
+import time
+import hashlib
+import platform
+import threading
+import numpy as np
+import onnxruntime as ort
+import logging
+from app.utils.config import ORT_AUTOTUNE_CACHE_PATH, ORT_AUTOTUNE_DURATION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_cache_lock = threading.Lock()
+_cpu_signature = None
+
+
+def file_digest(path: str) -> str:
+    """Short SHA-256 of a file, used to key caches by model contents."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()[:16]
+
+
+def cpu_signature() -> str:
+    """
+    Short hash of the CPU architecture, model and instruction-set flags.
+    Tuning results and "all"-level optimised graphs are only valid on a CPU
+    with the same features (AVX-512, VNNI, ... change the chosen kernels).
+    """
+    global _cpu_signature
+    if _cpu_signature is None:
+        parts = [platform.machine(), platform.processor()]
+        try:
+            with open("/proc/cpuinfo") as f:
+                for line in f:
+                    name, _, value = line.partition(":")
+                    if name.strip() in ("model name", "flags", "Features"):
+                        parts.append(value.strip())
+                    elif not line.strip() and len(parts) > 2:
+                        break  # the first processor describes them all
+        except OSError:
+            pass
+        _cpu_signature = hashlib.sha256("|".join(parts).encode()).hexdigest()[:12]
+    return _cpu_signature
+
+
+def _synthetic_feed(session: ort.InferenceSession, batch_size: int) -> dict:
+    """Random input of the model's real shape; symbolic dims become batch_size."""
+    input_meta = session.get_inputs()[0]
+    shape = [dim if isinstance(dim, int) and dim > 0 else batch_size for dim in input_meta.shape]
+    return {input_meta.name: np.random.default_rng(0).random(shape, dtype=np.float32)}
+
+
+def _thread_candidates(concurrency: int, execution_mode: str) -> list[tuple[int, int]]:
+    """Intra-op thread counts (powers of two up to the per-session core share) x inter-op."""
+    cpu_count = os.cpu_count() or 1
+    max_intra = max(1, cpu_count // max(1, concurrency))
+
+    intra_options = []
+    threads = 1
+    while threads < max_intra:
+        intra_options.append(threads)
+        threads *= 2
+    intra_options.append(max_intra)
+
+    inter_options = [1, 2] if execution_mode == "parallel" else [1]
+    return [(intra, inter) for intra in intra_options for inter in inter_options]
+
+
+def _measure_throughput(sessions: list[ort.InferenceSession], feed: dict, duration: float) -> float:
+    """
+    Inferences per second with one thread per session, the way the session
+    pool runs them in production.
+    """
+    for session in sessions:
+        session.run(None, feed)  # first-run allocations are not representative
+
+    runs = [0] * len(sessions)
+    deadline = time.perf_counter() + duration
+
+    def worker(slot: int):
+        session = sessions[slot]
+        while time.perf_counter() < deadline:
+            session.run(None, feed)
+            runs[slot] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(sessions))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(runs) / (time.perf_counter() - started)
+
+
+def _load_cache() -> dict:
+    if not os.path.exists(ORT_AUTOTUNE_CACHE_PATH):
+        return {}
+    try:
+        with open(ORT_AUTOTUNE_CACHE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable tuning cache {ORT_AUTOTUNE_CACHE_PATH}: {e}")
+        return {}
+
+
+def _save_cache(cache: dict):
+    os.makedirs(os.path.dirname(ORT_AUTOTUNE_CACHE_PATH) or ".", exist_ok=True)
+    tmp_path = f"{ORT_AUTOTUNE_CACHE_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, ORT_AUTOTUNE_CACHE_PATH)
+
+
+def autotune_threads(
+    model_path: str,
+    build_options,
+    concurrency: int,
+    execution_mode: str,
+    batch_size: int = 1
+) -> tuple[int, int]:
+    """
+    Pick intra/inter-op thread counts with the best throughput for the
+    expected number of concurrent inferences.
+
+    Args:
+        model_path: ONNX model to benchmark
+        build_options: Callable (intra, inter) -> ort.SessionOptions
+        concurrency: Expected concurrent inferences (usually the pool size)
+        execution_mode: "sequential" or "parallel" (parallel also sweeps inter-op)
+        batch_size: Batch size of the synthetic input
+
+    Returns:
+        (intra_op_threads, inter_op_threads)
+    """
+    key = "|".join([
+        file_digest(model_path),
+        ort.__version__,
+        platform.machine(),
+        f"cpu={cpu_signature()}",
+        f"cpus={os.cpu_count()}",
+        f"concurrency={concurrency}",
+        f"mode={execution_mode}",
+        f"batch={batch_size}",
+    ])
+
+    with _cache_lock:
+        cached = _load_cache().get(key)
+    if cached:
+        logger.info(f"Using cached thread tuning for {os.path.basename(model_path)}: {cached['intra_op_threads']} intra / {cached['inter_op_threads']} inter")
+        return cached["intra_op_threads"], cached["inter_op_threads"]
+
+    logger.info(f"Auto-tuning ORT threads for {os.path.basename(model_path)} at concurrency {concurrency}")
+    results = []
+    for intra, inter in _thread_candidates(concurrency, execution_mode):
+        # Each pooled session owns its thread pools, so benchmark that many sessions
+        sessions = [
+            ort.InferenceSession(
+                model_path,
+                sess_options=build_options(intra, inter),
+                providers=["CPUExecutionProvider"]
+            )
+            for _ in range(max(1, concurrency))
+        ]
+        feed = _synthetic_feed(sessions[0], batch_size)
+        throughput = _measure_throughput(sessions, feed, ORT_AUTOTUNE_DURATION_SECONDS)
+        results.append({"intra_op_threads": intra, "inter_op_threads": inter, "throughput": throughput})
+        logger.info(f"  intra={intra} inter={inter}: {throughput:.1f} inferences/s")
+        del sessions
+
+    best = max(results, key=lambda r: r["throughput"])
+    with _cache_lock:
+        cache = _load_cache()
+        cache[key] = {**best, "sweep": results}
+        _save_cache(cache)
+
+    logger.info(f"Selected {best['intra_op_threads']} intra / {best['inter_op_threads']} inter threads")
+    return best["intra_op_threads"], best["inter_op_threads"]
@@ -0,0 +1,233 @@
+"""
+Cross-request dynamic micro-batching for ArcFace embeddings.
+Concurrent requests share one ONNX run instead of paying dispatch overhead each.
+"""
+import asyncio
+import time
+import logging
+import numpy as np
+from app.utils.config import (
+    EMBED_BATCH_MAX_SIZE,
+    EMBED_BATCH_MAX_WAIT_MS,
+    ARCFACE_SESSION_POOL_SIZE,
+    INFERENCE_PROCESS_WORKERS
+)
+from .arcface_embedder import extract_embedding, extract_embeddings_batch
+from .executor import run_in_stage
+from .process_backend import process_backend_enabled, embed_faces_in_workers
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the batch-size histogram buckets
+_BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def extract_embeddings_with_fallback(face_imgs: list[np.ndarray]) -> list[list[float] | None]:
+    """
+    Batch extract embeddings, retrying one by one if the batch fails.
+
+    Returns:
+        One embedding per face, None for faces that could not be embedded
+    """
+    try:
+        return extract_embeddings_batch(face_imgs)
+    except ValueError as e:
+        # Fallback to single extraction if batch fails
+        logger.warning(f"Batch embedding extraction failed: {e}, falling back to single mode")
+        embeddings = []
+        for face_img in face_imgs:
+            try:
+                embeddings.append(extract_embedding(face_img))
+            except ValueError:
+                embeddings.append(None)
+        return embeddings
+
+
+class EmbeddingBatcher:
+    """
+    Async queue in front of the ArcFace session.
+
+    Callers submit their face crops and await a future. A background task
+    collects pending submissions until `max_batch_size` crops are queued or
+    the oldest one has waited `max_wait_ms`, runs one batched inference on
+    its own executor, and scatters the embeddings back to the callers.
+    Up to `concurrency` batches run at once - one per ArcFace session (or
+    inference process) - and submissions larger than `max_batch_size` are
+    split across batches.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = EMBED_BATCH_MAX_SIZE,
+        max_wait_ms: float = EMBED_BATCH_MAX_WAIT_MS,
+        concurrency: int | None = None
+    ):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        if concurrency is None:
+            concurrency = INFERENCE_PROCESS_WORKERS if process_backend_enabled() else ARCFACE_SESSION_POOL_SIZE
+        self.concurrency = max(1, concurrency)
+        self._queue = None
+        self._worker = None
+        self._slots = None
+        self._in_flight = set()
+        # Submission that did not fit in the previous batch
+        self._carry = None
+
+        # Metrics
+        self._batches = 0
+        self._crops = 0
+        self._requests = 0
+        self._size_histogram = {bucket: 0 for bucket in _BATCH_SIZE_BUCKETS}
+        self._size_histogram["inf"] = 0
+        self._queue_latency_total = 0.0
+        self._queue_latency_max = 0.0
+        self._inference_time_total = 0.0
+
+    def _ensure_worker(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.concurrency)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def embed(self, face_imgs: list[np.ndarray]) -> list[list[float] | None]:
+        """
+        Embed face crops, batched together with concurrent callers.
+
+        Args:
+            face_imgs: List of face crops in BGR format
+
+        Returns:
+            One normalized embedding per crop (None if it could not be embedded)
+        """
+        if len(face_imgs) == 0:
+            return []
+
+        self._ensure_worker()
+        loop = asyncio.get_running_loop()
+        enqueued = time.perf_counter()
+
+        # Oversized submissions (e.g. every track of a video) become several batches
+        futures = []
+        for start in range(0, len(face_imgs), self.max_batch_size):
+            future = loop.create_future()
+            await self._queue.put((face_imgs[start:start + self.max_batch_size], future, enqueued))
+            futures.append(future)
+
+        embeddings = []
+        for chunk in await asyncio.gather(*futures):
+            embeddings.extend(chunk)
+        return embeddings
+
+    async def _collect(self) -> list[tuple]:
+        """Wait for one submission, then gather more until size or time limit."""
+        if self._carry is not None:
+            first, self._carry = self._carry, None
+        else:
+            first = await self._queue.get()
+        pending = [first]
+        total = len(first[0])
+        deadline = first[2] + self.max_wait
+
+        while total < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                if timeout <= 0:
+                    item = self._queue.get_nowait()
+                else:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if total + len(item[0]) > self.max_batch_size:
+                # Keep batches bounded: this one opens the next batch
+                self._carry = item
+                break
+            pending.append(item)
+            total += len(item[0])
+
+        return pending
+
+    async def _run(self):
+        while True:
+            # OPTIMIZATION: Keep collecting while earlier batches are still running,
+            # so every ArcFace session stays busy
+            await self._slots.acquire()
+            try:
+                pending = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._dispatch(pending))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch(self, pending: list[tuple]):
+        """Run one batch and resolve its callers' futures; frees a slot when done."""
+        try:
+            started = time.perf_counter()
+            crops = [crop for face_imgs, _, _ in pending for crop in face_imgs]
+            self._record_batch(pending, started)
+
+            try:
+                embed = embed_faces_in_workers if process_backend_enabled() else extract_embeddings_with_fallback
+                embeddings = await run_in_stage("arcface", self.concurrency, embed, crops)
+            except Exception as e:
+                for _, future, _ in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            self._inference_time_total += time.perf_counter() - started
+
+            # Scatter results back to each caller in submission order
+            offset = 0
+            for face_imgs, future, _ in pending:
+                if not future.done():
+                    future.set_result(embeddings[offset:offset + len(face_imgs)])
+                offset += len(face_imgs)
+        finally:
+            self._slots.release()
+
+    def _record_batch(self, pending: list[tuple], started: float):
+        size = sum(len(face_imgs) for face_imgs, _, _ in pending)
+        self._batches += 1
+        self._crops += size
+        self._requests += len(pending)
+
+        bucket = next((b for b in _BATCH_SIZE_BUCKETS if size <= b), "inf")
+        self._size_histogram[bucket] += 1
+
+        for _, _, enqueued in pending:
+            latency = started - enqueued
+            self._queue_latency_total += latency
+            self._queue_latency_max = max(self._queue_latency_max, latency)
+
+    def stats(self) -> dict:
+        """Batch-size and queue-latency metrics since startup."""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "concurrency": self.concurrency,
+            "batches_in_flight": len(self._in_flight),
+            "batches": self._batches,
+            "requests": self._requests,
+            "crops": self._crops,
+            "avg_batch_size": self._crops / self._batches if self._batches else 0.0,
+            "avg_requests_per_batch": self._requests / self._batches if self._batches else 0.0,
+            "batch_size_histogram": {str(k): v for k, v in self._size_histogram.items()},
+            "avg_queue_latency_ms": 1000 * self._queue_latency_total / self._requests if self._requests else 0.0,
+            "max_queue_latency_ms": 1000 * self._queue_latency_max,
+            "avg_inference_ms": 1000 * self._inference_time_total / self._batches if self._batches else 0.0,
+        }
+
+
+_batcher = None
+
+
+def get_embedding_batcher() -> EmbeddingBatcher:
+    """Get the process-wide embedding batcher (singleton pattern)."""
+    global _batcher
+    if _batcher is None:
+        _batcher = EmbeddingBatcher()
+    return _batcher
@@ -0,0 +1,123 @@
+"""
+Two-stage recognition cascade.
+A lightweight embedder (e.g. MobileFaceNet) scores every detected face first;
+a face is accepted at stage 1 only when its light top-1 match is both strong
+and clearly ahead of the runner-up. Everything else goes on to ArcFace.
+"""
+import threading
+import numpy as np
+import logging
+from app.utils.config import CASCADE_ENABLED, CASCADE_ACCEPT_THRESHOLD, CASCADE_ACCEPT_MARGIN
+from .gallery import FaceGallery
+from .models import is_light_embedder_available, get_light_embedder_pool, get_light_embedder_input_name, get_light_embedder_input_size
+from .preprocessors import preprocess_for_arcface_batch
+
+logger = logging.getLogger(__name__)
+
+
+def cascade_enabled() -> bool:
+    """Whether stage 1 should run (enabled in config and model installed)."""
+    return CASCADE_ENABLED and is_light_embedder_available()
+
+
+def extract_light_embeddings(face_imgs: list[np.ndarray]) -> list[list[float] | None]:
+    """
+    Batch extract light-model embeddings (blocking).
+
+    Args:
+        face_imgs: List of face crops in BGR format
+
+    Returns:
+        One normalized embedding per crop, None for invalid crops
+    """
+    embeddings = [None] * len(face_imgs)
+    valid = [i for i, face_img in enumerate(face_imgs) if face_img is not None and face_img.size > 0]
+    if len(valid) == 0:
+        return embeddings
+
+    batch = preprocess_for_arcface_batch([face_imgs[i] for i in valid], get_light_embedder_input_size())
+    outputs = get_light_embedder_pool().run(None, {get_light_embedder_input_name(): batch})[0]
+    outputs = outputs.reshape(len(valid), -1)
+
+    norms = np.linalg.norm(outputs, axis=1)
+    for i, output, norm in zip(valid, outputs, norms):
+        if norm >= 1e-6:
+            embeddings[i] = (output / norm).tolist()
+    return embeddings
+
+
+def accept_light_matches(
+    light_gallery: FaceGallery,
+    embeddings: list[list[float] | None],
+    threshold: float = CASCADE_ACCEPT_THRESHOLD,
+    margin: float = CASCADE_ACCEPT_MARGIN
+) -> list[tuple[str, float] | None]:
+    """
+    Decide which faces are conclusively matched by the light model.
+
+    Args:
+        light_gallery: Gallery of light-model embeddings to search
+        embeddings: Light embeddings (None entries are never accepted)
+        threshold: Minimum light top-1 similarity
+        margin: Minimum gap between top-1 and the best other student
+
+    Returns:
+        (student_id, score) for accepted faces, None for faces that need ArcFace
+    """
+    decisions = [None] * len(embeddings)
+    valid = [i for i, embedding in enumerate(embeddings) if embedding is not None]
+    if len(valid) == 0 or len(light_gallery) == 0:
+        return decisions
+
+    best_ids, best_scores, second_scores = light_gallery.search_top2([embeddings[i] for i in valid])
+    for i, student_id, best, second in zip(valid, best_ids, best_scores, second_scores):
+        if best >= threshold and best - second >= margin:
+            decisions[i] = (student_id, float(best))
+    return decisions
+
+
+class CascadeStats:
+    """Per-stage hit counters of the cascade."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._faces = 0
+        self._stage1_accepted = 0
+        self._stage2_faces = 0
+        self._skipped_calls = 0
+
+    def record(self, faces: int, accepted: int):
+        """Record one cascade pass: `accepted` of `faces` settled at stage 1."""
+        with self._lock:
+            self._faces += faces
+            self._stage1_accepted += accepted
+            self._stage2_faces += faces - accepted
+
+    def record_skipped(self, faces: int):
+        """Record a pass that bypassed stage 1 (light gallery incomplete)."""
+        with self._lock:
+            self._skipped_calls += 1
+            self._faces += faces
+            self._stage2_faces += faces
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": cascade_enabled(),
+                "accept_threshold": CASCADE_ACCEPT_THRESHOLD,
+                "accept_margin": CASCADE_ACCEPT_MARGIN,
+                "faces": self._faces,
+                "stage1_accepted": self._stage1_accepted,
+                "stage2_faces": self._stage2_faces,
+                "stage1_hit_rate": self._stage1_accepted / self._faces if self._faces else 0.0,
+                "stage2_rate": self._stage2_faces / self._faces if self._faces else 0.0,
+                "stage1_skipped_calls": self._skipped_calls,
+            }
+
+
+_cascade_stats = CascadeStats()
+
+
+def get_cascade_stats() -> CascadeStats:
+    """Get the process-wide cascade counters."""
+    return _cascade_stats
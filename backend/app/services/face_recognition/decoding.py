@@ -0,0 +1,208 @@
+"""
+Upload decoding for recognition.
+Large JPEGs are decoded at 1/2, 1/4 or 1/8 scale (libjpeg scales during the
+IDCT, so the full-resolution bitmap is never allocated) and faces are
+detected on that. The scale is chosen from the header so that faces of
+EXPECTED_MIN_FACE_RATIO already come out at FACE_CROP_MIN_SIZE, which makes
+a second decode the exception: only faces smaller than expected are
+re-cropped from one finer decode, bounded by DECODE_MAX_PIXELS.
+"""
+import struct
+import cv2
+import numpy as np
+import logging
+from app.utils.config import (
+    DECODE_STRATEGY,
+    DECODE_DETECT_MIN_SIDE,
+    DECODE_MAX_PIXELS,
+    FACE_CROP_MIN_SIZE,
+    DETECTION_MODE,
+    EXPECTED_MIN_FACE_RATIO,
+    TILE_MIN_FACE_PX
+)
+
+logger = logging.getLogger(__name__)
+
+_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# JPEG start-of-frame markers (every SOFn except DHT, JPG and DAC)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def read_image_header(data: bytes) -> tuple[str, int, int] | None:
+    """
+    Read format and dimensions from a JPEG or PNG header without decoding.
+
+    Returns:
+        ("jpeg" | "png", width, height), or None for other/corrupt data
+    """
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        width, height = struct.unpack(">II", data[16:24])
+        return "png", width, height
+
+    if data[:2] != b"\xff\xd8":
+        return None
+
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker == 0xFF or marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Fill byte or stand-alone marker without a length field
+            i += 1 if marker == 0xFF else 2
+            continue
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        if marker in _JPEG_SOF_MARKERS and i + 9 <= len(data):
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return "jpeg", width, height
+        i += 2 + length
+    return None
+
+
+def _detection_factor(width: int, height: int) -> int:
+    """
+    Coarsest JPEG scale that keeps the long side >= DECODE_DETECT_MIN_SIDE,
+    when tiling the smallest expected face >= TILE_MIN_FACE_PX, and the
+    smallest expected face >= FACE_CROP_MIN_SIZE as long as the decode stays
+    within DECODE_MAX_PIXELS.
+    """
+    long_side = max(width, height)
+    smallest_face = EXPECTED_MIN_FACE_RATIO * long_side
+    factor = 1
+    for candidate in (2, 4, 8):
+        if long_side / candidate < DECODE_DETECT_MIN_SIDE:
+            break
+        if DETECTION_MODE != "full" and smallest_face / candidate < TILE_MIN_FACE_PX:
+            break
+        # OPTIMIZATION: A coarser decode would need a second, finer decode to
+        # crop the smallest expected faces; decoding once at this scale is cheaper
+        if smallest_face / candidate < FACE_CROP_MIN_SIZE and width * height / (factor * factor) <= DECODE_MAX_PIXELS:
+            break
+        factor = candidate
+    return factor
+
+
+def decode_for_detection(data: bytes) -> tuple[np.ndarray | None, int]:
+    """
+    Decode an upload at the coarsest scale still good for detection.
+
+    Args:
+        data: Encoded image bytes
+
+    Returns:
+        (BGR image or None if undecodable, scale factor of the decode)
+    """
+    arr = np.frombuffer(data, np.uint8)
+    header = read_image_header(data)
+
+    factor = 1
+    if DECODE_STRATEGY == "reduced" and header is not None and header[0] == "jpeg":
+        factor = _detection_factor(header[1], header[2])
+
+    image = cv2.imdecode(arr, _REDUCED_FLAGS[factor])
+    if image is None:
+        return None, factor
+
+    if factor > 1:
+        logger.info(f"Decoded {header[1]}x{header[2]} JPEG at 1/{factor} scale for detection")
+    return image, factor
+
+
+def estimate_decode_bytes(data: bytes, include_refine: bool = False) -> int:
+    """
+    Size of the bitmap decode_for_detection will allocate for an upload,
+    read from the header alone (0 if the format is not recognised).
+
+    Args:
+        data: Encoded image bytes
+        include_refine: Add the worst-case finer decode of refine_face_crops,
+            which is alive at the same time as the detection bitmap
+    """
+    header = read_image_header(data)
+    if header is None:
+        return 0
+
+    kind, width, height = header
+    factor = 1
+    if DECODE_STRATEGY == "reduced" and kind == "jpeg":
+        factor = _detection_factor(width, height)
+    nbytes = -(-width // factor) * -(-height // factor) * 3
+
+    if include_refine and factor > 1:
+        refined = _refine_factor(0, factor, width * height)
+        if refined < factor:
+            nbytes += -(-width // refined) * -(-height // refined) * 3
+    return nbytes
+
+
+def _refine_factor(smallest: int, factor: int, full_pixels: int) -> int:
+    """Decode scale that brings the smallest face to FACE_CROP_MIN_SIZE, within the pixel budget."""
+    refined = factor
+    for candidate in (4, 2, 1):
+        if candidate >= factor or full_pixels / (candidate * candidate) > DECODE_MAX_PIXELS:
+            continue
+        refined = candidate
+        if smallest * factor / candidate >= FACE_CROP_MIN_SIZE:
+            break
+    return refined
+
+
+def refine_face_crops(data: bytes, image: np.ndarray, factor: int, faces: list[tuple]) -> list[tuple]:
+    """
+    Map faces detected on a reduced decode back to full-resolution
+    coordinates, re-cropping them from a finer decode when they are smaller
+    than FACE_CROP_MIN_SIZE.
+
+    Args:
+        data: Encoded image bytes the reduced image came from
+        image: Reduced image faces were detected on
+        factor: Scale factor of that decode
+        faces: List of (x1, y1, x2, y2, confidence, face_crop[, landmarks]) in reduced coords
+
+    Returns:
+        Faces with boxes in full-resolution coords; refined crops are copies,
+        so the finer decode is released before returning
+    """
+    if factor == 1 or len(faces) == 0:
+        return faces
+
+    # Full size in the decoded (EXIF-rotated) orientation
+    reduced_h, reduced_w = image.shape[:2]
+    _, full_w, full_h = read_image_header(data)
+    if (reduced_w > reduced_h) != (full_w > full_h):
+        full_w, full_h = full_h, full_w
+
+    smallest = min(min(x2 - x1, y2 - y1) for x1, y1, x2, y2, *_ in faces)
+    refined_factor = factor
+    if smallest < FACE_CROP_MIN_SIZE:
+        refined_factor = _refine_factor(smallest, factor, full_w * full_h)
+
+    finer = None
+    if refined_factor < factor:
+        finer = cv2.imdecode(np.frombuffer(data, np.uint8), _REDUCED_FLAGS[refined_factor])
+        if finer is not None:
+            logger.info(f"Re-cropping {len(faces)} faces from a 1/{refined_factor} scale decode")
+
+    results = []
+    for x1, y1, x2, y2, conf, face_crop, *landmarks in faces:
+        full_box = (
+            min(x1 * factor, full_w), min(y1 * factor, full_h),
+            min(x2 * factor, full_w), min(y2 * factor, full_h)
+        )
+        if finer is not None:
+            fx1, fy1, fx2, fy2 = (v // refined_factor for v in full_box)
+            crop = finer[fy1:fy2, fx1:fx2]
+            if crop.size > 0:
+                face_crop = crop.copy()
+        # Landmarks, when present, scale like the box
+        landmarks = [None if points is None else points * factor for points in landmarks]
+        results.append((*full_box, conf, face_crop, *landmarks))
+
+    return results
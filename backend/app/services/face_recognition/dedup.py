@@ -0,0 +1,68 @@
+"""
+Near-duplicate frame detection for burst uploads.
+Each upload is reduced to a difference hash (dHash) of a tiny greyscale
+thumbnail, decoded at 1/8 scale so no full-resolution bitmap is needed.
+Frames whose hashes agree on at least DUPLICATE_FRAME_SIMILARITY of their
+bits are treated as copies of the first such frame.
+"""
+import cv2
+import numpy as np
+import logging
+from app.utils.config import DUPLICATE_FRAME_SIMILARITY, DUPLICATE_FRAME_HASH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def frame_signature(data: bytes, hash_size: int = DUPLICATE_FRAME_HASH_SIZE) -> tuple[bool, np.ndarray] | None:
+    """
+    Perceptual signature of an encoded image (blocking).
+
+    Args:
+        data: Encoded image bytes
+        hash_size: Hash is hash_size x hash_size bits
+
+    Returns:
+        (is_landscape, flat boolean dHash), or None if undecodable
+    """
+    gray = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if gray is None:
+        return None
+
+    # Each bit: is a pixel brighter than its right-hand neighbour
+    thumb = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = thumb[:, 1:] > thumb[:, :-1]
+    return gray.shape[1] >= gray.shape[0], bits.reshape(-1)
+
+
+class NearDuplicateIndex:
+    """
+    Incremental near-duplicate grouping for frames arriving one at a time.
+    Each frame is compared against the representatives seen so far (not
+    against other duplicates, so slow drift cannot chain groups together).
+
+    Args:
+        similarity: Minimum fraction of equal hash bits for two frames to count as duplicates
+    """
+
+    def __init__(self, similarity: float = DUPLICATE_FRAME_SIMILARITY):
+        self.similarity = similarity
+        self._kept = []  # (index, orientation, hash) of representative frames
+
+    def add(self, index: int, signature: tuple[bool, np.ndarray] | None) -> int:
+        """
+        Register frame `index` by its signature (see frame_signature).
+
+        Returns:
+            Index of the representative frame - `index` itself unless the
+            frame duplicates an earlier representative
+        """
+        if signature is None:
+            return index
+        landscape, bits = signature
+
+        for kept_index, kept_landscape, kept_bits in self._kept:
+            if kept_landscape == landscape and np.mean(kept_bits == bits) >= self.similarity:
+                return kept_index
+
+        self._kept.append((index, landscape, bits))
+        return index
@@ -0,0 +1,88 @@
+"""
+Dedicated executor for CPU-bound face recognition work.
+Keeps image decoding, ONNX inference and NMS off the asyncio event loop.
+"""
+import asyncio
+import functools
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.config import INFERENCE_EXECUTOR_WORKERS
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Dedicated pools of the recognition pipeline stages, by stage name
+_stage_executors = {}
+
+
+def get_inference_executor() -> ThreadPoolExecutor:
+    """
+    Lazily create the bounded inference thread pool.
+    ONNX Runtime and OpenCV release the GIL, so threads run inference in parallel.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=INFERENCE_EXECUTOR_WORKERS,
+                    thread_name_prefix="inference"
+                )
+                logger.info(f"Inference executor started with {INFERENCE_EXECUTOR_WORKERS} workers")
+    return _executor
+
+
+async def run_inference(fn, *args, **kwargs):
+    """
+    Run a blocking face recognition function on the inference executor.
+
+    Args:
+        fn: Synchronous callable (decode, detection, embedding, NMS, ...)
+        *args, **kwargs: Arguments forwarded to fn
+
+    Returns:
+        Whatever fn returns; exceptions propagate to the awaiting caller
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_inference_executor(), functools.partial(fn, *args, **kwargs))
+
+
+def get_stage_executor(name: str, workers: int) -> ThreadPoolExecutor:
+    """
+    Lazily create the thread pool of one pipeline stage, so a slow stage
+    cannot starve the others of threads.
+
+    Args:
+        name: Stage name (also the thread name prefix)
+        workers: Pool size, used when the pool is first created
+    """
+    executor = _stage_executors.get(name)
+    if executor is None:
+        with _executor_lock:
+            executor = _stage_executors.get(name)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=name)
+                _stage_executors[name] = executor
+                logger.info(f"Stage executor '{name}' started with {max(1, workers)} workers")
+    return executor
+
+
+async def run_in_stage(name: str, workers: int, fn, *args, **kwargs):
+    """Like run_inference, but on the named stage executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_stage_executor(name, workers), functools.partial(fn, *args, **kwargs))
+
+
+def shutdown_inference_executor(wait: bool = True):
+    """Stop the inference and stage executors (used on application shutdown)."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
+        for executor in _stage_executors.values():
+            executor.shutdown(wait=wait)
+        _stage_executors.clear()
@@ -0,0 +1,246 @@
+"""
+In-memory face gallery for vectorized matching.
+Holds all enrolled embeddings as one contiguous float32 matrix.
+"""
+import threading
+import numpy as np
+import logging
+from .ann_index import IVFFlatIndex
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 512
+
+
+def l2_normalize(embeddings: np.ndarray) -> np.ndarray:
+    """
+    L2-normalise embeddings row by row.
+
+    Args:
+        embeddings: Array of shape (N, D) or (D,)
+
+    Returns:
+        Contiguous float32 array of shape (N, D); zero-norm rows are left as zeros
+    """
+    matrix = np.ascontiguousarray(np.atleast_2d(embeddings), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms < 1e-6] = 1.0
+    return matrix / norms
+
+
+class FaceGallery:
+    """
+    Process-resident gallery of enrolled face embeddings.
+
+    Rows of `matrix` are L2-normalised, so cosine similarity against a batch
+    of query embeddings is a single matrix multiply. Updates are copy-on-write:
+    writers build new arrays and swap them in, so readers never need a lock.
+
+    An optional IVF index can be attached for very large galleries; below its
+    minimum size, or until it is trained, search stays exact.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self._write_lock = threading.Lock()
+        self._index: IVFFlatIndex | None = None
+        # (matrix, ids, IVF assignments, index the assignments belong to)
+        self._state = (np.empty((0, dim), dtype=np.float32), np.empty(0, dtype=object), None, None)
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self._state[1])
+
+    @property
+    def index(self) -> IVFFlatIndex | None:
+        return self._index
+
+    def snapshot(self) -> tuple[np.ndarray, np.ndarray]:
+        """Return a consistent (matrix, ids) pair."""
+        matrix, ids, _, _ = self._state
+        return matrix, ids
+
+    def _assign(self, rows: np.ndarray) -> np.ndarray | None:
+        if self._index is None or not self._index.is_trained:
+            return None
+        return self._index.assign(rows)
+
+    def _swap(self, matrix: np.ndarray, ids: np.ndarray, assignments: np.ndarray | None = None):
+        # Single attribute assignment keeps matrix, ids, IVF lists and the index
+        # that produced them consistent for readers
+        self._state = (matrix, ids, assignments, self._index if assignments is not None else None)
+        self.version += 1
+
+    def attach_index(self, index: IVFFlatIndex | None) -> None:
+        """
+        Attach (or detach with None) an ANN index and assign every row to it.
+
+        Args:
+            index: Trained IVFFlatIndex, or None for exact search only
+        """
+        with self._write_lock:
+            self._index = index
+            matrix, ids, _, _ = self._state
+            self._swap(matrix, ids, self._assign(matrix))
+
+    def load(self, student_ids: list[str], embeddings) -> None:
+        """
+        Replace the whole gallery contents.
+
+        Args:
+            student_ids: Owning student id for each embedding row
+            embeddings: Array-like of shape (N, D)
+        """
+        if len(student_ids) == 0:
+            matrix = np.empty((0, self.dim), dtype=np.float32)
+        else:
+            matrix = l2_normalize(np.asarray(embeddings, dtype=np.float32))
+        ids = np.asarray(student_ids, dtype=object)
+        with self._write_lock:
+            self.dim = matrix.shape[1]
+            self._swap(matrix, ids, self._assign(matrix))
+        logger.info(f"Gallery loaded with {len(ids)} embeddings")
+
+    def replace(self, student_id: str, embeddings) -> None:
+        """
+        Replace all rows owned by a student with new embedding(s).
+
+        Args:
+            student_id: Student id owning the embeddings
+            embeddings: One embedding (D,) or several (K, D)
+        """
+        new_rows = l2_normalize(np.asarray(embeddings, dtype=np.float32))
+        with self._write_lock:
+            old_matrix, old_ids, old_assignments, _ = self._state
+            if len(old_ids) == 0:
+                # An empty gallery adopts the dimension of its first embedding
+                self.dim = new_rows.shape[1]
+                old_matrix = np.empty((0, self.dim), dtype=np.float32)
+            keep = old_ids != student_id
+            matrix = np.concatenate([old_matrix[keep], new_rows])
+            ids = np.concatenate([old_ids[keep], np.full(len(new_rows), student_id, dtype=object)])
+
+            # Incremental IVF update: only the new rows need a cluster
+            assignments = None
+            if old_assignments is not None:
+                assignments = np.concatenate([old_assignments[keep], self._assign(new_rows)])
+
+            self._swap(np.ascontiguousarray(matrix), ids, assignments)
+
+    def remove(self, student_id: str) -> int:
+        """
+        Remove all rows owned by a student.
+
+        Returns:
+            Number of rows removed
+        """
+        with self._write_lock:
+            matrix, ids, assignments, _ = self._state
+            keep = ids != student_id
+            removed = int(len(keep) - keep.sum())
+            if removed:
+                if assignments is not None:
+                    assignments = assignments[keep]
+                self._swap(np.ascontiguousarray(matrix[keep]), ids[keep], assignments)
+        return removed
+
+    def subset(self, student_ids) -> "FaceGallery":
+        """
+        Build a smaller gallery restricted to the given students.
+
+        Args:
+            student_ids: Iterable of student ids to keep
+
+        Returns:
+            New FaceGallery sharing no state with this one
+        """
+        matrix, ids = self.snapshot()
+        wanted = set(student_ids)
+        mask = np.fromiter((sid in wanted for sid in ids), dtype=bool, count=len(ids))
+        sub = FaceGallery(self.dim)
+        sub._swap(np.ascontiguousarray(matrix[mask]), ids[mask])
+        return sub
+
+    def search(self, queries, nprobe: int | None = None) -> tuple[list[str | None], np.ndarray]:
+        """
+        Find the best gallery row for each query embedding.
+        Uses the attached IVF index when active, exact search otherwise.
+
+        Args:
+            queries: Array-like of shape (N, D)
+            nprobe: IVF clusters to scan per query (index default if None)
+
+        Returns:
+            (best_ids, best_scores) - ids are None when the gallery is empty
+        """
+        queries = l2_normalize(np.asarray(queries, dtype=np.float32))
+        matrix, ids, assignments, index = self._state
+
+        if len(ids) == 0:
+            return [None] * len(queries), np.zeros(len(queries), dtype=np.float32)
+
+        if assignments is not None and index.is_active(len(ids)):
+            best_rows, best_scores = index.search(queries, matrix, assignments, nprobe)
+            return [ids[row] if row >= 0 else None for row in best_rows], best_scores
+
+        scores = queries @ matrix.T
+        best_rows = np.argmax(scores, axis=1)
+        best_scores = scores[np.arange(len(queries)), best_rows]
+        return [ids[row] for row in best_rows], best_scores
+
+    def student_ids(self) -> set:
+        """Distinct student ids present in the gallery."""
+        return set(self._state[1])
+
+    def search_top2(self, queries) -> tuple[list[str | None], np.ndarray, np.ndarray]:
+        """
+        Exact top-1 match plus the best score of any *other* student.
+        The top-1/top-2 margin tells how conclusive a match is.
+
+        Args:
+            queries: Array-like of shape (N, D)
+
+        Returns:
+            (best_ids, best_scores, second_scores) - second score is -1 when
+            the gallery holds fewer than two students
+        """
+        queries = l2_normalize(np.asarray(queries, dtype=np.float32))
+        matrix, ids, _, _ = self._state
+
+        if len(ids) == 0:
+            empty = np.zeros(len(queries), dtype=np.float32)
+            return [None] * len(queries), empty, empty - 1.0
+
+        scores = queries @ matrix.T
+        _, codes = np.unique(ids.astype(str), return_inverse=True)
+        best_rows = np.argmax(scores, axis=1)
+        rows = np.arange(len(queries))
+        best_scores = scores[rows, best_rows]
+
+        # Mask every row of the winning student, then take the runner-up
+        same_student = codes[None, :] == codes[best_rows][:, None]
+        second_scores = np.where(same_student, -1.0, scores).max(axis=1)
+
+        return [ids[row] for row in best_rows], best_scores, second_scores
+
+    def match(self, queries, threshold: float, nprobe: int | None = None) -> list[tuple[str | None, float]]:
+        """
+        Match query embeddings against the gallery.
+
+        Args:
+            queries: Array-like of shape (N, D)
+            threshold: Minimum cosine similarity for a match
+            nprobe: IVF clusters to scan per query (index default if None)
+
+        Returns:
+            List of (student_id, score) - student_id is None below threshold
+        """
+        if len(queries) == 0:
+            return []
+
+        best_ids, best_scores = self.search(queries, nprobe)
+        results = []
+        for student_id, score in zip(best_ids, best_scores):
+            score = float(score)
+            results.append((student_id if score >= threshold else None, score))
+        return results
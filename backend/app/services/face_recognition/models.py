@@ -1,61 +1,395 @@
 """
 Model loading and caching for YOLO and ArcFace.
-Implements singleton pattern for efficient model reuse.
+Each model is served by a pool of ONNX Runtime sessions with checkout/return
+semantics, so several inferences run in parallel on their own thread budget.
+ORT-optimised models are serialized to disk so restarts skip graph optimisation.
 """
+import os
+import time
+import queue
+import platform
+import threading
 import onnxruntime as ort
 import logging
-from app.utils.config import YOLO_MODEL_PATH, ARCFACE_MODEL_PATH
+from contextlib import contextmanager
+from app.utils.config import (
+    YOLO_MODEL_PATH,
+    ARCFACE_MODEL_PATH,
+    YOLO_INT8_MODEL_PATH,
+    ARCFACE_INT8_MODEL_PATH,
+    YOLO_MODEL_VARIANT,
+    ARCFACE_MODEL_VARIANT,
+    YOLO_INPUT_SIZE,
+    LIGHT_EMBEDDER_MODEL_PATH,
+    LIGHT_EMBEDDER_POOL_SIZE,
+    YOLO_SESSION_POOL_SIZE,
+    ARCFACE_SESSION_POOL_SIZE,
+    SESSION_INTRA_OP_THREADS,
+    ORT_INTER_OP_THREADS,
+    ORT_GRAPH_OPTIMIZATION_LEVEL,
+    ORT_EXECUTION_MODE,
+    ORT_ENABLE_MEM_PATTERN,
+    ORT_AUTOTUNE,
+    ORT_AUTOTUNE_CONCURRENCY,
+    ORT_OPTIMIZED_MODEL_CACHE_DIR
+)
+from .autotune import autotune_threads, cpu_signature, file_digest
 
 logger = logging.getLogger(__name__)
 
+_GRAPH_OPTIMIZATION_LEVELS = {
+    "disabled": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+_EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+
+# ========== SESSION POOL ==========
+def resolve_model_path(fp32_path: str, int8_path: str, variant: str) -> str:
+    """Pick the model file for a configured variant ("fp32" or "int8")."""
+    if variant == "int8":
+        return int8_path
+    if variant != "fp32":
+        logger.warning(f"Unknown model variant '{variant}', using fp32")
+    return fp32_path
+
+
+def build_session_options(
+    intra_op_threads: int,
+    inter_op_threads: int = ORT_INTER_OP_THREADS,
+    optimization_level: str = ORT_GRAPH_OPTIMIZATION_LEVEL
+) -> ort.SessionOptions:
+    """
+    SessionOptions from app.utils.config.
+
+    Args:
+        intra_op_threads: Threads used inside one operator (0 = ORT default)
+        inter_op_threads: Threads across independent operators (parallel mode only)
+        optimization_level: Graph optimisation level name ("disabled" for pre-optimised models)
+    """
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    options.graph_optimization_level = _GRAPH_OPTIMIZATION_LEVELS.get(
+        optimization_level, ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    )
+    options.execution_mode = _EXECUTION_MODES.get(ORT_EXECUTION_MODE, ort.ExecutionMode.ORT_SEQUENTIAL)
+    options.enable_mem_pattern = ORT_ENABLE_MEM_PATTERN
+    return options
+
+
+def _create_session(
+    model_path: str,
+    intra_op_threads: int,
+    inter_op_threads: int = ORT_INTER_OP_THREADS,
+    optimization_level: str = ORT_GRAPH_OPTIMIZATION_LEVEL
+) -> ort.InferenceSession:
+    """Create one CPU inference session with its own thread budget."""
+    return ort.InferenceSession(
+        model_path,
+        sess_options=build_session_options(intra_op_threads, inter_op_threads, optimization_level),
+        providers=["CPUExecutionProvider"]
+    )
+
+
+def _optimized_model_path(model_path: str, digest: str) -> str:
+    """
+    Cache file for a model, keyed by model hash, ORT version, optimisation
+    level, CPU arch and CPU features ("all" bakes in hardware-specific kernels).
+    """
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    key = f"{digest}-ort{ort.__version__}-{ORT_GRAPH_OPTIMIZATION_LEVEL}-{platform.machine()}-{cpu_signature()}"
+    return os.path.join(ORT_OPTIMIZED_MODEL_CACHE_DIR, f"{stem}.{key}.onnx")
+
+
+class SessionPool:
+    """
+    Fixed-size pool of ONNX Runtime sessions for one model.
+
+    Sessions are created lazily and exactly once (loading is guarded by a
+    lock). Callers check a session out with `with pool.session() as s:` and
+    it is returned to the pool when the block exits, so at most `size`
+    inferences of this model run at the same time.
+    """
+
+    def __init__(self, name: str, model_path: str, size: int, intra_op_threads: int = 0, tune_batch_size: int = 1):
+        self.name = name
+        self.model_path = model_path
+        self.size = max(1, size)
+        self.tune_batch_size = tune_batch_size
+        self.inter_op_threads = ORT_INTER_OP_THREADS
+
+        # Explicit thread counts win over auto-tuning
+        self.autotune = ORT_AUTOTUNE and intra_op_threads == 0
+        cpu_count = os.cpu_count() or 1
+        self.intra_op_threads = intra_op_threads or max(1, cpu_count // self.size)
+
+        # Path and optimisation level the sessions are actually created from
+        self.session_model_path = model_path
+        self.session_optimization_level = ORT_GRAPH_OPTIMIZATION_LEVEL
+        self.load_report = {}
+
+        self._load_lock = threading.Lock()
+        self._sessions = []
+        self._available = queue.Queue()
+
+    @property
+    def loaded(self) -> bool:
+        return len(self._sessions) > 0
+
+    def load(self):
+        """Create all sessions of the pool (thread-safe, idempotent)."""
+        if self.loaded:
+            return
+        with self._load_lock:
+            if self.loaded:
+                return
+            report = {}
+            started = time.perf_counter()
+
+            if ORT_OPTIMIZED_MODEL_CACHE_DIR and ORT_GRAPH_OPTIMIZATION_LEVEL != "disabled":
+                self._use_optimized_model(report)
+
+            if self.autotune:
+                phase = time.perf_counter()
+                self._autotune()
+                report["autotune_seconds"] = time.perf_counter() - phase
+
+            phase = time.perf_counter()
+            sessions = [
+                _create_session(
+                    self.session_model_path,
+                    self.intra_op_threads,
+                    self.inter_op_threads,
+                    self.session_optimization_level
+                )
+                for _ in range(self.size)
+            ]
+            report["session_create_seconds"] = time.perf_counter() - phase
+            report["total_seconds"] = time.perf_counter() - started
+
+            for session in sessions:
+                self._available.put(session)
+            self._sessions = sessions
+            self.load_report = report
+            logger.info(
+                f"{self.name} session pool loaded: {self.size} sessions x "
+                f"{self.intra_op_threads} intra-op threads "
+                f"({', '.join(f'{k}={v:.3f}' if isinstance(v, float) else f'{k}={v}' for k, v in report.items())})"
+            )
+
+    def _use_optimized_model(self, report: dict):
+        """
+        Load the serialized ORT-optimised model, creating it on a cache miss.
+        Sessions created from it skip graph optimisation entirely.
+        """
+        try:
+            phase = time.perf_counter()
+            cached_path = _optimized_model_path(self.model_path, file_digest(self.model_path))
+            report["hash_seconds"] = time.perf_counter() - phase
+
+            if os.path.exists(cached_path):
+                report["optimized_model_cache"] = "hit"
+            else:
+                report["optimized_model_cache"] = "miss"
+                phase = time.perf_counter()
+                os.makedirs(ORT_OPTIMIZED_MODEL_CACHE_DIR, exist_ok=True)
+
+                # ORT writes the optimised graph while building this throwaway session
+                tmp_path = f"{cached_path}.{os.getpid()}.tmp"
+                options = build_session_options(self.intra_op_threads, self.inter_op_threads)
+                options.optimized_model_filepath = tmp_path
+                ort.InferenceSession(self.model_path, sess_options=options, providers=["CPUExecutionProvider"])
+                os.replace(tmp_path, cached_path)
+                report["optimize_seconds"] = time.perf_counter() - phase
+
+            self.session_model_path = cached_path
+            self.session_optimization_level = "disabled"
+        except Exception as e:
+            report["optimized_model_cache"] = "error"
+            logger.warning(f"{self.name} optimized model cache unavailable, loading original model: {e}")
+
+    def _autotune(self):
+        """Replace default thread counts with the benchmarked (or cached) best."""
+        try:
+            level = self.session_optimization_level
+            self.intra_op_threads, self.inter_op_threads = autotune_threads(
+                self.session_model_path,
+                lambda intra, inter: build_session_options(intra, inter, level),
+                concurrency=ORT_AUTOTUNE_CONCURRENCY or self.size,
+                execution_mode=ORT_EXECUTION_MODE,
+                batch_size=self.tune_batch_size
+            )
+        except Exception as e:
+            logger.warning(f"{self.name} thread auto-tuning failed, using defaults: {e}")
+
+    @property
+    def primary(self) -> ort.InferenceSession:
+        """First session of the pool, used for metadata and inspection."""
+        self.load()
+        return self._sessions[0]
+
+    @property
+    def sessions(self) -> list[ort.InferenceSession]:
+        self.load()
+        return list(self._sessions)
+
+    @contextmanager
+    def session(self):
+        """Check out a session for one inference; blocks while all are busy."""
+        self.load()
+        session = self._available.get()
+        try:
+            yield session
+        finally:
+            self._available.put(session)
+
+    def run(self, output_names, feeds: dict):
+        """Run one inference on a checked-out session."""
+        with self.session() as session:
+            return session.run(output_names, feeds)
+
+    def stats(self) -> dict:
+        """Pool size and current checkouts (does not trigger loading)."""
+        return {
+            "model_path": self.model_path,
+            "sessions": self.size,
+            "intra_op_threads": self.intra_op_threads,
+            "inter_op_threads": self.inter_op_threads,
+            "loaded": self.loaded,
+            "in_use": len(self._sessions) - self._available.qsize(),
+            "load_report": self.load_report,
+        }
+
+
 # ========== GLOBAL SINGLETONS ==========
-_yolo_session = None
+_yolo_pool = SessionPool(
+    "YOLO",
+    resolve_model_path(YOLO_MODEL_PATH, YOLO_INT8_MODEL_PATH, YOLO_MODEL_VARIANT),
+    YOLO_SESSION_POOL_SIZE,
+    SESSION_INTRA_OP_THREADS
+)
+_yolo_metadata_lock = threading.Lock()
 _yolo_input_name = None
 _yolo_input_size = None
 _yolo_output_format = None
+_yolo_batch_size = None
+_yolo_dynamic_hw = False
 
-_arcface_session = None
+_arcface_pool = SessionPool(
+    "ArcFace",
+    resolve_model_path(ARCFACE_MODEL_PATH, ARCFACE_INT8_MODEL_PATH, ARCFACE_MODEL_VARIANT),
+    ARCFACE_SESSION_POOL_SIZE,
+    SESSION_INTRA_OP_THREADS,
+    tune_batch_size=8
+)
+_arcface_metadata_lock = threading.Lock()
 _arcface_input_name = None
 _arcface_input_size = None
 
+_light_pool = SessionPool(
+    "LightEmbedder", LIGHT_EMBEDDER_MODEL_PATH, LIGHT_EMBEDDER_POOL_SIZE, SESSION_INTRA_OP_THREADS, tune_batch_size=8
+)
+_light_metadata_lock = threading.Lock()
+_light_input_name = None
+_light_input_size = None
+
+
+def get_session_pool_stats() -> dict:
+    """Stats of both session pools without loading any model."""
+    stats = {"yolo": _yolo_pool.stats(), "arcface": _arcface_pool.stats()}
+    if _light_pool.loaded:
+        stats["light_embedder"] = _light_pool.stats()
+    return stats
+
+
+def limit_session_pools(size: int, cpu_share: int):
+    """
+    Shrink the session pools before they are loaded, e.g. in an inference
+    worker process that runs one request at a time on its share of the cores.
+    An explicit SESSION_INTRA_OP_THREADS still takes precedence.
+
+    Args:
+        size: Sessions per model
+        cpu_share: Cores split among the sessions of one model
+    """
+    for pool in (_yolo_pool, _arcface_pool, _light_pool):
+        if pool.loaded:
+            continue
+        pool.size = max(1, size)
+        if not SESSION_INTRA_OP_THREADS:
+            pool.intra_op_threads = max(1, cpu_share // pool.size)
+
 
 # ========== YOLO MODEL ==========
+def get_yolo_pool() -> SessionPool:
+    """Get the YOLO session pool, loading it and caching input metadata on first use."""
+    global _yolo_input_name, _yolo_input_size, _yolo_batch_size, _yolo_dynamic_hw
+    if _yolo_input_name is None:
+        with _yolo_metadata_lock:
+            if _yolo_input_name is None:
+                # Cache input name and size
+                input_meta = _yolo_pool.primary.get_inputs()[0]
+                # Extract input size from shape: typically [batch, 3, height, width]
+                shape = input_meta.shape
+                if len(shape) == 4:
+                    if isinstance(shape[2], int) and shape[2] > 0:
+                        _yolo_input_size = shape[2]  # Assume square input (height == width)
+                        logger.info(f"YOLO input size: {_yolo_input_size}x{_yolo_input_size}")
+                    else:
+                        # Symbolic height/width: any stride-aligned shape is accepted
+                        _yolo_input_size = YOLO_INPUT_SIZE
+                        _yolo_dynamic_hw = True
+                        logger.info(f"YOLO input size: dynamic, letterboxing to long side {_yolo_input_size}")
+                    # Dynamic batch axes are exported as a symbolic name (str) or None
+                    _yolo_batch_size = shape[0] if isinstance(shape[0], int) and shape[0] > 0 else None
+                    logger.info(f"YOLO batch size: {_yolo_batch_size or 'dynamic'}")
+                else:
+                    _yolo_input_size = 640  # Fallback to default
+                    logger.warning(f"Unexpected YOLO input shape: {shape}, defaulting to 640")
+                _yolo_input_name = input_meta.name
+    return _yolo_pool
+
+
 def get_yolo_session():
-    """Lazy load YOLO model (singleton pattern)."""
-    global _yolo_session, _yolo_input_name, _yolo_input_size
-    if _yolo_session is None:
-        _yolo_session = ort.InferenceSession(
-            YOLO_MODEL_PATH,
-            providers=["CPUExecutionProvider"]
-        )
-        # Cache input name and size
-        input_meta = _yolo_session.get_inputs()[0]
-        _yolo_input_name = input_meta.name
-        # Extract input size from shape: typically [batch, 3, height, width]
-        shape = input_meta.shape
-        if len(shape) == 4:
-            _yolo_input_size = shape[2]  # Assume square input (height == width)
-            logger.info(f"YOLO input size: {_yolo_input_size}x{_yolo_input_size}")
-        else:
-            _yolo_input_size = 640  # Fallback to default
-            logger.warning(f"Unexpected YOLO input shape: {shape}, defaulting to 640")
-    return _yolo_session
+    """Get the primary YOLO session (for metadata and inspection)."""
+    return get_yolo_pool().primary
 
 
 def get_yolo_input_name():
     """Get cached YOLO input name."""
     if _yolo_input_name is None:
-        get_yolo_session()  # Trigger lazy load
+        get_yolo_pool()  # Trigger lazy load
     return _yolo_input_name
 
 
 def get_yolo_input_size():
     """Get cached YOLO input size."""
-    if _yolo_input_size is None:
-        get_yolo_session()  # Trigger lazy load
+    if _yolo_input_name is None:
+        get_yolo_pool()  # Trigger lazy load
     return _yolo_input_size
 
 
+def get_yolo_batch_size():
+    """Get fixed YOLO batch size, or None if the batch axis is dynamic."""
+    if _yolo_input_name is None:
+        get_yolo_pool()  # Trigger lazy load
+    return _yolo_batch_size
+
+
+def get_yolo_dynamic_hw() -> bool:
+    """Whether the YOLO model accepts arbitrary input height/width."""
+    if _yolo_input_name is None:
+        get_yolo_pool()  # Trigger lazy load
+    return _yolo_dynamic_hw
+
+
 def get_yolo_output_format():
     """Get cached YOLO output format."""
     return _yolo_output_format
@@ -100,37 +434,100 @@ def inspect_yolo_model():
 
 
 # ========== ARCFACE MODEL ==========
+def get_arcface_pool() -> SessionPool:
+    """Get the ArcFace session pool, loading it and caching input metadata on first use."""
+    global _arcface_input_name, _arcface_input_size
+    if _arcface_input_name is None:
+        with _arcface_metadata_lock:
+            if _arcface_input_name is None:
+                # Cache input name and size
+                input_meta = _arcface_pool.primary.get_inputs()[0]
+                # Extract input size from shape: typically [batch, 3, height, width]
+                shape = input_meta.shape
+                if len(shape) == 4:
+                    _arcface_input_size = shape[2]  # Assume square input
+                    logger.info(f"ArcFace input size: {_arcface_input_size}x{_arcface_input_size}")
+                else:
+                    _arcface_input_size = 112  # Fallback to default
+                    logger.warning(f"Unexpected ArcFace input shape: {shape}, defaulting to 112")
+                _arcface_input_name = input_meta.name
+    return _arcface_pool
+
+
 def get_arcface_session():
-    """Lazy load ArcFace model (singleton pattern)."""
-    global _arcface_session, _arcface_input_name, _arcface_input_size
-    if _arcface_session is None:
-        _arcface_session = ort.InferenceSession(
-            ARCFACE_MODEL_PATH,
-            providers=["CPUExecutionProvider"]
-        )
-        # Cache input name and size
-        input_meta = _arcface_session.get_inputs()[0]
-        _arcface_input_name = input_meta.name
-        # Extract input size from shape: typically [batch, 3, height, width]
-        shape = input_meta.shape
-        if len(shape) == 4:
-            _arcface_input_size = shape[2]  # Assume square input
-            logger.info(f"ArcFace input size: {_arcface_input_size}x{_arcface_input_size}")
-        else:
-            _arcface_input_size = 112  # Fallback to default
-            logger.warning(f"Unexpected ArcFace input shape: {shape}, defaulting to 112")
-    return _arcface_session
+    """Get the primary ArcFace session (for metadata and inspection)."""
+    return get_arcface_pool().primary
 
 
 def get_arcface_input_name():
     """Get cached ArcFace input name."""
     if _arcface_input_name is None:
-        get_arcface_session()  # Trigger lazy load
+        get_arcface_pool()  # Trigger lazy load
     return _arcface_input_name
 
 
 def get_arcface_input_size():
     """Get cached ArcFace input size."""
-    if _arcface_input_size is None:
-        get_arcface_session()  # Trigger lazy load
+    if _arcface_input_name is None:
+        get_arcface_pool()  # Trigger lazy load
     return _arcface_input_size
+
+
+# ========== LIGHT EMBEDDER (CASCADE STAGE 1) ==========
+def is_light_embedder_available() -> bool:
+    """Whether the optional lightweight embedding model is installed."""
+    return os.path.exists(LIGHT_EMBEDDER_MODEL_PATH)
+
+
+def get_light_embedder_pool() -> SessionPool:
+    """Get the light embedder session pool, loading it and caching input metadata on first use."""
+    global _light_input_name, _light_input_size
+    if _light_input_name is None:
+        with _light_metadata_lock:
+            if _light_input_name is None:
+                input_meta = _light_pool.primary.get_inputs()[0]
+                shape = input_meta.shape
+                if len(shape) == 4:
+                    _light_input_size = shape[2]  # Assume square input
+                    logger.info(f"Light embedder input size: {_light_input_size}x{_light_input_size}")
+                else:
+                    _light_input_size = 112  # Fallback to default
+                    logger.warning(f"Unexpected light embedder input shape: {shape}, defaulting to 112")
+                _light_input_name = input_meta.name
+    return _light_pool
+
+
+def get_light_embedder_input_name():
+    """Get cached light embedder input name."""
+    if _light_input_name is None:
+        get_light_embedder_pool()  # Trigger lazy load
+    return _light_input_name
+
+
+def get_light_embedder_input_size():
+    """Get cached light embedder input size."""
+    if _light_input_name is None:
+        get_light_embedder_pool()  # Trigger lazy load
+    return _light_input_size
+
+
+# ========== MODEL FINGERPRINT ==========
+_model_fingerprint = None
+_fingerprint_lock = threading.Lock()
+
+
+def get_model_fingerprint() -> str:
+    """
+    Digest of the model files recognition results depend on (YOLO, ArcFace
+    and, when installed, the light embedder). Computed once per process,
+    since sessions are never reloaded after start-up.
+    """
+    global _model_fingerprint
+    if _model_fingerprint is None:
+        with _fingerprint_lock:
+            if _model_fingerprint is None:
+                parts = [f"{pool.name}:{file_digest(pool.model_path)}" for pool in (_yolo_pool, _arcface_pool)]
+                if is_light_embedder_available():
+                    parts.append(f"{_light_pool.name}:{file_digest(_light_pool.model_path)}")
+                _model_fingerprint = ",".join(parts)
+    return _model_fingerprint
@@ -0,0 +1,241 @@
+"""
+Staged async pipeline with bounded queues.
+Items flow through a chain of stages, each with its own worker coroutines and
+a bounded inbox: stage k works on item n while stage k+1 works on item n-1,
+and a fast stage blocks instead of piling up work (e.g. decoded images) in
+front of a slow one. Wall-clock time approaches that of the slowest stage.
+"""
+import asyncio
+import time
+import threading
+import logging
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Tells a worker its inbox is drained; one per worker of the stage
+_DONE = object()
+
+
+class PipelineStage:
+    """
+    One stage of a pipeline.
+
+    Args:
+        name: Stage name used in stats
+        fn: Async callable processing a list of items in place
+        workers: Worker coroutines (items processed concurrently)
+        max_batch: Items a worker may take from its inbox at once; extra
+            items are only taken if already queued, never waited for
+    """
+
+    def __init__(self, name: str, fn: Callable[[list], Awaitable[None]], workers: int = 1, max_batch: int = 1):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.max_batch = max(1, max_batch)
+
+
+class StageStats:
+    """Cumulative throughput and occupancy of one stage."""
+
+    def __init__(self, workers: int):
+        self._lock = threading.Lock()
+        self.workers = workers
+        self._items = 0
+        self._batches = 0
+        self._busy = 0.0
+        self._capacity = 0.0
+
+    def record(self, items: int, seconds: float):
+        with self._lock:
+            self._items += items
+            self._batches += 1
+            self._busy += seconds
+
+    def add_capacity(self, wall_seconds: float):
+        """Account for one pipeline run: each worker could have been busy the whole time."""
+        with self._lock:
+            self._capacity += wall_seconds * self.workers
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "items": self._items,
+                "batches": self._batches,
+                "busy_seconds": round(self._busy, 3),
+                "occupancy": self._busy / self._capacity if self._capacity else 0.0,
+            }
+
+
+class Pipeline:
+    """
+    Chain of stages connected by bounded queues.
+
+    Args:
+        name: Pipeline name used in logs
+        stages: Stages in processing order
+        queue_size: Capacity of each stage's inbox
+        skip: Optional predicate; items it accepts pass through later stages untouched
+    """
+
+    def __init__(self, name: str, stages: list[PipelineStage], queue_size: int, skip: Callable[[Any], bool] | None = None):
+        self.name = name
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.skip = skip
+        self._stage_stats = {stage.name: StageStats(stage.workers) for stage in stages}
+        self._lock = threading.Lock()
+        self._runs = 0
+        self._wall = 0.0
+
+    async def _worker(self, stage: PipelineStage, inbox: asyncio.Queue, outbox: asyncio.Queue | None, on_done):
+        stats = self._stage_stats[stage.name]
+        finished = False
+        while not finished:
+            item = await inbox.get()
+            if item is _DONE:
+                return
+
+            # Take whatever else is already waiting, up to max_batch
+            batch = [item]
+            while len(batch) < stage.max_batch:
+                try:
+                    item = inbox.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is _DONE:
+                    finished = True
+                    break
+                batch.append(item)
+
+            pending = [item for item in batch if self.skip is None or not self.skip(item)]
+            if pending:
+                started = time.perf_counter()
+                await stage.fn(pending)
+                stats.record(len(pending), time.perf_counter() - started)
+
+            for item in batch:
+                if outbox is not None:
+                    await outbox.put(item)
+                elif on_done is not None:
+                    await on_done(item)
+
+    async def _run_stage(self, index: int, inboxes: list[asyncio.Queue], on_done):
+        """Run a stage's workers, then signal the next stage that no more items follow."""
+        stage = self.stages[index]
+        outbox = inboxes[index + 1] if index + 1 < len(self.stages) else None
+        await asyncio.gather(*(self._worker(stage, inboxes[index], outbox, on_done) for _ in range(stage.workers)))
+        if outbox is not None:
+            for _ in range(self.stages[index + 1].workers):
+                await outbox.put(_DONE)
+
+    async def _feed(self, items: Iterable | AsyncIterable, inbox: asyncio.Queue, fed: list):
+        if isinstance(items, AsyncIterable):
+            async for item in items:
+                fed.append(item)
+                await inbox.put(item)
+        else:
+            for item in items:
+                fed.append(item)
+                await inbox.put(item)
+        for _ in range(self.stages[0].workers):
+            await inbox.put(_DONE)
+
+    async def run(
+        self,
+        items: Iterable | AsyncIterable,
+        on_done: Callable[[Any], Awaitable[None]] | None = None
+    ) -> list:
+        """
+        Push items through every stage; returns once all are processed.
+        Items may arrive from an async iterable (e.g. uploads still streaming)
+        and are processed in place; `on_done` is awaited for each item as it
+        leaves the last stage. If the source or a stage raises, the remaining
+        work is cancelled and the exception propagates.
+
+        Returns:
+            The items, in the order they entered the pipeline
+        """
+        fed = []
+        started = time.perf_counter()
+        inboxes = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        tasks = [asyncio.create_task(self._feed(items, inboxes[0], fed))]
+        tasks += [asyncio.create_task(self._run_stage(i, inboxes, on_done)) for i in range(len(self.stages))]
+
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        wall = time.perf_counter() - started
+        for stats in self._stage_stats.values():
+            stats.add_capacity(wall)
+        with self._lock:
+            self._runs += 1
+            self._wall += wall
+        logger.debug(f"Pipeline {self.name} processed {len(fed)} items in {wall * 1000:.1f} ms")
+        return fed
+
+    def stats(self) -> dict:
+        with self._lock:
+            runs, wall = self._runs, self._wall
+        return {
+            "runs": runs,
+            "wall_seconds": round(wall, 3),
+            "queue_size": self.queue_size,
+            "stages": {name: stats.stats() for name, stats in self._stage_stats.items()},
+        }
+
+
+class MemoryBudget:
+    """
+    Async byte budget for admission control.
+
+    acquire() waits until the bytes fit; a charge larger than the whole
+    budget is let through once nothing else is held, so it cannot wait
+    forever. Holders must never need more budget to make progress, or
+    waiters could deadlock.
+    """
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self._used = 0
+        self._peak = 0
+        self._waits = 0
+        self._condition = None
+
+    def _ensure_condition(self) -> asyncio.Condition:
+        # Created lazily so it binds to the running event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self, nbytes: int):
+        condition = self._ensure_condition()
+        async with condition:
+            fits = lambda: self._used == 0 or self._used + nbytes <= self.capacity
+            if not fits():
+                self._waits += 1
+                await condition.wait_for(fits)
+            self._used += nbytes
+            self._peak = max(self._peak, self._used)
+
+    async def release(self, nbytes: int):
+        condition = self._ensure_condition()
+        async with condition:
+            self._used -= nbytes
+            condition.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "capacity_bytes": self.capacity,
+            "used_bytes": self._used,
+            "peak_bytes": self._peak,
+            "waits": self._waits,
+        }
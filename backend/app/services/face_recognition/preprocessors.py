@@ -1,29 +1,146 @@
 """
 Image preprocessing utilities for YOLO and ArcFace models.
 Handles resizing, color conversion, and normalization.
+
+OPTIMIZATION: Input tensors are written into per-thread buffers that are
+reused across calls (resize goes straight into a uint8 scratch, BGR->RGB,
+HWC->CHW and scaling happen in one ufunc into the float32 tensor), so no
+per-face or per-photo intermediate arrays are allocated. Returned tensors
+are views of those buffers and stay valid until the next call of the same
+function on the same thread - callers that keep them must copy.
 """
+import math
+import threading
 import cv2
 import numpy as np
-from .models import get_yolo_input_size, get_arcface_input_size
+from app.utils.config import YOLO_RECT_INPUT
+from .models import get_yolo_input_size, get_yolo_batch_size, get_yolo_dynamic_hw, get_arcface_input_size
+
+_YOLO_PAD_VALUE = 114
+_YOLO_STRIDE = 32
+_YOLO_SCALE = np.float32(1.0 / 255.0)
+_ARCFACE_SCALE = np.float32(1.0 / 127.5)
+
+_buffers = threading.local()
+
+
+def _buffer(key: str, shape: tuple, dtype=np.float32) -> np.ndarray:
+    """
+    Reusable per-thread buffer viewed as `shape`.
+    Backing storage grows in powers of two, so varying batch sizes and
+    input shapes settle on one allocation.
+    """
+    cache = getattr(_buffers, "arrays", None)
+    if cache is None:
+        cache = _buffers.arrays = {}
+
+    size = math.prod(shape)
+    buf = cache.get(key)
+    if buf is None or buf.size < size or buf.dtype != dtype:
+        buf = cache[key] = np.empty(1 << max(0, size - 1).bit_length(), dtype=dtype)
+    return buf[:size].reshape(shape)
+
+
+def _bgr_to_chw(src: np.ndarray, out: np.ndarray, scale: np.float32):
+    """Write a BGR uint8 HWC image into a (3, H, W) float32 view as scaled RGB."""
+    np.multiply(src[:, :, ::-1].transpose(2, 0, 1), scale, out=out)
+
+
+def yolo_input_shape(width: int, height: int) -> tuple[int, int]:
+    """
+    YOLO input (width, height) for an image.
+    Square models get size x size; models with dynamic height/width get the
+    smallest stride-aligned rectangle holding the aspect-preserving resize,
+    so no compute is spent on padding.
+    """
+    size = get_yolo_input_size()
+    if not (YOLO_RECT_INPUT and get_yolo_dynamic_hw()):
+        return size, size
+
+    scale = min(size / width, size / height)
+    new_w, new_h = max(1, round(width * scale)), max(1, round(height * scale))
+    return math.ceil(new_w / _YOLO_STRIDE) * _YOLO_STRIDE, math.ceil(new_h / _YOLO_STRIDE) * _YOLO_STRIDE
+
+
+def letterbox(
+    image: np.ndarray,
+    size: int | tuple[int, int],
+    out: np.ndarray | None = None
+) -> tuple[np.ndarray, float, tuple[int, int]]:
+    """
+    Resize image to fit a canvas while preserving aspect ratio.
+    Remaining area is padded with grey (114), as in YOLO training.
+
+    Args:
+        image: Input image in BGR format
+        size: Target square side length, or (width, height)
+        out: Optional (height, width, 3) uint8 canvas to draw into
+
+    Returns:
+        (padded image, scale, (pad_x, pad_y)) - model coords map back to the
+        original image as (coord - pad) / scale
+    """
+    target_w, target_h = (size, size) if isinstance(size, int) else size
+    h, w = image.shape[:2]
+    scale = min(target_w / w, target_h / h)
+    new_w, new_h = max(1, round(w * scale)), max(1, round(h * scale))
+    pad_x, pad_y = (target_w - new_w) // 2, (target_h - new_h) // 2
 
+    canvas = out if out is not None else np.empty((target_h, target_w, 3), dtype=np.uint8)
+    canvas.fill(_YOLO_PAD_VALUE)
+    # Resize straight into the canvas ROI
+    cv2.resize(image, (new_w, new_h), dst=canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w])
+    return canvas, scale, (pad_x, pad_y)
 
-def preprocess_for_yolo(image: np.ndarray) -> np.ndarray:
+
+def preprocess_for_yolo(image: np.ndarray) -> tuple[np.ndarray, tuple[float, tuple[int, int]]]:
     """
     Preprocess image for YOLO face detection.
-    Uses dynamic input size from model metadata.
+    Letterboxes to the model input size (aspect ratio preserved).
 
     Args:
         image: Input image in BGR format
 
     Returns:
-        Preprocessed tensor of shape (1, 3, size, size)
+        (tensor of shape (1, 3, H, W) (reused buffer), (scale, (pad_x, pad_y)))
     """
-    input_size = get_yolo_input_size()
-    resized = cv2.resize(image, (input_size, input_size))
-    rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
-    normalized = rgb.astype(np.float32) / 255.0
-    transposed = normalized.transpose(2, 0, 1)[None]
-    return transposed
+    batch, transforms = preprocess_for_yolo_batch([image], batch_size=get_yolo_batch_size())
+    return batch, transforms[0]
+
+
+def preprocess_for_yolo_batch(
+    images: list[np.ndarray],
+    batch_size: int | None = None
+) -> tuple[np.ndarray, list[tuple[float, tuple[int, int]]]]:
+    """
+    Letterbox several images into one YOLO input tensor.
+    With rectangular inputs, the tensor takes the largest input shape of
+    the images and each image is letterboxed into it.
+
+    Args:
+        images: List of images in BGR format (any sizes)
+        batch_size: Pad the tensor with zero images up to this many (for
+            models exported with a fixed batch size)
+
+    Returns:
+        (tensor of shape (N, 3, H, W) (reused buffer), [(scale, (pad_x, pad_y)), ...])
+    """
+    shapes = [yolo_input_shape(image.shape[1], image.shape[0]) for image in images]
+    input_w = max((w for w, _ in shapes), default=get_yolo_input_size())
+    input_h = max((h for _, h in shapes), default=get_yolo_input_size())
+
+    total = max(len(images), batch_size or 0)
+    batch = _buffer("yolo_batch", (total, 3, input_h, input_w))
+    canvas = _buffer("yolo_canvas", (input_h, input_w, 3), np.uint8)
+    transforms = []
+
+    for i, image in enumerate(images):
+        _, scale, pad = letterbox(image, (input_w, input_h), out=canvas)
+        _bgr_to_chw(canvas, batch[i], _YOLO_SCALE)
+        transforms.append((scale, pad))
+
+    batch[len(images):] = 0.0
+    return batch, transforms
 
 
 def preprocess_for_arcface(face_img: np.ndarray) -> np.ndarray:
@@ -35,38 +152,39 @@ def preprocess_for_arcface(face_img: np.ndarray) -> np.ndarray:
         face_img: Face crop in BGR format
 
     Returns:
-        Preprocessed tensor of shape (1, 3, size, size)
+        Preprocessed tensor of shape (1, 3, size, size) (reused buffer)
     """
-    input_size = get_arcface_input_size()
-    resized = cv2.resize(face_img, (input_size, input_size))
-    rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
-    normalized = rgb.astype(np.float32) / 127.5 - 1.0
-    transposed = normalized.transpose(2, 0, 1)[None]
-    return transposed
+    return preprocess_for_arcface_batch([face_img])
 
 
-def preprocess_for_arcface_batch(face_imgs: list[np.ndarray]) -> np.ndarray:
+def preprocess_for_arcface_batch(face_imgs: list[np.ndarray], input_size: int | None = None) -> np.ndarray:
     """
     Batch preprocess multiple faces for ArcFace.
     Significantly faster than processing one at a time.
 
+    Crops are usually views into the source photo, so each face is resized
+    straight from its ROI into a uint8 scratch and written once into the
+    preallocated (N, 3, size, size) tensor.
+
     Args:
         face_imgs: List of face image crops (BGR format)
+        input_size: Target size (ArcFace model input size if None); lets
+            other ArcFace-style embedders share this preprocessing
 
     Returns:
-        Batched preprocessed tensor of shape (N, 3, size, size)
+        Batched preprocessed tensor of shape (N, 3, size, size) (reused buffer)
     """
     if len(face_imgs) == 0:
         return np.array([])
 
-    input_size = get_arcface_input_size()
-    batch = []
+    input_size = input_size or get_arcface_input_size()
+    batch = _buffer(f"arcface_batch_{input_size}", (len(face_imgs), 3, input_size, input_size))
+    scratch = _buffer(f"arcface_hwc_{input_size}", (input_size, input_size, 3), np.uint8)
 
-    for face_img in face_imgs:
-        resized = cv2.resize(face_img, (input_size, input_size))
-        rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
-        normalized = rgb.astype(np.float32) / 127.5 - 1.0
-        transposed = normalized.transpose(2, 0, 1)
-        batch.append(transposed)
+    for i, face_img in enumerate(face_imgs):
+        cv2.resize(face_img, (input_size, input_size), dst=scratch)
+        _bgr_to_chw(scratch, batch[i], _ARCFACE_SCALE)
 
-    return np.array(batch)
+    # (x / 127.5) - 1 == (x - 127.5) / 127.5, applied once for the whole batch
+    np.subtract(batch, np.float32(1.0), out=batch)
+    return batch
@@ -0,0 +1,451 @@
+"""
+Process-pool inference backend.
+YOLO output parsing, NMS and the per-face loops are NumPy/Python glue that
+holds the GIL, so inference threads of one process cannot keep every core
+busy. With INFERENCE_BACKEND=process, detection and ArcFace embedding run in
+worker processes that each own their ONNX sessions.
+
+Frames and crop batches are not pickled: the parent copies them into a
+shared-memory slab owned by the worker it checked out, and only a small
+control message goes over the worker's pipe:
+
+    parent -> worker: ("detect" | "embed", slab name, [(offset, shape), ...])
+                      ("ping",) | ("stop",)
+    worker -> parent: ("ok", result) | ("error", exception type, message)
+                      ("ready", warm-up report) once, after start-up
+
+A monitor thread pings idle workers and restarts any that died or stopped
+answering; a request whose worker crashes is retried once on the restarted
+worker.
+"""
+import os
+import time
+import queue
+import signal
+import threading
+import logging
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from app.utils.config import (
+    INFERENCE_BACKEND,
+    INFERENCE_PROCESS_WORKERS,
+    INFERENCE_PROCESS_SHM_BYTES,
+    INFERENCE_PROCESS_TIMEOUT_SECONDS,
+    INFERENCE_PROCESS_START_TIMEOUT_SECONDS,
+    INFERENCE_PROCESS_HEALTH_INTERVAL_SECONDS
+)
+from .models import limit_session_pools
+from .warmup import warm_up_models
+from .yolo_detector import detect_multiple_faces_batch
+
+logger = logging.getLogger(__name__)
+
+
+# ========== WORKER PROCESS ==========
+def _views(buf, layout: list[tuple[int, tuple]]) -> list[np.ndarray]:
+    """uint8 arrays described by (offset, shape) pairs, as views into a shared buffer."""
+    return [np.ndarray(shape, dtype=np.uint8, buffer=buf, offset=offset) for offset, shape in layout]
+
+
+def _handle_detect(buf, layout: list[tuple[int, tuple]]) -> list[list[tuple]]:
+    faces_per_image = detect_multiple_faces_batch(_views(buf, layout), with_landmarks=True)
+    # Crops are views into the slab; the parent re-cuts them from its own copy
+    return [
+        [(x1, y1, x2, y2, conf, landmarks) for x1, y1, x2, y2, conf, _, landmarks in faces]
+        for faces in faces_per_image
+    ]
+
+
+def _handle_embed(buf, layout: list[tuple[int, tuple]]) -> tuple[np.ndarray, list[bool]]:
+    # Imported here: the batcher itself dispatches to this module
+    from .batcher import extract_embeddings_with_fallback
+
+    embeddings = extract_embeddings_with_fallback(_views(buf, layout))
+    dim = next((len(e) for e in embeddings if e is not None), 0)
+    stacked = np.zeros((len(embeddings), dim), dtype=np.float32)
+    for i, embedding in enumerate(embeddings):
+        if embedding is not None:
+            stacked[i] = embedding
+    return stacked, [embedding is not None for embedding in embeddings]
+
+
+_HANDLERS = {"detect": _handle_detect, "embed": _handle_embed}
+
+
+def _worker_main(conn, index: int, cpu_share: int):
+    """Entry point of an inference worker process."""
+    # Shutdown is driven by the parent, not by a terminal's Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(asctime)s [inference-{index}] %(levelname)s %(name)s: %(message)s"
+    )
+
+    # One request at a time per process: one session per model is enough
+    limit_session_pools(1, cpu_share)
+    try:
+        conn.send(("ready", warm_up_models()))
+    except Exception as e:
+        conn.send(("error", type(e).__name__, str(e)))
+        return
+
+    slab = None
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break  # parent is gone
+
+            op = message[0]
+            if op == "stop":
+                break
+            if op == "ping":
+                conn.send(("ok", os.getpid()))
+                continue
+
+            try:
+                _, slab_name, layout = message
+                if slab is None or slab.name != slab_name:
+                    # The parent grew the slab; drop the old mapping
+                    if slab is not None:
+                        slab.close()
+                    slab = shared_memory.SharedMemory(name=slab_name)
+                result = _HANDLERS[op](slab.buf, layout)
+            except Exception as e:
+                conn.send(("error", type(e).__name__, str(e)))
+            else:
+                conn.send(("ok", result))
+    finally:
+        if slab is not None:
+            slab.close()
+
+
+# ========== PARENT SIDE ==========
+class _Worker:
+    """Parent-side handle of one worker process: pipe, shared-memory slab and lock."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.slab = None
+        self.lock = threading.Lock()
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+class InferenceProcessPool:
+    """
+    Fixed-size pool of inference worker processes.
+
+    Calls block (run them on an executor thread) and check a worker out for
+    the duration of one request, like SessionPool does for sessions.
+
+    Args:
+        size: Worker processes
+        slab_bytes: Initial shared-memory slab per worker (grown on demand)
+        timeout: Seconds to wait for one reply before the worker is restarted
+        start_timeout: Seconds a worker may take to load and warm up its models
+        health_interval: Seconds between health checks of idle workers
+    """
+
+    def __init__(
+        self,
+        size: int,
+        slab_bytes: int = INFERENCE_PROCESS_SHM_BYTES,
+        timeout: float = INFERENCE_PROCESS_TIMEOUT_SECONDS,
+        start_timeout: float = INFERENCE_PROCESS_START_TIMEOUT_SECONDS,
+        health_interval: float = INFERENCE_PROCESS_HEALTH_INTERVAL_SECONDS
+    ):
+        self.size = max(1, size)
+        self.slab_bytes = max(1, slab_bytes)
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        self.health_interval = health_interval
+        self.cpu_share = max(1, (os.cpu_count() or 1) // self.size)
+
+        # Spawned, not forked: ORT and the executor threads do not survive fork
+        self._context = mp.get_context("spawn")
+        self._workers = [_Worker(i) for i in range(self.size)]
+        self._idle = queue.Queue()
+        self._start_lock = threading.Lock()
+        self._started = False
+        self._warmup_reports = {}
+        self._stop = threading.Event()
+        self._monitor = None
+
+        self._stats_lock = threading.Lock()
+        self._requests = {op: 0 for op in _HANDLERS}
+        self._items = 0
+        self._bytes_shared = 0
+        self._roundtrip_total = 0.0
+        self._failures = 0
+        self._restarts = 0
+
+    # ----- lifecycle -----
+    def start(self) -> dict:
+        """Spawn and warm up every worker (blocking, idempotent)."""
+        if self._started:
+            return dict(self._warmup_reports)
+        with self._start_lock:
+            if self._started:
+                return dict(self._warmup_reports)
+
+            started = time.perf_counter()
+            try:
+                for worker in self._workers:
+                    self._launch(worker)
+                for worker in self._workers:
+                    self._warmup_reports[f"worker_{worker.index}"] = self._await_ready(worker)
+            except Exception:
+                for worker in self._workers:
+                    self._terminate(worker)
+                raise
+            for worker in self._workers:
+                self._idle.put(worker)
+            self._warmup_reports["total_seconds"] = time.perf_counter() - started
+
+            self._monitor = threading.Thread(target=self._monitor_loop, name="inference-monitor", daemon=True)
+            self._monitor.start()
+            self._started = True
+            logger.info(
+                f"Inference process pool started: {self.size} workers x {self.cpu_share} cores "
+                f"in {self._warmup_reports['total_seconds']:.2f}s"
+            )
+        return dict(self._warmup_reports)
+
+    def _launch(self, worker: _Worker):
+        parent_conn, child_conn = self._context.Pipe()
+        worker.process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, worker.index, self.cpu_share),
+            name=f"inference-{worker.index}",
+            daemon=True
+        )
+        worker.process.start()
+        child_conn.close()
+        worker.conn = parent_conn
+
+    def _await_ready(self, worker: _Worker) -> dict:
+        try:
+            if not worker.conn.poll(self.start_timeout):
+                raise RuntimeError(f"not ready within {self.start_timeout}s")
+            reply = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            reply = ("error", type(e).__name__, f"exited during start-up ({e})")
+        except RuntimeError as e:
+            reply = ("error", "RuntimeError", str(e))
+
+        if reply[0] != "ready":
+            self._terminate(worker)
+            raise RuntimeError(f"Inference worker {worker.index} failed to start: {reply[1]}: {reply[2]}")
+        return reply[1]
+
+    def _terminate(self, worker: _Worker):
+        if worker.process is not None:
+            worker.process.terminate()
+            worker.process.join(5)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+        if worker.conn is not None:
+            worker.conn.close()
+        worker.process, worker.conn = None, None
+
+    def _restart(self, worker: _Worker, reason: str):
+        """Replace a crashed or hung worker (caller holds worker.lock)."""
+        logger.warning(f"Restarting inference worker {worker.index}: {reason}")
+        with self._stats_lock:
+            self._restarts += 1
+        self._terminate(worker)
+        self._launch(worker)
+        self._await_ready(worker)
+
+    def shutdown(self):
+        """Stop the monitor and every worker, and release the shared memory."""
+        self._stop.set()
+        if self._monitor is not None:
+            self._monitor.join()
+        for worker in self._workers:
+            with worker.lock:
+                if worker.alive():
+                    try:
+                        worker.conn.send(("stop",))
+                    except OSError:
+                        pass
+                    worker.process.join(5)
+                self._terminate(worker)
+                if worker.slab is not None:
+                    worker.slab.close()
+                    worker.slab.unlink()
+                    worker.slab = None
+        self._started = False
+
+    # ----- health -----
+    def _monitor_loop(self):
+        while not self._stop.wait(self.health_interval):
+            for worker in self._workers:
+                # A busy worker is being checked by the request it is serving
+                if not worker.lock.acquire(blocking=False):
+                    continue
+                try:
+                    reason = self._check(worker)
+                    if reason is not None and not self._stop.is_set():
+                        self._restart(worker, reason)
+                except Exception as e:
+                    logger.error(f"Inference worker {worker.index} health check failed: {e}")
+                finally:
+                    worker.lock.release()
+
+    def _check(self, worker: _Worker) -> str | None:
+        """Ping a worker; returns why it is unhealthy, or None."""
+        if not worker.alive():
+            exitcode = worker.process.exitcode if worker.process is not None else None
+            return f"process exited (code {exitcode})"
+        try:
+            worker.conn.send(("ping",))
+            if not worker.conn.poll(self.timeout):
+                return f"no answer to ping within {self.timeout}s"
+            worker.conn.recv()
+        except (EOFError, OSError) as e:
+            return f"pipe broken ({e})"
+        return None
+
+    # ----- requests -----
+    def _write(self, worker: _Worker, arrays: list[np.ndarray]) -> list[tuple[int, tuple]]:
+        """Copy arrays into the worker's slab (growing it if needed); returns their layout."""
+        nbytes = sum(array.nbytes for array in arrays)
+        if worker.slab is None or worker.slab.size < nbytes:
+            size = max(nbytes, self.slab_bytes, 2 * worker.slab.size if worker.slab is not None else 0)
+            if worker.slab is not None:
+                worker.slab.close()
+                worker.slab.unlink()
+            worker.slab = shared_memory.SharedMemory(create=True, size=size)
+
+        layout = []
+        offset = 0
+        for array in arrays:
+            np.ndarray(array.shape, dtype=np.uint8, buffer=worker.slab.buf, offset=offset)[...] = array
+            layout.append((offset, array.shape))
+            offset += array.nbytes
+        return layout
+
+    def _request(self, op: str, arrays: list[np.ndarray]):
+        """Run one request on a checked-out worker; retried once if the worker crashes."""
+        self.start()
+        worker = self._idle.get()
+        try:
+            with worker.lock:
+                for attempt in range(2):
+                    if not worker.alive():
+                        self._restart(worker, "process not running")
+
+                    layout = self._write(worker, arrays)
+                    started = time.perf_counter()
+                    try:
+                        worker.conn.send((op, worker.slab.name, layout))
+                        if not worker.conn.poll(self.timeout):
+                            raise TimeoutError(f"no reply within {self.timeout}s")
+                        reply = worker.conn.recv()
+                    except (EOFError, OSError) as e:
+                        with self._stats_lock:
+                            self._failures += 1
+                        self._restart(worker, f"{op} failed: {e!r}")
+                        if attempt == 1:
+                            raise RuntimeError(f"Inference worker {worker.index} failed twice on {op}: {e!r}")
+                        continue
+
+                    with self._stats_lock:
+                        self._requests[op] += 1
+                        self._items += len(arrays)
+                        self._bytes_shared += sum(array.nbytes for array in arrays)
+                        self._roundtrip_total += time.perf_counter() - started
+
+                    if reply[0] == "ok":
+                        return reply[1]
+                    _, kind, message = reply
+                    raise (ValueError if kind == "ValueError" else RuntimeError)(message)
+        finally:
+            self._idle.put(worker)
+
+    def detect(self, images: list[np.ndarray]) -> list[list[tuple]]:
+        """(x1, y1, x2, y2, confidence, landmarks) per face, per image (blocking)."""
+        return self._request("detect", images)
+
+    def embed(self, face_imgs: list[np.ndarray]) -> tuple[np.ndarray, list[bool]]:
+        """(N, D) float32 embeddings and which rows are valid (blocking)."""
+        return self._request("embed", face_imgs)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            requests = sum(self._requests.values())
+            return {
+                "workers": self.size,
+                "alive": sum(worker.alive() for worker in self._workers),
+                "cores_per_worker": self.cpu_share,
+                "requests": dict(self._requests),
+                "items": self._items,
+                "bytes_shared": self._bytes_shared,
+                "avg_roundtrip_ms": self._roundtrip_total / requests * 1000 if requests else 0.0,
+                "failures": self._failures,
+                "restarts": self._restarts,
+                "slab_bytes": [worker.slab.size if worker.slab is not None else 0 for worker in self._workers],
+            }
+
+
+# ========== GLOBAL SINGLETON ==========
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def process_backend_enabled() -> bool:
+    return INFERENCE_BACKEND == "process"
+
+
+def get_inference_process_pool() -> InferenceProcessPool:
+    """Get the inference process pool (workers are spawned on first use or start())."""
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                _process_pool = InferenceProcessPool(INFERENCE_PROCESS_WORKERS)
+    return _process_pool
+
+
+def shutdown_inference_processes():
+    """Stop the worker processes, if they were started (used on application shutdown)."""
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown()
+
+
+def detect_faces_in_workers(images: list[np.ndarray], with_landmarks: bool = False) -> list[list[tuple]]:
+    """
+    detect_multiple_faces_batch on the process pool (blocking).
+    Crops are cut from the caller's images, so they are views exactly as
+    with in-process detection.
+
+    Returns:
+        One list of (x1, y1, x2, y2, confidence, face_crop[, landmarks]) per image
+    """
+    if len(images) == 0:
+        return []
+
+    results = []
+    for image, faces in zip(images, get_inference_process_pool().detect(images)):
+        if with_landmarks:
+            results.append([(x1, y1, x2, y2, conf, image[y1:y2, x1:x2], lm) for x1, y1, x2, y2, conf, lm in faces])
+        else:
+            results.append([(x1, y1, x2, y2, conf, image[y1:y2, x1:x2]) for x1, y1, x2, y2, conf, _ in faces])
+    return results
+
+
+def embed_faces_in_workers(face_imgs: list[np.ndarray]) -> list[list[float] | None]:
+    """extract_embeddings_with_fallback on the process pool (blocking)."""
+    if len(face_imgs) == 0:
+        return []
+    embeddings, valid = get_inference_process_pool().embed(face_imgs)
+    return [embedding.tolist() if ok else None for embedding, ok in zip(embeddings, valid)]
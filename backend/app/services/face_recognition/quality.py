@@ -0,0 +1,176 @@
+"""
+Face-quality gate between detection and embedding.
+Cheap checks (size, sharpness, exposure, landmark pose) reject crops that
+would never clear the match threshold, so they skip the ArcFace pass.
+"""
+import threading
+import cv2
+import numpy as np
+import logging
+from app.utils.config import (
+    QUALITY_GATE_ENABLED,
+    QUALITY_MIN_FACE_SIZE,
+    QUALITY_MIN_SHARPNESS,
+    QUALITY_MIN_BRIGHTNESS,
+    QUALITY_MAX_BRIGHTNESS,
+    QUALITY_MAX_YAW
+)
+
+logger = logging.getLogger(__name__)
+
+SKIP_REASONS = ("too_small", "blurry", "underexposed", "overexposed", "extreme_pose")
+
+# Sharpness is measured at a fixed size so the threshold does not depend on crop resolution
+_SHARPNESS_SIZE = 112
+
+
+def _pose_is_extreme(landmarks: np.ndarray) -> bool:
+    """
+    Yaw/pitch check from 5-point landmarks (eyes, nose, mouth corners).
+    Yaw: nose offset from the eye midpoint relative to eye distance.
+    Pitch: nose must sit between the eye line and the mouth line.
+    """
+    left_eye, right_eye, nose, left_mouth, right_mouth = landmarks
+    eye_distance = np.linalg.norm(right_eye - left_eye)
+    if eye_distance < 1e-3:
+        return True
+
+    eye_mid = (left_eye + right_eye) / 2
+    if abs(nose[0] - eye_mid[0]) / eye_distance > QUALITY_MAX_YAW:
+        return True
+
+    mouth_y = (left_mouth[1] + right_mouth[1]) / 2
+    face_height = mouth_y - eye_mid[1]
+    if face_height <= 0:
+        return True
+    nose_position = (nose[1] - eye_mid[1]) / face_height
+    return not 0.15 <= nose_position <= 0.9
+
+
+def _sharpness(gray: np.ndarray) -> float:
+    """Variance of the Laplacian of a greyscale crop, at a fixed size."""
+    resized = cv2.resize(gray, (_SHARPNESS_SIZE, _SHARPNESS_SIZE), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(resized, cv2.CV_32F).var())
+
+
+def assess_face(face_crop: np.ndarray, landmarks: np.ndarray | None = None) -> str | None:
+    """
+    Run the quality checks on one face crop.
+
+    Args:
+        face_crop: Face crop in BGR format
+        landmarks: Optional (5, 2) landmarks (any coordinate origin)
+
+    Returns:
+        First failed check (one of SKIP_REASONS), or None if the face passes
+    """
+    h, w = face_crop.shape[:2]
+    if min(h, w) < QUALITY_MIN_FACE_SIZE:
+        return "too_small"
+
+    gray = cv2.cvtColor(face_crop, cv2.COLOR_BGR2GRAY)
+    brightness = float(gray.mean())
+    if brightness < QUALITY_MIN_BRIGHTNESS:
+        return "underexposed"
+    if brightness > QUALITY_MAX_BRIGHTNESS:
+        return "overexposed"
+
+    if _sharpness(gray) < QUALITY_MIN_SHARPNESS:
+        return "blurry"
+
+    if landmarks is not None and _pose_is_extreme(np.asarray(landmarks, dtype=np.float32)):
+        return "extreme_pose"
+
+    return None
+
+
+def face_quality_score(face_crop: np.ndarray, confidence: float, landmarks: np.ndarray | None = None) -> float:
+    """
+    Relative quality of a face crop, for picking the best of several views
+    of the same face (e.g. along a video track). Product of detection
+    confidence, resolution, sharpness and frontality, each in [0, 1].
+
+    Args:
+        face_crop: Face crop in BGR format
+        confidence: Detection confidence
+        landmarks: Optional (5, 2) landmarks (any coordinate origin)
+    """
+    h, w = face_crop.shape[:2]
+    if min(h, w) == 0:
+        return 0.0
+
+    resolution = min(1.0, min(h, w) / _SHARPNESS_SIZE)
+    # Saturates well above the gate's blur threshold
+    sharpness = min(1.0, _sharpness(cv2.cvtColor(face_crop, cv2.COLOR_BGR2GRAY)) / max(4 * QUALITY_MIN_SHARPNESS, 1e-6))
+
+    frontality = 1.0
+    if landmarks is not None:
+        left_eye, right_eye, nose = np.asarray(landmarks, dtype=np.float32)[:3]
+        eye_distance = np.linalg.norm(right_eye - left_eye)
+        yaw = abs(nose[0] - (left_eye[0] + right_eye[0]) / 2) / eye_distance if eye_distance >= 1e-3 else 1.0
+        frontality = max(0.0, 1.0 - float(yaw))
+
+    return confidence * resolution * sharpness * frontality
+
+
+class QualityStats:
+    """Counters of faces checked and skipped per reason."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = 0
+        self._skipped = {reason: 0 for reason in SKIP_REASONS}
+
+    def record(self, checked: int, skips: dict):
+        with self._lock:
+            self._checked += checked
+            for reason, count in skips.items():
+                self._skipped[reason] += count
+
+    def stats(self) -> dict:
+        with self._lock:
+            skipped = sum(self._skipped.values())
+            return {
+                "enabled": QUALITY_GATE_ENABLED,
+                "checked": self._checked,
+                "skipped": dict(self._skipped),
+                "skip_rate": skipped / self._checked if self._checked else 0.0,
+            }
+
+
+_quality_stats = QualityStats()
+
+
+def get_quality_stats() -> QualityStats:
+    """Get the process-wide quality gate counters."""
+    return _quality_stats
+
+
+def filter_faces(faces: list[tuple]) -> tuple[list[tuple], dict]:
+    """
+    Drop faces that fail the quality gate.
+
+    Args:
+        faces: Detections (x1, y1, x2, y2, confidence, face_crop[, landmarks])
+
+    Returns:
+        (kept faces, {reason: skipped count}) - everything is kept when the
+        gate is disabled
+    """
+    skips = {}
+    if not QUALITY_GATE_ENABLED or len(faces) == 0:
+        return faces, skips
+
+    kept = []
+    for face in faces:
+        landmarks = face[6] if len(face) > 6 else None
+        reason = assess_face(face[5], landmarks)
+        if reason is None:
+            kept.append(face)
+        else:
+            skips[reason] = skips.get(reason, 0) + 1
+
+    _quality_stats.record(len(faces), skips)
+    if skips:
+        logger.info(f"Quality gate skipped {len(faces) - len(kept)} of {len(faces)} faces: {skips}")
+    return kept, skips
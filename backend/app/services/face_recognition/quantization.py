@@ -0,0 +1,366 @@
+"""
+INT8 quantization and FP32-vs-INT8 evaluation for YOLO and ArcFace.
+
+Usage:
+    # Produce INT8 models (static QDQ needs a folder of representative photos)
+    python -m app.services.face_recognition.quantization quantize --model arcface --mode static --calibration-dir ./calib
+    python -m app.services.face_recognition.quantization quantize --model yolo --mode dynamic
+
+    # Compare against FP32 on a local image set before switching *_MODEL_VARIANT=int8
+    python -m app.services.face_recognition.quantization evaluate --images ./eval_set
+
+The image set may be flat (unlabelled) or one sub-folder per person. With
+sub-folders, the first photo of each person is the enrollment photo and the
+rest are probes, so match decisions and accuracy can be compared per model.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import cv2
+import numpy as np
+import onnxruntime as ort
+import logging
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    QuantFormat,
+    QuantType,
+    quantize_dynamic,
+    quantize_static,
+    quant_pre_process
+)
+from app.utils.config import (
+    YOLO_MODEL_PATH,
+    ARCFACE_MODEL_PATH,
+    YOLO_INT8_MODEL_PATH,
+    ARCFACE_INT8_MODEL_PATH,
+    RECOGNITION_MATCH_THRESHOLD
+)
+from .gallery import l2_normalize
+from .preprocessors import preprocess_for_yolo_batch, preprocess_for_arcface_batch
+from .yolo_detector import detect_multiple_faces, _parse_yolo_output, _faces_from_detections
+
+logger = logging.getLogger(__name__)
+
+_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+_MODELS = {
+    "yolo": (YOLO_MODEL_PATH, YOLO_INT8_MODEL_PATH),
+    "arcface": (ARCFACE_MODEL_PATH, ARCFACE_INT8_MODEL_PATH),
+}
+
+
+# ========== IMAGE SET ==========
+def _list_images(folder: str) -> list[str]:
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(_IMAGE_EXTENSIONS)
+    )
+
+
+def load_image_set(folder: str) -> list[tuple[str | None, str]]:
+    """
+    List (label, path) pairs; label is the sub-folder name or None for a flat folder.
+    """
+    subdirs = sorted(d for d in os.listdir(folder) if os.path.isdir(os.path.join(folder, d)))
+    if not subdirs:
+        return [(None, path) for path in _list_images(folder)]
+    return [(label, path) for label in subdirs for path in _list_images(os.path.join(folder, label))]
+
+
+def _create_session(model_path: str) -> ort.InferenceSession:
+    return ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+
+
+def _fixed_batch_size(session: ort.InferenceSession) -> int | None:
+    """Batch dimension of a model exported with a fixed batch size, None if dynamic."""
+    dim = session.get_inputs()[0].shape[0]
+    return dim if isinstance(dim, int) and dim > 0 else None
+
+
+def _pad_batch(batch: np.ndarray, batch_size: int | None) -> np.ndarray:
+    """Zero-pad a tensor up to a fixed batch size (returned as is if dynamic)."""
+    if batch_size is None or len(batch) >= batch_size:
+        return batch
+    padding = np.zeros((batch_size - len(batch), *batch.shape[1:]), dtype=batch.dtype)
+    return np.concatenate([batch, padding])
+
+
+# ========== CALIBRATION ==========
+class _TensorListReader(CalibrationDataReader):
+    """Feeds a precomputed list of input tensors to the static quantizer."""
+
+    def __init__(self, input_name: str, tensors: list[np.ndarray]):
+        self._feeds = iter([{input_name: tensor} for tensor in tensors])
+
+    def get_next(self):
+        return next(self._feeds, None)
+
+
+def _calibration_tensors(model: str, folder: str, limit: int, batch_size: int | None = None) -> list[np.ndarray]:
+    """
+    Representative inputs: letterboxed photos for YOLO, detected face crops for ArcFace.
+    Fixed-batch models get batch_size samples per tensor (the last one zero-padded).
+    """
+    paths = _list_images(folder)[:limit]
+    images = [img for img in (cv2.imread(p) for p in paths) if img is not None]
+    if not images:
+        raise ValueError(f"No readable calibration images in {folder}")
+
+    if model == "yolo":
+        samples = images
+        preprocess = lambda chunk: preprocess_for_yolo_batch(chunk, batch_size=batch_size)[0]
+    else:
+        samples = [face_crop for img in images for *_, face_crop in detect_multiple_faces(img)][:limit]
+        if not samples:
+            raise ValueError("No faces detected in calibration images")
+        preprocess = lambda chunk: _pad_batch(preprocess_for_arcface_batch(chunk), batch_size)
+
+    # Preprocessed tensors live in reused buffers; keep copies
+    step = batch_size or 1
+    return [preprocess(samples[start:start + step]).copy() for start in range(0, len(samples), step)]
+
+
+def quantize_model(model: str, mode: str, output_path: str | None = None,
+                   calibration_dir: str | None = None, calibration_limit: int = 200) -> str:
+    """
+    Produce an INT8 variant of the YOLO or ArcFace model.
+
+    Args:
+        model: "yolo" or "arcface"
+        mode: "dynamic" (weights only, no data needed) or "static" (QDQ, calibrated)
+        output_path: Destination (config *_INT8_MODEL_PATH if None)
+        calibration_dir: Folder of representative photos (static mode)
+        calibration_limit: Maximum calibration samples
+
+    Returns:
+        Path of the written INT8 model
+    """
+    fp32_path, default_output = _MODELS[model]
+    output_path = output_path or default_output
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+
+    # Shape inference + graph cleanup improves quantization coverage
+    prepared_path = f"{output_path}.prep.onnx"
+    try:
+        quant_pre_process(fp32_path, prepared_path)
+        source_path = prepared_path
+    except Exception as e:
+        logger.warning(f"Quantization pre-processing failed, quantizing the original graph: {e}")
+        source_path = fp32_path
+
+    try:
+        if mode == "dynamic":
+            quantize_dynamic(source_path, output_path, weight_type=QuantType.QInt8)
+        elif mode == "static":
+            if not calibration_dir:
+                raise ValueError("Static quantization needs --calibration-dir")
+            session = _create_session(fp32_path)
+            input_name = session.get_inputs()[0].name
+            tensors = _calibration_tensors(model, calibration_dir, calibration_limit, _fixed_batch_size(session))
+            reader = _TensorListReader(input_name, tensors)
+            quantize_static(
+                source_path,
+                output_path,
+                reader,
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                per_channel=True
+            )
+        else:
+            raise ValueError(f"Unknown quantization mode: {mode}")
+    finally:
+        if os.path.exists(prepared_path):
+            os.remove(prepared_path)
+
+    logger.info(f"Wrote {mode} INT8 {model} model to {output_path}")
+    return output_path
+
+
+# ========== EVALUATION ==========
+def _embed(session: ort.InferenceSession, crops: list[np.ndarray]) -> tuple[np.ndarray, float]:
+    """
+    L2-normalised embeddings and mean latency per face (ms).
+    Fixed-batch models run in chunks of their batch size (the last one zero-padded).
+    """
+    input_name = session.get_inputs()[0].name
+    batch_size = _fixed_batch_size(session)
+    step = batch_size or len(crops)
+
+    embeddings, elapsed = [], 0.0
+    for start in range(0, len(crops), step):
+        chunk = crops[start:start + step]
+        batch = _pad_batch(preprocess_for_arcface_batch(chunk), batch_size)
+        started = time.perf_counter()
+        output = session.run(None, {input_name: batch})[0]
+        elapsed += time.perf_counter() - started
+        embeddings.append(output.reshape(len(batch), -1)[:len(chunk)])
+
+    return l2_normalize(np.concatenate(embeddings)), 1000 * elapsed / len(crops)
+
+
+def _detect(session: ort.InferenceSession, image: np.ndarray) -> tuple[list[tuple], float]:
+    """Detected faces and latency (ms) for one image."""
+    input_name = session.get_inputs()[0].name
+    # Fixed-batch models need exactly that many inputs (zero-padded)
+    batch, transforms = preprocess_for_yolo_batch([image], batch_size=_fixed_batch_size(session))
+    started = time.perf_counter()
+    outputs = session.run(None, {input_name: batch})
+    latency = 1000 * (time.perf_counter() - started)
+    boxes, scores, _ = _parse_yolo_output(outputs, transforms[0])
+    return _faces_from_detections(image, boxes, scores), latency
+
+
+def _box_iou(a, b) -> float:
+    ix1, iy1, ix2, iy2 = max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _match_decisions(gallery: np.ndarray, labels: list[str], probes: np.ndarray, threshold: float) -> list[str | None]:
+    scores = probes @ gallery.T
+    best = np.argmax(scores, axis=1)
+    return [labels[j] if scores[i, j] >= threshold else None for i, j in enumerate(best)]
+
+
+def evaluate_arcface(image_set: list[tuple[str | None, str]], fp32_path: str, int8_path: str,
+                     threshold: float = RECOGNITION_MATCH_THRESHOLD) -> dict:
+    """
+    Compare FP32 and INT8 ArcFace on faces detected in a local image set.
+
+    Reports embedding cosine drift, per-face latency and match decisions:
+    labelled sets enroll the first photo per person and match the rest;
+    unlabelled sets check each INT8 embedding still finds its own FP32 one.
+    """
+    faces = []  # (label, crop, is_enrollment)
+    seen_labels = set()
+    for label, path in image_set:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        detected = detect_multiple_faces(image)
+        if label is not None:
+            # Labelled photos hold one person: keep the most confident face
+            detected = sorted(detected, key=lambda f: f[4], reverse=True)[:1]
+        for *_, crop in detected:
+            faces.append((label, crop, label is not None and label not in seen_labels))
+            seen_labels.add(label)
+
+    if not faces:
+        raise ValueError("No faces detected in the evaluation set")
+
+    crops = [crop for _, crop, _ in faces]
+    fp32_embeddings, fp32_latency = _embed(_create_session(fp32_path), crops)
+    int8_embeddings, int8_latency = _embed(_create_session(int8_path), crops)
+
+    drift = np.sum(fp32_embeddings * int8_embeddings, axis=1)
+    report = {
+        "faces": len(faces),
+        "cosine_fp32_vs_int8": {
+            "mean": float(drift.mean()),
+            "min": float(drift.min()),
+            "p5": float(np.percentile(drift, 5)),
+        },
+        "latency_ms_per_face": {"fp32": fp32_latency, "int8": int8_latency, "speedup": fp32_latency / int8_latency},
+    }
+
+    enroll = [i for i, (_, _, is_enroll) in enumerate(faces) if is_enroll]
+    probes = [i for i, (label, _, is_enroll) in enumerate(faces) if label is not None and not is_enroll]
+    if enroll and probes:
+        labels = [faces[i][0] for i in enroll]
+        truth = [faces[i][0] for i in probes]
+        fp32_decisions = _match_decisions(fp32_embeddings[enroll], labels, fp32_embeddings[probes], threshold)
+        int8_decisions = _match_decisions(int8_embeddings[enroll], labels, int8_embeddings[probes], threshold)
+        report["match_decisions"] = {
+            "probes": len(probes),
+            "agreement": float(np.mean([a == b for a, b in zip(fp32_decisions, int8_decisions)])),
+            "fp32_accuracy": float(np.mean([d == t for d, t in zip(fp32_decisions, truth)])),
+            "int8_accuracy": float(np.mean([d == t for d, t in zip(int8_decisions, truth)])),
+        }
+    else:
+        # Unlabelled: each INT8 face should still pick its own FP32 embedding
+        own = np.argmax(int8_embeddings @ fp32_embeddings.T, axis=1)
+        report["match_decisions"] = {
+            "self_match_rate": float(np.mean(own == np.arange(len(faces)))),
+        }
+
+    return report
+
+
+def evaluate_yolo(image_set: list[tuple[str | None, str]], fp32_path: str, int8_path: str,
+                  iou_threshold: float = 0.5) -> dict:
+    """Compare FP32 and INT8 YOLO detections (box recall at IoU) and latency."""
+    fp32_session, int8_session = _create_session(fp32_path), _create_session(int8_path)
+    fp32_total = matched = int8_total = 0
+    fp32_latency, int8_latency = [], []
+
+    for _, path in image_set:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        fp32_faces, latency = _detect(fp32_session, image)
+        fp32_latency.append(latency)
+        int8_faces, latency = _detect(int8_session, image)
+        int8_latency.append(latency)
+
+        fp32_total += len(fp32_faces)
+        int8_total += len(int8_faces)
+        for ref in fp32_faces:
+            if any(_box_iou(ref[:4], cand[:4]) >= iou_threshold for cand in int8_faces):
+                matched += 1
+
+    return {
+        "images": len(fp32_latency),
+        "fp32_faces": fp32_total,
+        "int8_faces": int8_total,
+        "recall_vs_fp32": matched / fp32_total if fp32_total else 1.0,
+        "latency_ms_per_image": {
+            "fp32": float(np.mean(fp32_latency)) if fp32_latency else 0.0,
+            "int8": float(np.mean(int8_latency)) if int8_latency else 0.0,
+        },
+    }
+
+
+# ========== CLI ==========
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Quantize and evaluate INT8 face models")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    q = sub.add_parser("quantize", help="Produce an INT8 model")
+    q.add_argument("--model", choices=sorted(_MODELS), required=True)
+    q.add_argument("--mode", choices=["dynamic", "static"], default="static")
+    q.add_argument("--output", help="Output path (defaults to *_INT8_MODEL_PATH)")
+    q.add_argument("--calibration-dir", help="Representative photos for static mode")
+    q.add_argument("--calibration-limit", type=int, default=200)
+
+    e = sub.add_parser("evaluate", help="Compare FP32 and INT8 on a local image set")
+    e.add_argument("--images", required=True, help="Image folder (flat or one sub-folder per person)")
+    e.add_argument("--model", choices=["yolo", "arcface", "both"], default="both")
+    e.add_argument("--threshold", type=float, default=RECOGNITION_MATCH_THRESHOLD)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "quantize":
+        quantize_model(args.model, args.mode, args.output, args.calibration_dir, args.calibration_limit)
+        return 0
+
+    image_set = load_image_set(args.images)
+    for model in (["yolo", "arcface"] if args.model == "both" else [args.model]):
+        if not os.path.exists(_MODELS[model][1]):
+            parser.error(f"INT8 {model} model not found at {_MODELS[model][1]}; run quantize first")
+
+    report = {}
+    if args.model in ("yolo", "both"):
+        report["yolo"] = evaluate_yolo(image_set, YOLO_MODEL_PATH, YOLO_INT8_MODEL_PATH)
+    if args.model in ("arcface", "both"):
+        report["arcface"] = evaluate_arcface(image_set, ARCFACE_MODEL_PATH, ARCFACE_INT8_MODEL_PATH, args.threshold)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
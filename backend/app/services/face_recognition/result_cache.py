@@ -0,0 +1,311 @@
+"""
+Content-hash cache of per-image recognition work.
+Re-submitted photos (after a network error, or for the right session) skip
+decode, YOLO and ArcFace: the cache keeps each image's detections and
+embeddings, keyed by a hash of the image bytes and of the loaded models and
+detection settings. Matching always re-runs, so gallery and roster changes
+are picked up.
+
+An optional disk tier (RESULT_CACHE_DIR) survives restarts; it is wiped
+when the model fingerprint recorded next to it no longer matches.
+"""
+import os
+import json
+import glob
+import hashlib
+import threading
+import numpy as np
+import logging
+from collections import OrderedDict
+from app.utils.config import (
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_SIZE,
+    RESULT_CACHE_DIR,
+    RESULT_CACHE_DISK_MAX_ENTRIES,
+    FACE_DETECTION_THRESHOLD,
+    NMS_TOP_K,
+    YOLO_INPUT_SIZE,
+    YOLO_RECT_INPUT,
+    DETECTION_MODE,
+    EXPECTED_MIN_FACE_RATIO,
+    TILE_MIN_FACE_PX,
+    TILE_OVERLAP,
+    TILE_MAX_TILES,
+    DECODE_STRATEGY,
+    DECODE_DETECT_MIN_SIDE,
+    DECODE_MAX_PIXELS,
+    FACE_CROP_MIN_SIZE,
+    QUALITY_GATE_ENABLED,
+    QUALITY_MIN_FACE_SIZE,
+    QUALITY_MIN_SHARPNESS,
+    QUALITY_MIN_BRIGHTNESS,
+    QUALITY_MAX_BRIGHTNESS,
+    QUALITY_MAX_YAW,
+    CASCADE_ENABLED
+)
+from .models import get_model_fingerprint
+
+logger = logging.getLogger(__name__)
+
+_FINGERPRINT_FILE = "fingerprint"
+
+
+def _settings_signature() -> str:
+    """Settings that change which faces are detected or how they are cropped."""
+    settings = (
+        FACE_DETECTION_THRESHOLD, NMS_TOP_K, YOLO_INPUT_SIZE, YOLO_RECT_INPUT,
+        DETECTION_MODE, EXPECTED_MIN_FACE_RATIO, TILE_MIN_FACE_PX, TILE_OVERLAP, TILE_MAX_TILES,
+        DECODE_STRATEGY, DECODE_DETECT_MIN_SIDE, DECODE_MAX_PIXELS, FACE_CROP_MIN_SIZE,
+        QUALITY_GATE_ENABLED, QUALITY_MIN_FACE_SIZE, QUALITY_MIN_SHARPNESS,
+        QUALITY_MIN_BRIGHTNESS, QUALITY_MAX_BRIGHTNESS, QUALITY_MAX_YAW, CASCADE_ENABLED,
+    )
+    return repr(settings)
+
+
+def _stack(vectors: list[np.ndarray | None]) -> tuple[np.ndarray, np.ndarray]:
+    """(N, D) matrix of the vectors (zero rows for None) and the (N,) presence mask."""
+    present = np.array([v is not None for v in vectors], dtype=bool)
+    dim = next((len(v) for v in vectors if v is not None), 0)
+    matrix = np.zeros((len(vectors), dim), dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        if vector is not None:
+            matrix[i] = vector
+    return matrix, present
+
+
+class ResultCache:
+    """
+    Bounded LRU of per-image results with an optional disk tier.
+
+    Entries are {"faces": [face record], "quality_skips": {reason: count}},
+    where a face record holds "bbox", "detection_confidence", "embedding"
+    (ArcFace, None if the face was settled at cascade stage 1 or could not
+    be embedded) and "light_embedding" (None without the cascade).
+    """
+
+    def __init__(self, max_entries: int, disk_dir: str = "", max_disk_entries: int = 0):
+        self.max_entries = max(0, max_entries)
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max(0, max_disk_entries)
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._namespace = None
+        self._disk_entries = 0
+
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or bool(self.disk_dir)
+
+    def _ensure_namespace(self) -> str:
+        """Hash of models and settings; prepares the disk tier on first use."""
+        if self._namespace is None:
+            with self._lock:
+                if self._namespace is None:
+                    fingerprint = f"{get_model_fingerprint()}|{_settings_signature()}"
+                    if self.disk_dir:
+                        self._prepare_disk(fingerprint)
+                    self._namespace = hashlib.sha256(fingerprint.encode()).hexdigest()
+        return self._namespace
+
+    def _prepare_disk(self, fingerprint: str):
+        """Wipe the disk tier if it was written with other models or settings."""
+        os.makedirs(self.disk_dir, exist_ok=True)
+        marker = os.path.join(self.disk_dir, _FINGERPRINT_FILE)
+
+        previous = None
+        if os.path.exists(marker):
+            with open(marker) as f:
+                previous = f.read()
+
+        files = glob.glob(os.path.join(self.disk_dir, "*.npz"))
+        if previous != fingerprint:
+            for path in files:
+                os.remove(path)
+            if files:
+                logger.info(f"Models or detection settings changed, evicted {len(files)} disk cache entries")
+            with open(marker, "w") as f:
+                f.write(fingerprint)
+            files = []
+        self._disk_entries = len(files)
+
+    def key(self, image_bytes: bytes) -> str:
+        """Cache key of an upload: SHA-256 over the model namespace and the bytes (blocking)."""
+        sha = hashlib.sha256(self._ensure_namespace().encode())
+        sha.update(image_bytes)
+        return sha.hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        """Look an entry up in memory, then on disk (blocking)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry
+
+        entry = self._read_disk(key) if self.disk_dir else None
+        with self._lock:
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._disk_hits += 1
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, entry: dict):
+        """Store an entry in memory and, if configured, on disk (blocking)."""
+        faces = [
+            {
+                **face,
+                "embedding": None if face["embedding"] is None else np.asarray(face["embedding"], dtype=np.float32),
+                "light_embedding": None if face["light_embedding"] is None else np.asarray(face["light_embedding"], dtype=np.float32),
+            }
+            for face in entry["faces"]
+        ]
+        entry = {"faces": faces, "quality_skips": dict(entry["quality_skips"])}
+
+        with self._lock:
+            self._remember(key, entry)
+        if self.disk_dir:
+            self._write_disk(key, entry)
+
+    def record_stale(self):
+        """Count a hit that could not be reused (stage-1 decision no longer conclusive)."""
+        with self._lock:
+            self._stale += 1
+
+    def _remember(self, key: str, entry: dict):
+        """Insert into the memory tier, evicting least recently used entries (lock held)."""
+        if self.max_entries == 0:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def clear(self):
+        """Drop the memory tier (the disk tier is left as is)."""
+        with self._lock:
+            self._entries.clear()
+
+    # ========== DISK TIER ==========
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.npz")
+
+    def _read_disk(self, key: str) -> dict | None:
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                bboxes = data["bboxes"].tolist()
+                confidences = data["detection_confidences"].tolist()
+                embeddings, has_embedding = data["embeddings"], data["has_embedding"]
+                light, has_light = data["light_embeddings"], data["has_light_embedding"]
+                quality_skips = json.loads(str(data["quality_skips"]))
+            os.utime(path)  # Recently used files are evicted last
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Dropping unreadable result cache file {path}: {e}")
+            self._remove_disk(path)
+            return None
+
+        faces = [
+            {
+                "bbox": bbox,
+                "detection_confidence": confidence,
+                "embedding": embeddings[i] if has_embedding[i] else None,
+                "light_embedding": light[i] if has_light[i] else None,
+            }
+            for i, (bbox, confidence) in enumerate(zip(bboxes, confidences))
+        ]
+        return {"faces": faces, "quality_skips": quality_skips}
+
+    def _write_disk(self, key: str, entry: dict):
+        faces = entry["faces"]
+        embeddings, has_embedding = _stack([face["embedding"] for face in faces])
+        light, has_light = _stack([face["light_embedding"] for face in faces])
+
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    bboxes=np.array([face["bbox"] for face in faces], dtype=np.int64).reshape(-1, 4),
+                    detection_confidences=np.array([face["detection_confidence"] for face in faces], dtype=np.float64),
+                    embeddings=embeddings,
+                    has_embedding=has_embedding,
+                    light_embeddings=light,
+                    has_light_embedding=has_light,
+                    quality_skips=np.array(json.dumps(entry["quality_skips"]))
+                )
+            existed = os.path.exists(path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write result cache file {path}: {e}")
+            self._remove_disk(tmp_path)
+            return
+
+        with self._lock:
+            if not existed:
+                self._disk_entries += 1
+            over = self.max_disk_entries and self._disk_entries > self.max_disk_entries
+        if over:
+            self._trim_disk()
+
+    def _trim_disk(self):
+        """Remove the least recently used files down to 90% of the disk budget."""
+        files = glob.glob(os.path.join(self.disk_dir, "*.npz"))
+        files.sort(key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0)
+        target = int(self.max_disk_entries * 0.9)
+        removed = files[:max(0, len(files) - target)]
+        for path in removed:
+            self._remove_disk(path)
+        with self._lock:
+            self._disk_entries = len(files) - len(removed)
+            self._evictions += len(removed)
+
+    @staticmethod
+    def _remove_disk(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "stale_hits": self._stale,
+                "evictions": self._evictions,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "disk_dir": self.disk_dir or None,
+                "disk_entries": self._disk_entries if self.disk_dir else 0,
+            }
+
+
+_result_cache = ResultCache(
+    RESULT_CACHE_SIZE if RESULT_CACHE_ENABLED else 0,
+    RESULT_CACHE_DIR if RESULT_CACHE_ENABLED else "",
+    RESULT_CACHE_DISK_MAX_ENTRIES
+)
+
+
+def get_result_cache() -> ResultCache:
+    """Get the process-wide result cache."""
+    return _result_cache
@@ -0,0 +1,69 @@
+"""
+Tile planning for multi-scale face detection.
+Large photos are covered by overlapping tiles at (near) native scale, so
+back-row faces keep enough pixels for YOLO, plus one full-frame pass that
+catches faces too large to fit inside a tile.
+"""
+import math
+from app.utils.config import (
+    DETECTION_MODE,
+    EXPECTED_MIN_FACE_RATIO,
+    TILE_MIN_FACE_PX,
+    TILE_OVERLAP,
+    TILE_MAX_TILES
+)
+
+
+def _tile_starts(length: int, tile: int, overlap: int) -> list[int]:
+    """Evenly spaced tile offsets covering [0, length) with at least `overlap` shared pixels."""
+    if length <= tile:
+        return [0]
+    count = math.ceil((length - overlap) / (tile - overlap))
+    stride = (length - tile) / (count - 1)
+    return [round(i * stride) for i in range(count)]
+
+
+def plan_detection_regions(width: int, height: int, input_size: int, mode: str = DETECTION_MODE) -> list[tuple[int, int, int, int]]:
+    """
+    Regions of an image to run YOLO on.
+
+    Args:
+        width: Image width in pixels
+        height: Image height in pixels
+        input_size: YOLO input side length
+        mode: "full", "tiled" or "auto"
+
+    Returns:
+        List of (x, y, w, h) - the full frame first, then tiles (if any)
+    """
+    full_frame = (0, 0, width, height)
+    if mode == "full":
+        return [full_frame]
+
+    long_side = max(width, height)
+    face_px = EXPECTED_MIN_FACE_RATIO * long_side
+
+    # Full frame alone is enough when the smallest expected face survives the downscale
+    if mode == "auto" and face_px * input_size / long_side >= TILE_MIN_FACE_PX:
+        return [full_frame]
+
+    # Source pixels per tile so the smallest face reaches TILE_MIN_FACE_PX (never upscaled)
+    tile = max(input_size, round(input_size * face_px / TILE_MIN_FACE_PX))
+
+    while True:
+        if tile >= long_side:
+            return [full_frame]
+
+        # Faces smaller than the overlap are whole in some tile; larger ones are
+        # big enough for the full-frame pass
+        full_frame_min_face = TILE_MIN_FACE_PX * long_side / input_size
+        overlap = min(tile // 2, max(round(TILE_OVERLAP * tile), math.ceil(full_frame_min_face)))
+
+        xs = _tile_starts(width, tile, overlap)
+        ys = _tile_starts(height, tile, overlap)
+        if len(xs) * len(ys) <= TILE_MAX_TILES:
+            break
+        tile = round(tile * 1.25)  # too many tiles: trade resolution for count
+
+    tiles = [(x, y, min(tile, width), min(tile, height)) for y in ys for x in xs]
+    return [full_frame] + tiles
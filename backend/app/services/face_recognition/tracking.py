@@ -0,0 +1,209 @@
+"""
+Face tracking across video frames.
+Each face is followed by a constant-velocity Kalman filter on its box
+(centre, area, aspect ratio - as in SORT); detections of the next sampled
+frame are associated with the predicted boxes by IoU. A track remembers its
+best-quality crops, so a face seen in dozens of frames is embedded once.
+"""
+import heapq
+import itertools
+import numpy as np
+import logging
+from app.utils.config import VIDEO_TRACK_IOU_THRESHOLD, VIDEO_CROPS_PER_TRACK
+
+logger = logging.getLogger(__name__)
+
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of (N, 4) and (M, 4) [x1, y1, x2, y2] boxes -> (N, M)."""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+
+def _box_to_state(box) -> np.ndarray:
+    """[x1, y1, x2, y2] -> [cx, cy, area, aspect]."""
+    x1, y1, x2, y2 = box
+    w, h = max(x2 - x1, 1.0), max(y2 - y1, 1.0)
+    return np.array([x1 + w / 2, y1 + h / 2, w * h, w / h], dtype=np.float64)
+
+
+def _state_to_box(state: np.ndarray) -> np.ndarray:
+    cx, cy, area, aspect = state[:4]
+    w = np.sqrt(max(area, 1.0) * max(aspect, 1e-3))
+    h = max(area, 1.0) / w
+    return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], dtype=np.float32)
+
+
+class KalmanBoxFilter:
+    """
+    Constant-velocity Kalman filter over [cx, cy, area, aspect, vcx, vcy, varea].
+    Velocities are per video frame, so predictions stay right when the
+    sampling interval changes.
+    """
+
+    # Measurement noise: area and aspect are noisier than the centre
+    _R = np.diag([1.0, 1.0, 10.0, 10.0])
+    # Per-frame process noise: velocities drift slowly, area velocity slowest
+    _Q = np.diag([1.0, 1.0, 1.0, 1e-2, 1e-2, 1e-2, 1e-4])
+    _H = np.eye(4, 7)
+
+    def __init__(self, box):
+        self.x = np.zeros(7)
+        self.x[:4] = _box_to_state(box)
+        # Unknown initial velocity: large uncertainty
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 1e4, 1e4, 1e4])
+
+    def predict(self, frames: int) -> np.ndarray:
+        """Advance the state by `frames` video frames; returns the predicted box."""
+        if frames > 0:
+            F = np.eye(7)
+            F[0, 4] = F[1, 5] = F[2, 6] = frames
+            # Do not let the area shrink through zero
+            if self.x[2] + self.x[6] * frames <= 0:
+                self.x[6] = 0.0
+            self.x = F @ self.x
+            self.P = F @ self.P @ F.T + self._Q * frames
+        return _state_to_box(self.x)
+
+    def update(self, box):
+        z = _box_to_state(box)
+        y = z - self._H @ self.x
+        S = self._H @ self.P @ self._H.T + self._R
+        K = self.P @ self._H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(7) - K @ self._H) @ self.P
+
+    def box(self) -> np.ndarray:
+        return _state_to_box(self.x)
+
+
+class FaceTrack:
+    """
+    One face followed across frames.
+
+    Args:
+        track_id: Id unique within the tracker
+        frame: Frame index of the first detection
+        box: First [x1, y1, x2, y2]
+        max_crops: Best-quality crops to keep
+    """
+
+    def __init__(self, track_id: int, frame: int, box, max_crops: int):
+        self.track_id = track_id
+        self.filter = KalmanBoxFilter(box)
+        self.first_frame = frame
+        self.last_frame = frame
+        self.predicted_frame = frame
+        self.hits = 0
+        self.max_crops = max(1, max_crops)
+        self._crops = []  # min-heap of (score, seq, face tuple)
+        self._seq = itertools.count()
+
+    def predict(self, frame: int) -> np.ndarray:
+        box = self.filter.predict(frame - self.predicted_frame)
+        self.predicted_frame = frame
+        return box
+
+    def add(self, frame: int, face: tuple, score: float | None):
+        """
+        Record a detection of this track.
+
+        Args:
+            frame: Frame index of the detection
+            face: (x1, y1, x2, y2, confidence, face_crop[, landmarks])
+            score: Quality score, or None if the crop is unusable for recognition
+        """
+        # The first detection initialised the filter
+        if self.hits > 0:
+            self.filter.update(face[:4])
+        self.last_frame = frame
+        self.hits += 1
+        if score is None or (len(self._crops) >= self.max_crops and score <= self._crops[0][0]):
+            return
+
+        # Crops are views into the frame; keep a copy so the frame can be freed
+        x1, y1, x2, y2, conf, crop, *rest = face
+        entry = (score, next(self._seq), (x1, y1, x2, y2, conf, crop.copy(), *rest))
+        if len(self._crops) < self.max_crops:
+            heapq.heappush(self._crops, entry)
+        else:
+            heapq.heapreplace(self._crops, entry)
+
+    def best_faces(self) -> list[tuple]:
+        """Kept face tuples, best first."""
+        return [face for _, _, face in sorted(self._crops, key=lambda entry: -entry[0])]
+
+    def best_score(self) -> float:
+        return max((score for score, _, _ in self._crops), default=0.0)
+
+
+class FaceTracker:
+    """
+    IoU tracker with Kalman-predicted boxes.
+    Detections are greedily matched to the predicted box they overlap most;
+    unmatched detections start new tracks and tracks unseen for more than
+    `max_gap` frames are closed.
+
+    Args:
+        max_gap: Frames a track may go undetected before it is closed
+        iou_threshold: Minimum IoU between a prediction and a detection
+        max_crops: Best-quality crops kept per track
+    """
+
+    def __init__(self, max_gap: int, iou_threshold: float = VIDEO_TRACK_IOU_THRESHOLD, max_crops: int = VIDEO_CROPS_PER_TRACK):
+        self.max_gap = max(1, max_gap)
+        self.iou_threshold = iou_threshold
+        self.max_crops = max_crops
+        self._active = []
+        self._closed = []
+        self._ids = itertools.count()
+
+    def update(self, frame: int, faces: list[tuple], scores: list[float | None]):
+        """
+        Feed the detections of one sampled frame (frames in increasing order).
+
+        Args:
+            frame: Frame index
+            faces: Detections (x1, y1, x2, y2, confidence, face_crop[, landmarks])
+            scores: Quality score per detection, None for crops unusable for recognition
+        """
+        # Close tracks that have been missing too long
+        still_active = []
+        for track in self._active:
+            (still_active if frame - track.last_frame <= self.max_gap else self._closed).append(track)
+        self._active = still_active
+
+        predicted = np.array([track.predict(frame) for track in self._active], dtype=np.float32).reshape(-1, 4)
+        detected = np.array([face[:4] for face in faces], dtype=np.float32).reshape(-1, 4)
+        ious = iou_matrix(predicted, detected)
+
+        # Greedy association, highest overlap first
+        matched_tracks, matched_faces = set(), set()
+        for t, d in zip(*np.unravel_index(np.argsort(-ious, axis=None), ious.shape)):
+            if ious[t, d] < self.iou_threshold:
+                break
+            if t in matched_tracks or d in matched_faces:
+                continue
+            matched_tracks.add(t)
+            matched_faces.add(d)
+            self._active[t].add(frame, faces[d], scores[d])
+
+        for d, face in enumerate(faces):
+            if d not in matched_faces:
+                track = FaceTrack(next(self._ids), frame, face[:4], self.max_crops)
+                track.add(frame, face, scores[d])
+                self._active.append(track)
+
+    def finish(self) -> list[FaceTrack]:
+        """Close every track; returns all tracks in creation order."""
+        tracks = self._closed + self._active
+        self._active, self._closed = [], []
+        return sorted(tracks, key=lambda track: track.track_id)
@@ -0,0 +1,163 @@
+"""
+Face tracks from a video file.
+Frames are sampled adaptively: densely while the camera pans (so the IoU
+tracker can still link a face between samples) and sparsely while it is
+still. Skipped frames are only grabbed, never decoded. Sampled frames are
+detected in YOLO batches and fed to the tracker in order.
+"""
+import math
+import time
+import cv2
+import numpy as np
+import logging
+from app.utils.config import (
+    QUALITY_GATE_ENABLED,
+    YOLO_MAX_BATCH_SIZE,
+    VIDEO_MAX_DURATION_SECONDS,
+    VIDEO_MIN_SAMPLE_FPS,
+    VIDEO_MAX_SAMPLE_FPS,
+    VIDEO_TRACK_MAX_GAP_SECONDS,
+    VIDEO_MIN_TRACK_HITS
+)
+from .process_backend import process_backend_enabled, detect_faces_in_workers
+from .quality import assess_face, face_quality_score, get_quality_stats
+from .tracking import FaceTracker
+from .yolo_detector import detect_multiple_faces_batch
+
+logger = logging.getLogger(__name__)
+
+# Mean absolute difference (0-1) between consecutive sampled thumbnails
+# above which sampling gets denser, and below which it gets sparser
+_MOTION_HIGH = 0.08
+_MOTION_LOW = 0.02
+_THUMB_SIZE = (64, 36)
+
+# Assumed when the container does not report a frame rate
+_DEFAULT_FPS = 30.0
+
+
+def _thumbnail(frame: np.ndarray) -> np.ndarray:
+    gray = cv2.cvtColor(cv2.resize(frame, _THUMB_SIZE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    return gray.astype(np.float32) / 255
+
+
+def _score_faces(faces: list[tuple], quality_skips: dict) -> list[float | None]:
+    """Quality score per face; None (and a counted skip) for faces failing the quality gate."""
+    scores = []
+    for face in faces:
+        landmarks = face[6] if len(face) > 6 else None
+        reason = assess_face(face[5], landmarks) if QUALITY_GATE_ENABLED else None
+        if reason is None:
+            scores.append(face_quality_score(face[5], face[4], landmarks))
+        else:
+            quality_skips[reason] = quality_skips.get(reason, 0) + 1
+            scores.append(None)
+    return scores
+
+
+def track_faces_in_video(path: str) -> dict | None:
+    """
+    Detect and track faces through a video file (blocking).
+
+    Args:
+        path: Video file readable by OpenCV
+
+    Returns:
+        None if no frame of the video can be read, else {
+            "tracks": FaceTrack list (tracks seen in fewer than
+                VIDEO_MIN_TRACK_HITS samples are dropped),
+            "tracks_dropped": number of such short tracks,
+            "fps", "frames_read", "frames_sampled", "duration_seconds",
+            "truncated": whether frames beyond VIDEO_MAX_DURATION_SECONDS were ignored,
+            "quality_skips": {reason: detections rejected by the quality gate}
+        }
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        return None
+
+    started = time.perf_counter()
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        if not fps or math.isnan(fps) or fps <= 0:
+            fps = _DEFAULT_FPS
+        max_frames = int(VIDEO_MAX_DURATION_SECONDS * fps)
+
+        # Sampling interval in frames, adapted between these bounds
+        min_step = max(1, round(fps / VIDEO_MAX_SAMPLE_FPS))
+        max_step = max(min_step, round(fps / VIDEO_MIN_SAMPLE_FPS))
+        step = min_step
+
+        detect = detect_faces_in_workers if process_backend_enabled() else detect_multiple_faces_batch
+        tracker = FaceTracker(max_gap=max(1, round(VIDEO_TRACK_MAX_GAP_SECONDS * fps)))
+        quality_skips = {}
+        sampled = 0
+        checked = 0
+
+        def flush(batch: list[tuple[int, np.ndarray]]):
+            nonlocal checked
+            faces_per_frame = detect([frame for _, frame in batch], with_landmarks=True)
+            for (index, _), faces in zip(batch, faces_per_frame):
+                checked += len(faces)
+                tracker.update(index, faces, _score_faces(faces, quality_skips))
+            batch.clear()
+
+        batch = []
+        previous = None
+        index = -1
+        next_sample = 0
+        truncated = False
+        while True:
+            if index + 1 >= max_frames:
+                truncated = capture.grab()
+                break
+            if not capture.grab():
+                break
+            index += 1
+            if index < next_sample:
+                continue
+            ok, frame = capture.retrieve()
+            if not ok or frame is None:
+                continue
+
+            # OPTIMIZATION: Sample densely only while the view is moving
+            thumb = _thumbnail(frame)
+            if previous is not None:
+                motion = float(np.mean(np.abs(thumb - previous)))
+                if motion > _MOTION_HIGH:
+                    step = max(min_step, step // 2)
+                elif motion < _MOTION_LOW:
+                    step = min(max_step, step * 2)
+            previous = thumb
+            next_sample = index + step
+
+            sampled += 1
+            batch.append((index, frame))
+            if len(batch) >= YOLO_MAX_BATCH_SIZE:
+                flush(batch)
+        if batch:
+            flush(batch)
+    finally:
+        capture.release()
+
+    if index < 0:
+        return None
+    if checked and QUALITY_GATE_ENABLED:
+        get_quality_stats().record(checked, quality_skips)
+
+    tracks = tracker.finish()
+    kept = [track for track in tracks if track.hits >= min(VIDEO_MIN_TRACK_HITS, sampled)]
+    logger.info(
+        f"Tracked {len(kept)} faces ({len(tracks) - len(kept)} short tracks dropped) over "
+        f"{sampled} of {index + 1} frames in {time.perf_counter() - started:.2f}s"
+    )
+    return {
+        "tracks": kept,
+        "tracks_dropped": len(tracks) - len(kept),
+        "fps": fps,
+        "frames_read": index + 1,
+        "frames_sampled": sampled,
+        "duration_seconds": (index + 1) / fps,
+        "truncated": truncated,
+        "quality_skips": quality_skips,
+    }
@@ -0,0 +1,78 @@
+"""
+Eager model warm-up.
+Loads both session pools, inspects the YOLO output format and pushes dummy
+tensors of real shapes through every session, so the first request of the
+day does not pay model load and ORT first-run allocation costs.
+"""
+import time
+import numpy as np
+import logging
+from app.utils.config import EMBED_BATCH_MAX_SIZE
+from .models import (
+    get_yolo_pool,
+    get_yolo_input_name,
+    get_yolo_input_size,
+    get_yolo_batch_size,
+    get_yolo_output_format,
+    inspect_yolo_model,
+    get_arcface_pool,
+    get_arcface_input_name,
+    get_arcface_input_size
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _warm_pool(pool, input_name: str, shapes: list[tuple]) -> int:
+    """Run one dummy inference per shape on every session of a pool."""
+    runs = 0
+    for session in pool.sessions:
+        for shape in shapes:
+            session.run(None, {input_name: np.zeros(shape, dtype=np.float32)})
+            runs += 1
+    return runs
+
+
+def warm_up_models() -> dict:
+    """
+    Load and warm up YOLO and ArcFace (blocking).
+
+    Returns:
+        Report with per-phase timings in seconds
+    """
+    report = {}
+    started = time.perf_counter()
+
+    # YOLO: load, inspect output format, dummy detection batch
+    phase = time.perf_counter()
+    yolo_pool = get_yolo_pool()
+    report["yolo_load_seconds"] = time.perf_counter() - phase
+
+    if get_yolo_output_format() is None:
+        inspect_yolo_model()
+
+    phase = time.perf_counter()
+    size = get_yolo_input_size()
+    yolo_shapes = [(get_yolo_batch_size() or 1, 3, size, size)]
+    report["yolo_warmup_runs"] = _warm_pool(yolo_pool, get_yolo_input_name(), yolo_shapes)
+    report["yolo_warmup_seconds"] = time.perf_counter() - phase
+
+    # ArcFace: load, dummy single-face and typical micro-batch
+    phase = time.perf_counter()
+    arcface_pool = get_arcface_pool()
+    report["arcface_load_seconds"] = time.perf_counter() - phase
+
+    phase = time.perf_counter()
+    size = get_arcface_input_size()
+    fixed_batch = arcface_pool.primary.get_inputs()[0].shape[0]
+    if isinstance(fixed_batch, int) and fixed_batch > 0:
+        batch_sizes = [fixed_batch]
+    else:
+        batch_sizes = sorted({1, min(8, EMBED_BATCH_MAX_SIZE)})
+    arcface_shapes = [(n, 3, size, size) for n in batch_sizes]
+    report["arcface_warmup_runs"] = _warm_pool(arcface_pool, get_arcface_input_name(), arcface_shapes)
+    report["arcface_warmup_seconds"] = time.perf_counter() - phase
+
+    report["total_seconds"] = time.perf_counter() - started
+    logger.info(f"Model warm-up finished in {report['total_seconds']:.2f}s: {report}")
+    return report
@@ -5,35 +5,40 @@ Handles face detection, bounding box parsing, and NMS.
 import cv2
 import numpy as np
 import logging
-from app.utils.config import FACE_DETECTION_THRESHOLD
+from app.utils.config import FACE_DETECTION_THRESHOLD, YOLO_MAX_BATCH_SIZE, DETECTION_MODE
 from .models import (
-    get_yolo_session,
+    get_yolo_pool,
     get_yolo_input_name,
     get_yolo_input_size,
+    get_yolo_batch_size,
     get_yolo_output_format,
     inspect_yolo_model
 )
-from .nms import apply_nms
-from .preprocessors import preprocess_for_yolo
+from .nms import apply_nms, batched_nms, merge_tiled_detections
+from .preprocessors import preprocess_for_yolo, preprocess_for_yolo_batch
+from .tiling import plan_detection_regions
 
 logger = logging.getLogger(__name__)
 
 
-def _parse_yolo_output(outputs, orig_width, orig_height):
+def _parse_yolo_output(outputs, transform, batch_index=0):
     """
     Parse YOLO ONNX output and convert to standardized format.
     Handles multiple YOLOv8 export formats.
 
     Args:
         outputs: raw ONNX session output
-        orig_width: original image width
-        orig_height: original image height
+        transform: (scale, (pad_x, pad_y)) of the letterboxed input
+        batch_index: which image of a batched output to parse
 
     Returns:
         boxes: numpy array of shape (N, 4) with [x1, y1, x2, y2] in original image coords
         scores: numpy array of shape (N,) with confidence scores
+        keypoints: numpy array of shape (N, 5, 2) with facial landmarks (eyes,
+            nose, mouth corners) in original image coords, or None if the
+            model does not output them
     """
-    model_input_size = get_yolo_input_size()
+    keypoints = None
 
     # Handle different output formats
     if len(outputs) == 1:
@@ -44,10 +49,11 @@ def _parse_yolo_output(outputs, orig_width, orig_height):
         # (1, N, 5+classes) - batch, predictions, [cx, cy, w, h, conf, ...]
         # (N, 5+classes)    - predictions, [cx, cy, w, h, conf, ...]
         # (1, 5+classes, N) - batch, features, predictions (transposed)
+        # YOLOv8-face pose exports add 5 keypoints as (x, y, visibility) -> 20 features
 
-        # Remove batch dimension if present
+        # Select this image from the batch dimension if present
         if len(pred.shape) == 3:
-            pred = pred[0]
+            pred = pred[batch_index]
 
         # Transpose if needed: (features, N) -> (N, features)
         if pred.shape[0] < pred.shape[1] and pred.shape[0] < 100:
@@ -67,47 +73,126 @@ def _parse_yolo_output(outputs, orig_width, orig_height):
         # Don't multiply by class scores as class is always 1.0
         scores = confidence
 
-        # Convert from cx,cy,w,h (normalized to model_input_size) to x1,y1,x2,y2 (original image)
+        # Convert from cx,cy,w,h to x1,y1,x2,y2 (model input coords)
         cx = boxes_cxcywh[:, 0]
         cy = boxes_cxcywh[:, 1]
         w = boxes_cxcywh[:, 2]
         h = boxes_cxcywh[:, 3]
 
-        # Use dynamic scaling based on actual model input size
-        scale_x = orig_width / float(model_input_size)
-        scale_y = orig_height / float(model_input_size)
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
 
-        x1 = (cx - w / 2) * scale_x
-        y1 = (cy - h / 2) * scale_y
-        x2 = (cx + w / 2) * scale_x
-        y2 = (cy + h / 2) * scale_y
-
-        boxes = np.stack([x1, y1, x2, y2], axis=1)
+        if pred.shape[1] >= 20:
+            keypoints = pred[:, 5:20].reshape(-1, 5, 3)[:, :, :2].astype(np.float32)
 
     elif len(outputs) == 2:
         # Dual output - boxes and scores separate
         boxes_out = outputs[0]
         scores_out = outputs[1]
 
-        # Remove batch dimensions
+        # Select this image from the batch dimensions
         if len(boxes_out.shape) == 3:
-            boxes_out = boxes_out[0]
+            boxes_out = boxes_out[batch_index]
         if len(scores_out.shape) == 3:
-            scores_out = scores_out[0]
+            scores_out = scores_out[batch_index]
 
-        # Convert and scale boxes
         boxes = boxes_out.copy()
         scores = scores_out.flatten() if scores_out.ndim > 1 else scores_out
-
-        # Use dynamic scaling
-        scale_x = orig_width / float(model_input_size)
-        scale_y = orig_height / float(model_input_size)
-        boxes[:, [0, 2]] *= scale_x
-        boxes[:, [1, 3]] *= scale_y
     else:
         raise ValueError(f"Unsupported YOLO output format: {len(outputs)} outputs")
 
-    return boxes, scores
+    # Map boxes from model input coords back to the original image
+    boxes = boxes.astype(np.float32, copy=True)
+    # Exact inverse of the letterbox: one uniform scale plus padding offset
+    scale, (pad_x, pad_y) = transform
+    boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad_x) / scale
+    boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad_y) / scale
+    if keypoints is not None:
+        keypoints = (keypoints - np.array([pad_x, pad_y], dtype=np.float32)) / scale
+
+    return boxes, scores, keypoints
+
+
+def _faces_from_detections(
+    image: np.ndarray,
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    keypoints: np.ndarray | None = None,
+    with_landmarks: bool = False
+) -> list[tuple]:
+    """
+    Threshold, NMS and crop parsed detections for one image.
+
+    Args:
+        image: Original image in BGR format
+        boxes: numpy array of shape (N, 4) with [x1, y1, x2, y2] in image coords
+        scores: numpy array of shape (N,) with confidence scores
+        keypoints: Optional (N, 5, 2) landmarks in image coords
+        with_landmarks: Append each face's (5, 2) landmarks (or None)
+
+    Returns:
+        List of (x1, y1, x2, y2, confidence, face_crop[, landmarks])
+    """
+    # Filter by confidence threshold
+    mask = scores >= FACE_DETECTION_THRESHOLD
+    boxes = boxes[mask]
+    scores = scores[mask]
+    if keypoints is not None:
+        keypoints = keypoints[mask]
+
+    if len(boxes) == 0:
+        return []
+
+    # Apply NMS to remove duplicate detections
+    keep_indices = apply_nms(boxes, scores, iou_threshold=0.45)
+
+    if len(keep_indices) == 0:
+        return []
+
+    # Build result list
+    faces = _crop_faces(
+        image, boxes[keep_indices], scores[keep_indices],
+        keypoints[keep_indices] if keypoints is not None else None, with_landmarks
+    )
+
+    logger.info(f"Detected {len(faces)} faces after NMS (from {len(boxes)} raw detections)")
+
+    return faces
+
+
+def _crop_faces(
+    image: np.ndarray,
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    keypoints: np.ndarray | None = None,
+    with_landmarks: bool = False
+) -> list[tuple]:
+    """Clamp kept boxes to the image and crop them into (x1, y1, x2, y2, confidence, face_crop[, landmarks])."""
+    h, w = image.shape[:2]
+
+    faces = []
+    for i, ((x1, y1, x2, y2), score) in enumerate(zip(boxes, scores)):
+        # Convert to integers and clamp to image boundaries
+        x1 = int(max(0, min(x1, w - 1)))
+        y1 = int(max(0, min(y1, h - 1)))
+        x2 = int(max(0, min(x2, w)))
+        y2 = int(max(0, min(y2, h)))
+
+        # Ensure valid box
+        if x2 <= x1 or y2 <= y1:
+            continue
+
+        face_crop = image[y1:y2, x1:x2]
+
+        # Skip if crop is empty
+        if face_crop.size == 0:
+            continue
+
+        if with_landmarks:
+            faces.append((x1, y1, x2, y2, float(score), face_crop, keypoints[i] if keypoints is not None else None))
+        else:
+            faces.append((x1, y1, x2, y2, float(score), face_crop))
+
+    return faces
 
 
 def detect_single_face(image: np.ndarray) -> np.ndarray | None:
@@ -124,13 +209,13 @@ def detect_single_face(image: np.ndarray) -> np.ndarray | None:
         Cropped face image or None
     """
     h, w = image.shape[:2]
-    preprocessed = preprocess_for_yolo(image)
+    preprocessed, transform = preprocess_for_yolo(image)
 
-    yolo_session = get_yolo_session()
+    yolo_pool = get_yolo_pool()
     input_name = get_yolo_input_name()
 
     # Run inference
-    raw_outputs = yolo_session.run(None, {input_name: preprocessed})
+    raw_outputs = yolo_pool.run(None, {input_name: preprocessed})
 
     # Inspect model on first run
     if get_yolo_output_format() is None:
@@ -138,7 +223,7 @@ def detect_single_face(image: np.ndarray) -> np.ndarray | None:
 
     # Parse outputs to standardized format
     try:
-        boxes, scores = _parse_yolo_output(raw_outputs, w, h)
+        boxes, scores, _ = _parse_yolo_output(raw_outputs, transform)
     except Exception as e:
         logger.error(f"Failed to parse YOLO output: {e}")
         return None
@@ -180,7 +265,7 @@ def detect_single_face(image: np.ndarray) -> np.ndarray | None:
     return face_crop
 
 
-def detect_multiple_faces(image: np.ndarray) -> list[tuple]:
+def detect_multiple_faces(image: np.ndarray, with_landmarks: bool = False) -> list[tuple]:
     """
     Detect multiple faces in image (for classroom attendance).
     Returns list of (x1, y1, x2, y2, confidence, face_crop).
@@ -189,18 +274,25 @@ def detect_multiple_faces(image: np.ndarray) -> list[tuple]:
 
     Args:
         image: Input image in BGR format
+        with_landmarks: Append a 7th element with the face's (5, 2) landmarks
+            (None when the model has no keypoint output)
 
     Returns:
         List of tuples containing bounding box, confidence, and face crop
     """
     h, w = image.shape[:2]
-    preprocessed = preprocess_for_yolo(image)
 
-    yolo_session = get_yolo_session()
+    # Large photos in tiled/auto mode go through the tiled batch path
+    if DETECTION_MODE != "full" and len(plan_detection_regions(w, h, get_yolo_input_size())) > 1:
+        return detect_multiple_faces_batch([image], with_landmarks)[0]
+
+    preprocessed, transform = preprocess_for_yolo(image)
+
+    yolo_pool = get_yolo_pool()
     input_name = get_yolo_input_name()
 
     # Run inference
-    raw_outputs = yolo_session.run(None, {input_name: preprocessed})
+    raw_outputs = yolo_pool.run(None, {input_name: preprocessed})
 
     # Inspect model on first run
     if get_yolo_output_format() is None:
@@ -208,49 +300,152 @@ def detect_multiple_faces(image: np.ndarray) -> list[tuple]:
 
     # Parse outputs to standardized format
     try:
-        boxes, scores = _parse_yolo_output(raw_outputs, w, h)
+        boxes, scores, keypoints = _parse_yolo_output(raw_outputs, transform)
     except Exception as e:
         logger.error(f"Failed to parse YOLO output: {e}")
         return []
 
-    # Filter by confidence threshold
-    mask = scores >= FACE_DETECTION_THRESHOLD
-    boxes = boxes[mask]
-    scores = scores[mask]
+    return _faces_from_detections(image, boxes, scores, keypoints, with_landmarks)
 
-    if len(boxes) == 0:
-        return []
 
-    # Apply NMS to remove duplicate detections
-    keep_indices = apply_nms(boxes, scores, iou_threshold=0.45)
+def _yolo_chunk_size(num_images: int) -> int:
+    """Images per YOLO run: the exported batch size if fixed, else the configured cap."""
+    fixed = get_yolo_batch_size()
+    if fixed is not None:
+        return fixed
+    return max(1, min(num_images, YOLO_MAX_BATCH_SIZE))
 
-    if len(keep_indices) == 0:
-        return []
 
-    # Build result list
-    faces = []
-    for idx in keep_indices:
-        x1, y1, x2, y2 = boxes[idx]
-        score = scores[idx]
+def _detect_regions_batch(regions: list[np.ndarray]) -> list[tuple[np.ndarray, np.ndarray, np.ndarray | None]]:
+    """
+    Run YOLO over image regions in batched, letterboxed chunks.
 
-        # Convert to integers and clamp to image boundaries
-        x1 = int(max(0, min(x1, w - 1)))
-        y1 = int(max(0, min(y1, h - 1)))
-        x2 = int(max(0, min(x2, w)))
-        y2 = int(max(0, min(y2, h)))
+    Returns:
+        (boxes, scores, keypoints) per region, in region coords
+    """
+    yolo_pool = get_yolo_pool()
+    input_name = get_yolo_input_name()
+    chunk_size = _yolo_chunk_size(len(regions))
 
-        # Ensure valid box
-        if x2 <= x1 or y2 <= y1:
-            continue
+    results = []
+    for start in range(0, len(regions), chunk_size):
+        chunk = regions[start:start + chunk_size]
+        # Fixed-batch models need exactly chunk_size inputs (zero-padded in place)
+        batch, transforms = preprocess_for_yolo_batch(chunk, batch_size=get_yolo_batch_size())
 
-        face_crop = image[y1:y2, x1:x2]
+        raw_outputs = yolo_pool.run(None, {input_name: batch})
 
-        # Skip if crop is empty
-        if face_crop.size == 0:
-            continue
+        # Inspect model on first run
+        if get_yolo_output_format() is None:
+            inspect_yolo_model()
 
-        faces.append((x1, y1, x2, y2, float(score), face_crop))
+        for i, transform in enumerate(transforms):
+            try:
+                results.append(_parse_yolo_output(raw_outputs, transform, batch_index=i))
+            except Exception as e:
+                logger.error(f"Failed to parse YOLO output: {e}")
+                results.append((np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32), None))
 
-    logger.info(f"Detected {len(faces)} faces after NMS (from {len(boxes)} raw detections)")
+    logger.info(f"Ran YOLO on {len(regions)} regions ({chunk_size} per run)")
+    return results
 
-    return faces
+
+def _drop_tile_border_boxes(boxes: np.ndarray, region: tuple, width: int, height: int, margin: int = 2) -> np.ndarray:
+    """
+    Mask of tile detections not touching an interior tile border.
+    Faces cut by a border are whole in a neighbouring tile (or big enough
+    for the full-frame pass), so their truncated boxes are discarded.
+    """
+    x, y, w, h = region
+    keep = np.ones(len(boxes), dtype=bool)
+    if x > 0:
+        keep &= boxes[:, 0] > margin
+    if y > 0:
+        keep &= boxes[:, 1] > margin
+    if x + w < width:
+        keep &= boxes[:, 2] < w - margin
+    if y + h < height:
+        keep &= boxes[:, 3] < h - margin
+    return keep
+
+
+def detect_multiple_faces_batch(images: list[np.ndarray], with_landmarks: bool = False) -> list[list[tuple]]:
+    """
+    Detect faces in several images with batched YOLO inference.
+    Images are letterboxed into one (N, 3, S, S) tensor per run; models
+    exported with a fixed batch size are fed in zero-padded chunks.
+
+    In tiled/auto detection mode, large images are also split into
+    overlapping native-scale tiles (see tiling.py). Tiles of all images share
+    the batched runs and their detections are merged with cross-tile NMS.
+
+    Args:
+        images: List of images in BGR format (any sizes)
+        with_landmarks: Append each face's (5, 2) landmarks (or None) as a 7th element
+
+    Returns:
+        One list of (x1, y1, x2, y2, confidence, face_crop) per input image
+    """
+    if len(images) == 0:
+        return []
+
+    input_size = get_yolo_input_size()
+    plans = [plan_detection_regions(image.shape[1], image.shape[0], input_size) for image in images]
+    regions = [image[y:y + h, x:x + w] for image, plan in zip(images, plans) for x, y, w, h in plan]
+
+    detections = iter(_detect_regions_batch(regions))
+
+    # Gather every image's detections (tile boxes shifted into image coords)
+    boxes_per_image, scores_per_image, keypoints_per_image = [], [], []
+    for image, plan in zip(images, plans):
+        height, width = image.shape[:2]
+        image_boxes, image_scores, image_keypoints = [], [], []
+        for region in plan:
+            boxes, scores, keypoints = next(detections)
+            if region[2:] != (width, height):
+                keep = _drop_tile_border_boxes(boxes, region, width, height)
+                boxes = boxes[keep] + np.array([region[0], region[1], region[0], region[1]], dtype=np.float32)
+                scores = scores[keep]
+                if keypoints is not None:
+                    keypoints = keypoints[keep] + np.array([region[0], region[1]], dtype=np.float32)
+            image_boxes.append(boxes)
+            image_scores.append(scores)
+            image_keypoints.append(keypoints)
+        boxes_per_image.append(np.concatenate(image_boxes))
+        scores_per_image.append(np.concatenate(image_scores))
+        keypoints_per_image.append(
+            np.concatenate(image_keypoints) if all(k is not None for k in image_keypoints) else None
+        )
+
+    # OPTIMIZATION: One batched NMS call over all images (greedy pass per image);
+    # tiled images additionally get cross-tile containment merging
+    all_boxes = np.concatenate(boxes_per_image)
+    all_scores = np.concatenate(scores_per_image)
+    all_keypoints = None
+    if all(k is not None for k in keypoints_per_image):
+        all_keypoints = np.concatenate(keypoints_per_image)
+    image_ids = np.repeat(np.arange(len(images)), [len(b) for b in boxes_per_image])
+    tiled = np.repeat([len(plan) > 1 for plan in plans], [len(b) for b in boxes_per_image])
+
+    plain_rows = np.flatnonzero(~tiled)
+    tiled_rows = np.flatnonzero(tiled)
+    kept = np.concatenate([
+        plain_rows[batched_nms(all_boxes[plain_rows], all_scores[plain_rows], image_ids[plain_rows], iou_threshold=0.45)],
+        tiled_rows[merge_tiled_detections(all_boxes[tiled_rows], all_scores[tiled_rows], iou_threshold=0.45, group_ids=image_ids[tiled_rows])],
+    ]).astype(np.int64)
+    kept = kept[np.argsort(-all_scores[kept], kind="stable")]
+
+    results = []
+    for i, image in enumerate(images):
+        rows = kept[image_ids[kept] == i]
+        results.append(_crop_faces(
+            image, all_boxes[rows], all_scores[rows],
+            all_keypoints[rows] if all_keypoints is not None else None, with_landmarks
+        ))
+
+    logger.info(
+        f"Batch detected {sum(len(faces) for faces in results)} faces in {len(images)} images "
+        f"({len(regions)} YOLO regions, {len(all_boxes)} raw detections)"
+    )
+
+    return results
@@ -0,0 +1,232 @@
+"""
+Process-resident face gallery backed by the student_embeddings collection.
+Loaded once on first use and kept in sync by enrollment and deletion.
+Large galleries get an IVF index whose centroids are persisted to disk.
+When the recognition cascade is enabled, a parallel gallery of light-model
+embeddings is kept alongside the ArcFace one.
+"""
+import asyncio
+import math
+import logging
+from app.database.connection import student_embedding_collection
+from app.services.face_recognition.ann_index import IVFFlatIndex
+from app.services.face_recognition.gallery import FaceGallery
+from app.utils.config import (
+    CASCADE_ENABLED,
+    CLASS_GALLERY_CACHE_SIZE,
+    ANN_ENABLED,
+    ANN_MIN_GALLERY_SIZE,
+    ANN_NLIST,
+    ANN_NPROBE,
+    ANN_RETRAIN_GROWTH,
+    ANN_INDEX_PATH
+)
+
+logger = logging.getLogger(__name__)
+
+_gallery = FaceGallery()
+_gallery_loaded = False
+_gallery_lock = asyncio.Lock()
+_ann_training = False
+
+# Light-model embeddings for cascade stage 1 (only students enrolled with one)
+_light_gallery = FaceGallery()
+
+# class_id -> (gallery versions, roster, sub-gallery, light sub-gallery or None)
+_class_galleries: dict[str, tuple[tuple[int, int], frozenset, FaceGallery, FaceGallery | None]] = {}
+
+# (gallery version, light gallery version) -> light gallery covers every student
+_school_light_coverage: tuple[tuple[int, int], bool] | None = None
+
+
+async def _load_gallery_from_db():
+    """Read every stored embedding into the in-memory gallery."""
+    student_ids = []
+    embeddings = []
+    light_ids = []
+    light_embeddings = []
+
+    projection = {"student_id": 1, "embedding": 1}
+    if CASCADE_ENABLED:
+        projection["light_embedding"] = 1
+
+    cursor = student_embedding_collection.find({}, projection)
+    async for doc in cursor:
+        student_id = str(doc["student_id"])
+        student_ids.append(student_id)
+        embeddings.append(doc["embedding"])
+        if doc.get("light_embedding") is not None:
+            light_ids.append(student_id)
+            light_embeddings.append(doc["light_embedding"])
+
+    _gallery.load(student_ids, embeddings)
+    _light_gallery.load(light_ids, light_embeddings)
+
+
+def _light_covers(gallery: FaceGallery, light_gallery: FaceGallery) -> bool:
+    """Stage 1 is only sound when every searchable student has a light embedding."""
+    return gallery.student_ids() <= light_gallery.student_ids()
+
+
+def _train_ann_index(gallery: FaceGallery, index: IVFFlatIndex | None) -> IVFFlatIndex:
+    """
+    Build a new index for the gallery: load persisted centroids if still
+    valid, otherwise run k-means and persist. The index currently attached
+    to the gallery is never modified - concurrent searches keep using it
+    until the caller swaps the new one in.
+    """
+    matrix, _ = gallery.snapshot()
+    size = len(matrix)
+
+    # nlist follows the gallery as it grows
+    nlist = ANN_NLIST or int(4 * math.sqrt(size))
+    fresh = IVFFlatIndex(nlist=nlist, nprobe=ANN_NPROBE, min_size=ANN_MIN_GALLERY_SIZE)
+
+    # Persisted centroids are only reused on first build (e.g. after a restart)
+    if index is None and fresh.load(ANN_INDEX_PATH, gallery.dim) and size <= fresh.trained_size * ANN_RETRAIN_GROWTH:
+        return fresh
+
+    fresh.train(matrix)
+    fresh.save(ANN_INDEX_PATH)
+    return fresh
+
+
+async def _maybe_build_ann_index(gallery: FaceGallery):
+    """
+    Attach an IVF index once the gallery is large enough, and retrain it
+    when the gallery has grown well past the size it was trained on.
+    """
+    global _ann_training
+    if not ANN_ENABLED or _ann_training or len(gallery) < ANN_MIN_GALLERY_SIZE:
+        return
+
+    index = gallery.index
+    if index is not None and len(gallery) <= index.trained_size * ANN_RETRAIN_GROWTH:
+        return
+
+    _ann_training = True
+    try:
+        # k-means is CPU heavy; keep it off the event loop. The new index is
+        # trained on the side and only then swapped in
+        index = await asyncio.to_thread(_train_ann_index, gallery, index)
+        gallery.attach_index(index)
+    except Exception as e:
+        logger.error(f"Failed to build ANN index, using exact search: {e}")
+    finally:
+        _ann_training = False
+
+
+async def get_gallery() -> FaceGallery:
+    """Return the school-wide gallery, loading it from MongoDB on first call."""
+    global _gallery_loaded
+    if not _gallery_loaded:
+        async with _gallery_lock:
+            if not _gallery_loaded:
+                await _load_gallery_from_db()
+                _gallery_loaded = True
+                await _maybe_build_ann_index(_gallery)
+    return _gallery
+
+
+async def reload_gallery() -> FaceGallery:
+    """Force a full reload of the gallery from MongoDB."""
+    global _gallery_loaded
+    async with _gallery_lock:
+        await _load_gallery_from_db()
+        _gallery_loaded = True
+        await _maybe_build_ann_index(_gallery)
+    return _gallery
+
+
+async def get_light_gallery() -> FaceGallery | None:
+    """
+    Return the school-wide light gallery for cascade stage 1.
+
+    Returns:
+        The light gallery, or None if some enrolled student has no light
+        embedding yet (stage 1 would then miss them)
+    """
+    global _school_light_coverage
+    gallery = await get_gallery()
+    versions = (gallery.version, _light_gallery.version)
+    if _school_light_coverage is None or _school_light_coverage[0] != versions:
+        _school_light_coverage = (versions, _light_covers(gallery, _light_gallery))
+    return _light_gallery if _school_light_coverage[1] else None
+
+
+async def set_student_gallery_embedding(
+    student_id: str,
+    embedding: list[float],
+    light_embedding: list[float] | None = None
+):
+    """Replace a student's gallery rows after a new embedding is stored."""
+    gallery = await get_gallery()
+    gallery.replace(student_id, embedding)
+    if light_embedding is not None:
+        _light_gallery.replace(student_id, light_embedding)
+    else:
+        # A stale light embedding would disagree with the new ArcFace one
+        _light_gallery.remove(student_id)
+    logger.info(f"Gallery updated for student {student_id} ({len(gallery)} embeddings)")
+    await _maybe_build_ann_index(gallery)
+
+
+async def remove_student_from_gallery(student_id: str):
+    """Drop a student's gallery rows after their embeddings are deleted."""
+    gallery = await get_gallery()
+    removed = gallery.remove(student_id)
+    _light_gallery.remove(student_id)
+    logger.info(f"Removed {removed} gallery embeddings for student {student_id}")
+
+
+async def get_class_galleries(class_id: str, roster: list[str]) -> tuple[FaceGallery, FaceGallery | None]:
+    """
+    Return ArcFace and light sub-galleries restricted to a class roster.
+    Cached per class and rebuilt when the roster or the school galleries change.
+
+    Args:
+        class_id: Class the roster belongs to
+        roster: Student ids enrolled in the class
+
+    Returns:
+        (class_gallery, light_class_gallery) - the light gallery is None when
+        the cascade is disabled or some roster student has no light embedding
+    """
+    gallery = await get_gallery()
+    roster_key = frozenset(roster)
+    versions = (gallery.version, _light_gallery.version)
+
+    cached = _class_galleries.get(class_id)
+    if cached is not None and cached[0] == versions and cached[1] == roster_key:
+        return cached[2], cached[3]
+
+    class_gallery = gallery.subset(roster_key)
+    light_class_gallery = None
+    if CASCADE_ENABLED:
+        light_class_gallery = _light_gallery.subset(roster_key)
+        if not _light_covers(class_gallery, light_class_gallery):
+            light_class_gallery = None
+
+    # Bounded cache: drop the oldest class when full
+    _class_galleries.pop(class_id, None)
+    if len(_class_galleries) >= CLASS_GALLERY_CACHE_SIZE:
+        _class_galleries.pop(next(iter(_class_galleries)))
+    _class_galleries[class_id] = (versions, roster_key, class_gallery, light_class_gallery)
+
+    logger.info(f"Built class gallery for {class_id}: {len(class_gallery)} embeddings from {len(roster_key)} students")
+    return class_gallery, light_class_gallery
+
+
+async def get_class_gallery(class_id: str, roster: list[str]) -> FaceGallery:
+    """
+    Return a sub-gallery restricted to a class roster.
+
+    Args:
+        class_id: Class the roster belongs to
+        roster: Student ids enrolled in the class
+
+    Returns:
+        FaceGallery containing only the roster's embeddings
+    """
+    class_gallery, _ = await get_class_galleries(class_id, roster)
+    return class_gallery
@@ -0,0 +1,408 @@
+"""
+Asynchronous take-attendance jobs.
+Uploads are stored in GridFS and described by a document in
+`recognition_jobs`. Workers - in the API process, or a separate one started
+with `python -m app.services.recognition_job_service` - claim queued jobs
+under a renewable lease, record progress per image and mark attendance at
+the end. A job whose worker died is claimed again once its lease expires;
+images already finished are not processed twice.
+"""
+import asyncio
+import hashlib
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterable
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.database.connection import db
+from app.services.attendance_service import get_session_roster, mark_attendance_from_recognition, SessionNotFound
+from app.services.recognition_service import recognize_multiple_images, summarize_image_results
+from app.utils.config import (
+    RECOGNITION_JOB_WORKERS,
+    RECOGNITION_JOB_LEASE_SECONDS,
+    RECOGNITION_JOB_POLL_SECONDS,
+    RECOGNITION_JOB_MAX_ATTEMPTS,
+    RECOGNITION_JOB_COALESCE_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+recognition_jobs = db["recognition_jobs"]
+job_images = AsyncIOMotorGridFSBucket(db, bucket_name="recognition_job_images")
+
+_ACTIVE_STATUSES = ("queued", "running")
+
+
+class LeaseLost(Exception):
+    """The job was reclaimed by another worker after this one's lease expired."""
+
+
+def recognition_job_helper(job) -> dict:
+    images = job["images"]
+    return {
+        "job_id": str(job["_id"]),
+        "status": job["status"],
+        "class_session_id": job["class_session_id"],
+        "school_fallback": job["school_fallback"],
+        "progress": {
+            "total": len(images),
+            "done": sum(image["status"] != "pending" for image in images),
+        },
+        "images": [
+            {
+                "index": i,
+                "status": image["status"],
+                "faces": len(image.get("detections", [])),
+                "students": [det["student_id"] for det in image.get("detections", []) if det["student_id"]],
+                "duplicate_of": image.get("duplicate_of"),
+            }
+            for i, image in enumerate(images)
+        ],
+        "result": job.get("result"),
+        "attendance_summary": job.get("attendance_summary"),
+        "error": job.get("error"),
+        "attempts": job["attempts"],
+        "submitted_by": job.get("submitted_by"),
+        "created_at": job["created_at"],
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+    }
+
+
+async def ensure_recognition_job_indexes():
+    """Indexes for claiming, lease recovery and coalescing."""
+    await recognition_jobs.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+    await recognition_jobs.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+    # One job per coalesce key; the key is removed when a job fails or goes stale
+    await recognition_jobs.create_index(
+        "coalesce_key", unique=True, partialFilterExpression={"coalesce_key": {"$exists": True}}
+    )
+
+
+async def _delete_images(file_ids: list):
+    for file_id in file_ids:
+        try:
+            await job_images.delete(file_id)
+        except Exception as e:
+            logger.warning(f"Failed to delete job image {file_id}: {e}")
+
+
+def _coalescable(job: dict, now: datetime) -> bool:
+    """Active jobs, and jobs that succeeded within the coalescing window, absorb duplicates."""
+    if job["status"] in _ACTIVE_STATUSES:
+        return True
+    finished_at = job.get("finished_at")
+    return (
+        job["status"] == "succeeded" and finished_at is not None
+        and now - finished_at <= timedelta(seconds=RECOGNITION_JOB_COALESCE_SECONDS)
+    )
+
+
+async def submit_recognition_job(
+    images: AsyncIterable[bytes],
+    class_session_id: str,
+    school_fallback: bool | None,
+    submitted_by: str | None = None
+) -> tuple[dict, bool] | None:
+    """
+    Store the uploads and queue a recognition job.
+
+    Identical submissions (same session, options and image contents) are
+    coalesced: while a matching job is queued or running, or succeeded
+    within RECOGNITION_JOB_COALESCE_SECONDS, that job is returned instead.
+
+    Args:
+        images: Image file bytes, stored to GridFS as they arrive
+        class_session_id: Session to recognize and mark attendance for
+        school_fallback: Retry unmatched faces school-wide (config default if None)
+        submitted_by: User id of the submitter
+
+    Returns:
+        (job view, coalesced), or None if no image was uploaded
+
+    Raises:
+        SessionNotFound: Invalid or unknown class session
+    """
+    await get_session_roster(class_session_id)
+
+    file_ids = []
+    contents = hashlib.sha256()
+    try:
+        async for data in images:
+            contents.update(hashlib.sha256(data).digest())
+            file_ids.append(await job_images.upload_from_stream(
+                f"{class_session_id}-{len(file_ids)}", data,
+                metadata={"class_session_id": class_session_id}
+            ))
+    except BaseException:
+        await _delete_images(file_ids)
+        raise
+
+    if not file_ids:
+        return None
+
+    coalesce_key = hashlib.sha256(
+        f"{class_session_id}|{school_fallback}|{contents.hexdigest()}".encode()
+    ).hexdigest()
+
+    now = datetime.utcnow()
+    existing = await recognition_jobs.find_one({"coalesce_key": coalesce_key})
+    if existing is not None and not _coalescable(existing, now):
+        await recognition_jobs.update_one({"_id": existing["_id"]}, {"$unset": {"coalesce_key": ""}})
+        existing = None
+
+    if existing is None:
+        job = {
+            "class_session_id": class_session_id,
+            "school_fallback": school_fallback,
+            "submitted_by": submitted_by,
+            "status": "queued",
+            "coalesce_key": coalesce_key,
+            "images": [{"file_id": file_id, "status": "pending"} for file_id in file_ids],
+            "attempts": 0,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        try:
+            result = await recognition_jobs.insert_one(job)
+            job["_id"] = result.inserted_id
+            _job_workers.wake()
+            logger.info(f"Queued recognition job {job['_id']} with {len(file_ids)} images")
+            return recognition_job_helper(job), False
+        except DuplicateKeyError:
+            # An identical submission won the race
+            existing = await recognition_jobs.find_one({"coalesce_key": coalesce_key})
+            if existing is None:
+                await _delete_images(file_ids)
+                raise RuntimeError("Identical job changed state while queueing, please retry")
+
+    await _delete_images(file_ids)
+    logger.info(f"Coalesced duplicate submission into recognition job {existing['_id']}")
+    return recognition_job_helper(existing), True
+
+
+async def get_recognition_job_service(job_id: str) -> dict | None:
+    if not ObjectId.is_valid(job_id):
+        return None
+    job = await recognition_jobs.find_one({"_id": ObjectId(job_id)})
+    return recognition_job_helper(job) if job else None
+
+
+# ========== WORKERS ==========
+async def _claim_job() -> dict | None:
+    """Atomically take the oldest queued job, or a running one whose lease expired."""
+    now = datetime.utcnow()
+    return await recognition_jobs.find_one_and_update(
+        {"$or": [
+            {"status": "queued"},
+            {"status": "running", "lease_expires_at": {"$lt": now}},
+        ]},
+        {
+            "$set": {
+                "status": "running",
+                "lease_owner": uuid.uuid4().hex,
+                "lease_expires_at": now + timedelta(seconds=RECOGNITION_JOB_LEASE_SECONDS),
+                "started_at": now,
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def _update_leased(job: dict, update: dict):
+    """Update a job only while this worker still holds its lease."""
+    update.setdefault("$set", {})["updated_at"] = datetime.utcnow()
+    result = await recognition_jobs.update_one(
+        {"_id": job["_id"], "status": "running", "lease_owner": job["lease_owner"]}, update
+    )
+    if result.matched_count == 0:
+        raise LeaseLost(str(job["_id"]))
+
+
+async def _renew_lease(job: dict, task: asyncio.Task):
+    """Heartbeat; cancels the job task if the lease was lost."""
+    while True:
+        await asyncio.sleep(RECOGNITION_JOB_LEASE_SECONDS / 3)
+        expires = datetime.utcnow() + timedelta(seconds=RECOGNITION_JOB_LEASE_SECONDS)
+        try:
+            await _update_leased(job, {"$set": {"lease_expires_at": expires}})
+        except LeaseLost:
+            logger.warning(f"Lost the lease on recognition job {job['_id']}, abandoning it")
+            task.cancel()
+            return
+
+
+async def _run_job(job: dict):
+    """Recognize the job's unfinished images, then tally all images and mark attendance."""
+    images = job["images"]
+    pending = [i for i, image in enumerate(images) if image["status"] == "pending"]
+
+    async def pending_images():
+        for i in pending:
+            stream = await job_images.open_download_stream(images[i]["file_id"])
+            yield await stream.read()
+
+    async def on_image_done(k: int, result: dict):
+        i = pending[k]
+        duplicate_of = None if result["duplicate_of"] is None else pending[result["duplicate_of"]]
+        images[i] = {**images[i], **result, "duplicate_of": duplicate_of}
+        await _update_leased(job, {"$set": {f"images.{i}": images[i]}})
+
+    if pending:
+        await recognize_multiple_images(
+            pending_images(), job["class_session_id"], job["school_fallback"], on_image_done=on_image_done
+        )
+
+    result = summarize_image_results(images)
+    attendance_summary = await mark_attendance_from_recognition(job["class_session_id"], result["detected_students"])
+
+    await _update_leased(job, {"$set": {
+        "status": "succeeded",
+        "result": result,
+        "attendance_summary": attendance_summary,
+        "finished_at": datetime.utcnow(),
+        "lease_owner": None,
+        "lease_expires_at": None,
+    }})
+    await _delete_images([image["file_id"] for image in images])
+
+
+async def _fail_job(job: dict, error: str):
+    """Requeue the job, or give up on it after RECOGNITION_JOB_MAX_ATTEMPTS."""
+    if job["attempts"] < RECOGNITION_JOB_MAX_ATTEMPTS:
+        logger.warning(f"Recognition job {job['_id']} attempt {job['attempts']} failed, requeued: {error}")
+        await _update_leased(job, {"$set": {"status": "queued", "error": error, "lease_owner": None, "lease_expires_at": None}})
+        return
+
+    logger.error(f"Recognition job {job['_id']} failed after {job['attempts']} attempts: {error}")
+    await _update_leased(job, {
+        "$set": {
+            "status": "failed",
+            "error": error,
+            "finished_at": datetime.utcnow(),
+            "lease_owner": None,
+            "lease_expires_at": None,
+        },
+        "$unset": {"coalesce_key": ""},
+    })
+    await _delete_images([image["file_id"] for image in job["images"]])
+
+
+async def _requeue_job(job: dict):
+    """Hand a job back on shutdown without counting the interrupted attempt."""
+    try:
+        await _update_leased(job, {
+            "$set": {"status": "queued", "lease_owner": None, "lease_expires_at": None},
+            "$inc": {"attempts": -1},
+        })
+    except Exception as e:
+        logger.warning(f"Could not requeue recognition job {job['_id']}, it resumes when its lease expires: {e}")
+
+
+async def _process_job(job: dict):
+    job_task = asyncio.create_task(_run_job(job))
+    heartbeat = asyncio.create_task(_renew_lease(job, job_task))
+    try:
+        await job_task
+        logger.info(f"Recognition job {job['_id']} succeeded")
+    except LeaseLost:
+        logger.warning(f"Recognition job {job['_id']} was taken over by another worker")
+    except asyncio.CancelledError:
+        if heartbeat.done() and not heartbeat.cancelled():
+            return  # lease lost; the new owner carries on
+        await _requeue_job(job)
+        raise
+    except SessionNotFound as e:
+        # The session was deleted: retrying cannot help
+        job["attempts"] = RECOGNITION_JOB_MAX_ATTEMPTS
+        await _fail_job(job, str(e))
+    except Exception as e:
+        await _fail_job(job, f"{type(e).__name__}: {e}")
+    finally:
+        heartbeat.cancel()
+
+
+class RecognitionJobWorkers:
+    """In-process pool of job worker tasks that poll Mongo and are woken on local submissions."""
+
+    def __init__(self, count: int):
+        self.count = count
+        self._tasks = []
+        self._wakeup = None
+
+    def start(self):
+        if self._tasks or self.count <= 0:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run(n)) for n in range(self.count)]
+        logger.info(f"Started {self.count} recognition job workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self, n: int):
+        while True:
+            try:
+                job = await _claim_job()
+            except Exception as e:
+                logger.error(f"Recognition job worker {n} failed to claim a job: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), RECOGNITION_JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                if job["attempts"] > RECOGNITION_JOB_MAX_ATTEMPTS:
+                    await _fail_job(job, job.get("error") or "Worker stopped repeatedly while processing this job")
+                    continue
+
+                logger.info(f"Worker {n} processing recognition job {job['_id']} (attempt {job['attempts']})")
+                await _process_job(job)
+            except LeaseLost:
+                logger.warning(f"Recognition job {job['_id']} was taken over by another worker")
+            except Exception as e:
+                logger.error(f"Recognition job worker {n} failed on job {job['_id']}: {e}")
+
+
+_job_workers = RecognitionJobWorkers(RECOGNITION_JOB_WORKERS)
+
+
+def get_recognition_job_workers() -> RecognitionJobWorkers:
+    """Get the in-process job worker pool."""
+    return _job_workers
+
+
+async def _run_standalone_workers():
+    """Worker-only process: no HTTP server, just the job pool."""
+    await ensure_recognition_job_indexes()
+    workers = RecognitionJobWorkers(max(1, RECOGNITION_JOB_WORKERS))
+    workers.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await workers.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run_standalone_workers())
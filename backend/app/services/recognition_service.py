@@ -2,16 +2,64 @@
 Classroom attendance recognition service.
 Handles multiple faces in classroom photos.
 """
-import cv2
+import asyncio
+import logging
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from app.database.connection import student_embedding_collection
+from collections import Counter
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable
 from app.services.face_recognition import (
     detect_multiple_faces,
-    extract_embedding,
-    extract_embeddings_batch
+    detect_multiple_faces_batch,
+    get_embedding_batcher,
+    run_inference
 )
-from app.utils.config import RECOGNITION_MATCH_THRESHOLD
+from app.services.face_recognition.executor import run_in_stage
+from app.services.face_recognition.process_backend import (
+    process_backend_enabled,
+    detect_faces_in_workers,
+    get_inference_process_pool
+)
+from app.services.face_recognition.pipeline import Pipeline, PipelineStage, MemoryBudget
+from app.services.face_recognition.cascade import (
+    cascade_enabled,
+    extract_light_embeddings,
+    accept_light_matches,
+    get_cascade_stats
+)
+from app.services.face_recognition.dedup import NearDuplicateIndex, frame_signature
+from app.services.face_recognition.decoding import decode_for_detection, refine_face_crops, estimate_decode_bytes
+from app.services.face_recognition.gallery import FaceGallery
+from app.services.face_recognition.quality import filter_faces, get_quality_stats
+from app.services.face_recognition.models import get_session_pool_stats
+from app.services.face_recognition.result_cache import get_result_cache
+from app.services.face_recognition.video import track_faces_in_video
+from app.services.gallery_service import get_gallery, get_class_galleries, get_light_gallery
+from app.services.attendance_service import get_session_roster
+from app.utils.config import (
+    RECOGNITION_MATCH_THRESHOLD,
+    RECOGNITION_SCHOOL_FALLBACK,
+    DUPLICATE_FRAME_MODE,
+    YOLO_MAX_BATCH_SIZE,
+    PIPELINE_DECODE_WORKERS,
+    PIPELINE_DETECT_WORKERS,
+    PIPELINE_EMBED_WORKERS,
+    PIPELINE_MATCH_WORKERS,
+    PIPELINE_QUEUE_SIZE,
+    RECOGNITION_REQUEST_MEMORY_BUDGET,
+    RECOGNITION_MEMORY_BUDGET
+)
+
+logger = logging.getLogger(__name__)
+
+# Workers of the pipeline stages that run blocking work on their own executor
+_STAGE_WORKERS = {"embed": PIPELINE_EMBED_WORKERS, "match": PIPELINE_MATCH_WORKERS}
+
+
+async def _run_blocking(stage: str | None, fn, *args):
+    """Run fn on a pipeline stage's executor, or on the inference executor outside the pipeline."""
+    if stage is None:
+        return await run_inference(fn, *args)
+    return await run_in_stage(stage, _STAGE_WORKERS[stage], fn, *args)
 
 
 async def match_embedding(embedding: list[float], threshold: float = None) -> tuple[str | None, float]:
@@ -25,115 +73,463 @@ async def match_embedding(embedding: list[float], threshold: float = None) -> tu
     Returns:
         (student_id, confidence_score) or (None, best_score)
     """
-    if threshold is None:
-        threshold = RECOGNITION_MATCH_THRESHOLD
-    
-    best_id = None
-    best_score = 0.0
-    
-    cursor = student_embedding_collection.find({})
-    async for doc in cursor:
-        stored = np.array(doc["embedding"])
-        score = cosine_similarity([embedding], [stored])[0][0]
-        
-        if score > best_score:
-            best_score = score
-            best_id = str(doc["student_id"])
-    
-    if best_score < threshold:
-        return None, best_score
-    
-    return best_id, best_score
+    student_id, score, _ = (await match_embeddings([embedding], threshold))[0]
+    return student_id, score
 
 
-async def recognize_single_image(image_bytes: bytes) -> list[dict]:
+async def match_embeddings(
+    embeddings: list[list[float]],
+    threshold: float = None,
+    class_gallery: FaceGallery | None = None,
+    school_fallback: bool = False,
+    stage: str | None = None
+) -> list[tuple[str | None, float, str]]:
     """
-    Recognize all faces in a single classroom photo.
-    OPTIMIZATION: Uses batch embedding extraction for all detected faces.
+    Match a batch of face embeddings against the in-memory gallery.
+    OPTIMIZATION: One matrix multiply for all faces instead of a DB scan per face.
+
+    When a class gallery is given, faces are matched against the class roster
+    first; only faces below threshold are retried school-wide, and only if
+    school_fallback is set.
 
     Args:
-        image_bytes: Image file bytes
+        embeddings: List of 512-dim face embeddings
+        threshold: Minimum similarity score (uses config default if None)
+        class_gallery: Optional roster-restricted gallery to search first
+        school_fallback: Retry unmatched faces against the school-wide gallery
+        stage: Pipeline stage whose executor runs the search (None for the
+            inference executor)
 
     Returns:
-        List of detections with bbox, confidence, student_id
+        List of (student_id, confidence_score, scope) - student_id is None below
+        threshold, scope is "class" or "school"
     """
-    # Decode image
-    arr = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+    if threshold is None:
+        threshold = RECOGNITION_MATCH_THRESHOLD
 
-    if img is None:
+    if len(embeddings) == 0:
         return []
 
-    # Detect all faces
-    faces = detect_multiple_faces(img)
+    queries = np.asarray(embeddings, dtype=np.float32)
 
-    if len(faces) == 0:
-        return []
+    if class_gallery is None:
+        gallery = await get_gallery()
+        matches = await _run_blocking(stage, gallery.match, queries, threshold)
+        return [(sid, score, "school") for sid, score in matches]
 
-    # OPTIMIZATION: Extract all embeddings in a single batch
-    face_crops = [face_crop for _, _, _, _, _, face_crop in faces]
+    matches = await _run_blocking(stage, class_gallery.match, queries, threshold)
+    results = [(sid, score, "class") for sid, score in matches]
 
-    try:
-        embeddings = extract_embeddings_batch(face_crops)
-    except ValueError as e:
-        # Fallback to single extraction if batch fails
-        print(f"Batch embedding extraction failed: {e}, falling back to single mode")
-        embeddings = []
-        for face_crop in face_crops:
-            try:
-                embedding = extract_embedding(face_crop)
-                embeddings.append(embedding)
-            except ValueError:
-                embeddings.append(None)
-
-    # Match each embedding against database
-    results = []
-    for (x1, y1, x2, y2, det_conf, face_crop), embedding in zip(faces, embeddings):
-        if embedding is None:
-            # Skip invalid embeddings
-            continue
+    unmatched = [i for i, (sid, _, _) in enumerate(results) if sid is None]
+    if school_fallback and unmatched:
+        gallery = await get_gallery()
+        fallback = await _run_blocking(stage, gallery.match, queries[unmatched], threshold)
+        for i, (sid, score) in zip(unmatched, fallback):
+            if sid is not None:
+                results[i] = (sid, score, "school")
+
+    return results
 
-        # Match against database
-        student_id, match_conf = await match_embedding(embedding)
 
-        results.append({
+def _decode_and_detect(image_bytes: bytes) -> tuple[list[tuple], dict]:
+    """
+    Decode one photo, detect all faces in it and apply the quality gate (blocking).
+    OPTIMIZATION: Large JPEGs are decoded at reduced scale for detection;
+    only small faces are re-cropped from a finer decode.
+
+    Returns:
+        (faces that passed the quality gate, {reason: skipped count})
+    """
+    img, factor = decode_for_detection(image_bytes)
+
+    if img is None:
+        return [], {}
+
+    if process_backend_enabled():
+        faces = detect_faces_in_workers([img], with_landmarks=True)[0]
+    else:
+        faces = detect_multiple_faces(img, with_landmarks=True)
+    faces = refine_face_crops(image_bytes, img, factor, faces)
+    return filter_faces(faces)
+
+
+def _detect_decoded(items: list[dict]):
+    """
+    Detect faces in already decoded photos with batched YOLO runs (blocking).
+    Sets "faces" on every item, in decoded-image coordinates.
+    """
+    decoded = [item for item in items if item["image"] is not None]
+    detect = detect_faces_in_workers if process_backend_enabled() else detect_multiple_faces_batch
+    faces_per_image = detect([item["image"] for item in decoded], with_landmarks=True)
+
+    for item in items:
+        item["faces"] = []
+    for item, faces in zip(decoded, faces_per_image):
+        item["faces"] = faces
+
+
+def _prepare_detected(item: dict):
+    """
+    Map a photo's detections to full resolution (re-cropping small faces
+    from a finer decode) and apply the quality gate (blocking).
+    Sets "faces" and "skips" and releases the decoded image and bytes.
+    """
+    faces = item["faces"]
+    if item["image"] is not None:
+        faces = refine_face_crops(item["bytes"], item["image"], item["factor"], faces)
+    item["faces"], item["skips"] = filter_faces(faces)
+    item["image"] = item["bytes"] = None
+
+
+async def _resolve_light_gallery(
+    class_gallery: FaceGallery | None,
+    light_gallery: FaceGallery | None
+) -> FaceGallery | None:
+    """Light gallery for stage 1, or None when the cascade cannot run."""
+    if not cascade_enabled():
+        return None
+    if class_gallery is None:
+        return await get_light_gallery()
+    return light_gallery
+
+
+async def _cascade_stage1(
+    face_crops: list[np.ndarray],
+    class_gallery: FaceGallery | None,
+    light_gallery: FaceGallery | None,
+    stage: str | None = None
+) -> tuple[list[list[float] | None], list[tuple[str, float] | None]]:
+    """
+    Cascade stage 1: settle conclusive faces with the light embedder.
+    `stage` names the pipeline stage whose executor runs it.
+
+    Returns:
+        (light embedding per face, (student_id, score) per face accepted at
+        stage 1 and None for the rest)
+    """
+    undecided = [None] * len(face_crops)
+    light_gallery = await _resolve_light_gallery(class_gallery, light_gallery)
+    if light_gallery is None:
+        if cascade_enabled():
+            # Some searchable student has no light embedding; stage 1 could miss them
+            get_cascade_stats().record_skipped(len(face_crops))
+        return undecided, undecided
+
+    light_embeddings = await _run_blocking(stage, extract_light_embeddings, face_crops)
+    decisions = await _run_blocking(stage, accept_light_matches, light_gallery, light_embeddings)
+    get_cascade_stats().record(len(face_crops), sum(d is not None for d in decisions))
+    return light_embeddings, decisions
+
+
+async def _embed_faces(
+    faces: list[tuple],
+    class_gallery: FaceGallery | None,
+    light_gallery: FaceGallery | None,
+    stage: str | None = None
+) -> tuple[list[dict], list[tuple[str, float] | None]]:
+    """
+    Embed the faces detected in one image.
+
+    With the cascade enabled, the light embedder settles conclusive faces first
+    (on the executor of pipeline stage `stage`, if given) and only the rest
+    are embedded with ArcFace, on the embedding batcher's own executor.
+
+    Returns:
+        (face records as stored in the result cache, stage-1 decision per face)
+    """
+    if len(faces) == 0:
+        return [], []
+
+    face_crops = [face[5] for face in faces]
+    light_embeddings, stage1 = await _cascade_stage1(face_crops, class_gallery, light_gallery, stage)
+
+    # OPTIMIZATION: Crops are batched with concurrent requests into one ArcFace run
+    pending = [i for i, decision in enumerate(stage1) if decision is None]
+    embeddings = await get_embedding_batcher().embed([face_crops[i] for i in pending])
+
+    records = [
+        {
             "bbox": [x1, y1, x2, y2],
             "detection_confidence": det_conf,
+            "embedding": None,
+            "light_embedding": light_embedding
+        }
+        for (x1, y1, x2, y2, det_conf, *_), light_embedding in zip(faces, light_embeddings)
+    ]
+    for i, embedding in zip(pending, embeddings):
+        records[i]["embedding"] = embedding
+
+    return records, stage1
+
+
+async def _match_records(
+    records: list[dict],
+    stage1: list[tuple[str, float] | None],
+    class_gallery: FaceGallery | None,
+    school_fallback: bool,
+    stage: str | None = None
+) -> list[dict]:
+    """Turn embedded face records and stage-1 decisions into detections."""
+    stage1_scope = "school" if class_gallery is None else "class"
+
+    # Drop faces whose embedding could not be extracted
+    valid = [i for i, decision in enumerate(stage1) if decision is None and records[i]["embedding"] is not None]
+
+    # Match all remaining faces against the gallery in one pass
+    matches = await match_embeddings(
+        [records[i]["embedding"] for i in valid],
+        class_gallery=class_gallery,
+        school_fallback=school_fallback,
+        stage=stage
+    )
+
+    # face index -> (student_id, score, scope, stage)
+    outcomes = {}
+    for i, decision in enumerate(stage1):
+        if decision is not None:
+            student_id, score = decision
+            outcomes[i] = (student_id, score, stage1_scope, 1)
+    for i, (student_id, score, scope) in zip(valid, matches):
+        outcomes[i] = (student_id, score, scope, 2)
+
+    results = []
+    for i, record in enumerate(records):
+        if i not in outcomes:
+            continue
+        student_id, match_conf, scope, stage = outcomes[i]
+        results.append({
+            "bbox": record["bbox"],
+            "detection_confidence": record["detection_confidence"],
             "match_confidence": match_conf,
-            "student_id": student_id
+            "student_id": student_id,
+            "match_scope": scope,
+            "match_stage": stage
         })
 
     return results
 
 
-async def recognize_multiple_images(images_bytes_list: list[bytes]) -> dict:
+async def _recognize_faces(
+    faces: list[tuple],
+    class_gallery: FaceGallery | None,
+    school_fallback: bool,
+    light_gallery: FaceGallery | None = None
+) -> tuple[list[dict], list[dict]]:
     """
-    Recognize faces across multiple classroom photos.
-    Uses majority voting for robustness.
-    
+    Embed and match the faces detected in one image.
+    `light_gallery` is the light counterpart of `class_gallery` (the school
+    light gallery is used otherwise).
+
+    Returns:
+        (detections, face records for the result cache)
+    """
+    records, stage1 = await _embed_faces(faces, class_gallery, light_gallery)
+    return await _match_records(records, stage1, class_gallery, school_fallback), records
+
+
+async def _recognize_cached(
+    entry: dict,
+    class_gallery: FaceGallery | None,
+    school_fallback: bool,
+    light_gallery: FaceGallery | None = None
+) -> list[dict] | None:
+    """
+    Match the faces of a result-cache entry without decode or inference.
+    Stage-1 decisions are re-taken against the current light gallery.
+
+    Returns:
+        Detections, or None when a face settled at stage 1 before is no longer
+        conclusive and has no ArcFace embedding to fall back on
+    """
+    records = entry["faces"]
+    stage1 = [None] * len(records)
+
+    light_gallery = await _resolve_light_gallery(class_gallery, light_gallery)
+    if light_gallery is not None and len(records) > 0:
+        light_embeddings = [record["light_embedding"] for record in records]
+        stage1 = await run_inference(accept_light_matches, light_gallery, light_embeddings)
+
+    for record, decision in zip(records, stage1):
+        if decision is None and record["embedding"] is None and record["light_embedding"] is not None:
+            get_result_cache().record_stale()
+            return None
+
+    return await _match_records(records, stage1, class_gallery, school_fallback)
+
+
+async def _cache_lookup(image_bytes: bytes) -> tuple[str | None, dict | None]:
+    """(cache key, entry) of an upload - (None, None) with the cache disabled."""
+    cache = get_result_cache()
+    if not cache.enabled:
+        return None, None
+    key = await asyncio.to_thread(cache.key, image_bytes)
+    return key, await asyncio.to_thread(cache.get, key)
+
+
+async def _cache_store(key: str | None, records: list[dict], quality_skips: dict):
+    if key is not None:
+        await asyncio.to_thread(get_result_cache().put, key, {"faces": records, "quality_skips": quality_skips})
+
+
+async def _session_galleries(class_session_id: str | None) -> tuple[FaceGallery | None, FaceGallery | None]:
+    """(class gallery, light class gallery) scoping matching to a session's roster; (None, None) without a session."""
+    if class_session_id is None:
+        return None, None
+    class_id, roster = await get_session_roster(class_session_id)
+    return await get_class_galleries(class_id, roster)
+
+
+async def recognize_single_image(
+    image_bytes: bytes,
+    class_gallery: FaceGallery | None = None,
+    school_fallback: bool = False,
+    light_gallery: FaceGallery | None = None
+) -> list[dict]:
+    """
+    Recognize all faces in a single classroom photo.
+    OPTIMIZATION: Uses batch embedding extraction for all detected faces;
+    re-submitted photos are served from the result cache without inference.
+
     Args:
-        images_bytes_list: List of image file bytes
-        
+        image_bytes: Image file bytes
+        class_gallery: Optional roster-restricted gallery to match against first
+        school_fallback: Retry unmatched faces against the whole school
+        light_gallery: Light-model counterpart of class_gallery for the cascade
+
     Returns:
-        {
-            "detected_students": list of unique student_ids,
-            "all_detections": list of all detection details,
-            "vote_counts": dict of student_id -> detection_count
-        }
+        List of detections with bbox, confidence, student_id
+    """
+    key, entry = await _cache_lookup(image_bytes)
+    if entry is not None:
+        detections = await _recognize_cached(entry, class_gallery, school_fallback, light_gallery)
+        if detections is not None:
+            return detections
+
+    faces, quality_skips = await run_inference(_decode_and_detect, image_bytes)
+
+    detections, records = await _recognize_faces(faces, class_gallery, school_fallback, light_gallery)
+    await _cache_store(key, records, quality_skips)
+    return detections
+
+
+# ========== MULTI-PHOTO PIPELINE ==========
+# Each photo is an item dict flowing decode -> detect -> embed -> match;
+# "context" holds (class_gallery, school_fallback, light_gallery) and
+# "charge" the bytes it holds of the request and process memory budgets.
+
+_memory_budget = MemoryBudget("recognition", RECOGNITION_MEMORY_BUDGET)
+
+
+async def _charge_memory(item: dict, nbytes: int):
+    """Wait until the request and process budgets can hold this photo."""
+    await item["budget"].acquire(nbytes)
+    await _memory_budget.acquire(nbytes)
+    item["charge"] = nbytes
+
+
+async def _release_memory(item: dict):
+    nbytes, item["charge"] = item["charge"], 0
+    if nbytes:
+        await item["budget"].release(nbytes)
+        await _memory_budget.release(nbytes)
+
+
+async def _decode_stage(items: list[dict]):
+    """Serve the photo from the result cache, or decode it at detection scale."""
+    for item in items:
+        item["key"], entry = await _cache_lookup(item["bytes"])
+        if entry is not None:
+            detections = await _recognize_cached(entry, *item["context"])
+            if detections is not None:
+                item["detections"], item["skips"] = detections, entry["quality_skips"]
+                item["bytes"] = None
+                await _release_memory(item)
+                continue
+
+        item["image"], item["factor"] = await run_in_stage(
+            "decode", PIPELINE_DECODE_WORKERS, decode_for_detection, item["bytes"]
+        )
+
+
+async def _detect_stage(items: list[dict]):
+    """OPTIMIZATION: Photos queued together share batched YOLO runs."""
+    await run_in_stage("detect", PIPELINE_DETECT_WORKERS, _detect_decoded, items)
+
+
+async def _embed_stage(items: list[dict]):
+    for item in items:
+        # Crop refinement may decode again; it runs here, off the single detect worker
+        await run_in_stage("embed", PIPELINE_EMBED_WORKERS, _prepare_detected, item)
+        class_gallery, _, light_gallery = item["context"]
+        item["records"], item["stage1"] = await _embed_faces(item["faces"], class_gallery, light_gallery, "embed")
+        # Crops are views into the decoded photo; dropping them frees it
+        item["faces"] = None
+        await _release_memory(item)
+        await _cache_store(item["key"], item["records"], item["skips"])
+
+
+async def _match_stage(items: list[dict]):
+    for item in items:
+        class_gallery, school_fallback, _ = item["context"]
+        item["detections"] = await _match_records(
+            item["records"], item["stage1"], class_gallery, school_fallback, "match"
+        )
+
+
+_pipeline = Pipeline(
+    "recognition",
+    [
+        PipelineStage("decode", _decode_stage, PIPELINE_DECODE_WORKERS),
+        PipelineStage("detect", _detect_stage, PIPELINE_DETECT_WORKERS, max_batch=YOLO_MAX_BATCH_SIZE),
+        PipelineStage("embed", _embed_stage, PIPELINE_EMBED_WORKERS),
+        PipelineStage("match", _match_stage, PIPELINE_MATCH_WORKERS),
+    ],
+    PIPELINE_QUEUE_SIZE,
+    skip=lambda item: item["detections"] is not None
+)
+
+
+async def _iterate(images: list[bytes] | AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    if isinstance(images, AsyncIterable):
+        async for image_bytes in images:
+            yield image_bytes
+    else:
+        for image_bytes in images:
+            yield image_bytes
+
+
+def summarize_image_results(image_results: list[dict]) -> dict:
+    """
+    Majority vote over per-image results (see recognize_multiple_images'
+    on_image_done). With DUPLICATE_FRAME_MODE=downweight, each group of
+    near-duplicate frames shares one vote.
+
+    Returns:
+        The recognize_multiple_images result dict
     """
+    groups = [i if result["duplicate_of"] is None else result["duplicate_of"] for i, result in enumerate(image_results)]
+    frame_weights = [1] * len(image_results)
+    if DUPLICATE_FRAME_MODE == "downweight":
+        group_sizes = Counter(groups)
+        frame_weights = [1 / group_sizes[group] for group in groups]
+
     all_detections = []
     vote_counts = {}
-    
-    # Process each image
-    for img_bytes in images_bytes_list:
-        detections = await recognize_single_image(img_bytes)
-        
-        for det in detections:
+    quality_skips = {}
+
+    for result, weight in zip(image_results, frame_weights):
+        for reason, count in result["quality_skips"].items():
+            quality_skips[reason] = quality_skips.get(reason, 0) + count
+
+        for det in result["detections"]:
             all_detections.append(det)
             
             student_id = det["student_id"]
             if student_id:
-                vote_counts[student_id] = vote_counts.get(student_id, 0) + 1
+                vote_counts[student_id] = vote_counts.get(student_id, 0) + weight
+
+    if DUPLICATE_FRAME_MODE == "downweight":
+        vote_counts = {sid: round(count, 3) for sid, count in vote_counts.items()}
     
     # Sort by vote count (most detected first)
     sorted_students = sorted(
@@ -146,5 +542,241 @@ async def recognize_multiple_images(images_bytes_list: list[bytes]) -> dict:
     return {
         "detected_students": detected_students,
         "all_detections": all_detections,
-        "vote_counts": vote_counts
-    }
\ No newline at end of file
+        "vote_counts": vote_counts,
+        "quality_skips": quality_skips,
+        "duplicate_frames": sum(result["duplicate_of"] is not None for result in image_results),
+        "duplicate_frames_skipped": sum(result["status"] == "duplicate" for result in image_results)
+    }
+
+
+async def recognize_multiple_images(
+    images: list[bytes] | AsyncIterable[bytes],
+    class_session_id: str | None = None,
+    school_fallback: bool | None = None,
+    on_image_done: Callable[[int, dict], Awaitable[None]] | None = None
+) -> dict:
+    """
+    Recognize faces across multiple classroom photos.
+    Uses majority voting for robustness.
+
+    When a class session is given, faces are matched against that session's
+    roster instead of every enrolled student. Photos found in the result
+    cache skip decode, detection and embedding; the rest run through the
+    staged pipeline. Near-duplicate burst frames are dropped before
+    detection or have their votes shared (DUPLICATE_FRAME_MODE).
+
+    Photos may be passed as an async iterable while they are still being
+    uploaded; each one enters the pipeline as soon as it arrives and its
+    memory budget allows, and is released once its faces are embedded.
+    
+    Args:
+        images: Image file bytes, as a list or an async iterable
+        class_session_id: Optional session whose roster scopes the search
+        school_fallback: Retry unmatched faces school-wide (config default if None)
+        on_image_done: Optional progress callback, awaited with (image index,
+            {"status": "done" | "duplicate", "detections", "quality_skips",
+            "duplicate_of": representative frame index or None}) as soon as
+            each photo is finished
+        
+    Returns:
+        {
+            "detected_students": list of unique student_ids,
+            "all_detections": list of all detection details,
+            "vote_counts": dict of student_id -> detection_count,
+            "quality_skips": dict of reason -> faces skipped by the quality gate,
+            "duplicate_frames": number of frames that near-duplicate an earlier one,
+            "duplicate_frames_skipped": number of those not processed at all
+        }
+    """
+    if school_fallback is None:
+        school_fallback = RECOGNITION_SCHOOL_FALLBACK
+
+    class_gallery, light_gallery = await _session_galleries(class_session_id)
+
+    context = (class_gallery, school_fallback, light_gallery)
+    request_budget = MemoryBudget("request", RECOGNITION_REQUEST_MEMORY_BUDGET)
+    duplicates = NearDuplicateIndex() if DUPLICATE_FRAME_MODE != "off" else None
+    representatives = []
+    image_results = []
+    admitted = []
+
+    async def finish(index: int, result: dict):
+        image_results[index] = result
+        if on_image_done is not None:
+            await on_image_done(index, result)
+
+    async def admit() -> AsyncIterator[dict]:
+        """Number, de-duplicate and budget photos as they arrive."""
+        first_frame = None
+        async for image_bytes in _iterate(images):
+            index = len(representatives)
+            representative = index
+
+            # OPTIMIZATION: Burst frames add no information; drop them or share one vote per group.
+            # The first frame is only hashed once a second one arrives.
+            if duplicates is not None:
+                if index == 0:
+                    first_frame = image_bytes
+                else:
+                    if first_frame is not None:
+                        duplicates.add(0, await run_inference(frame_signature, first_frame))
+                        first_frame = None
+                    representative = duplicates.add(index, await run_inference(frame_signature, image_bytes))
+            representatives.append(representative)
+            image_results.append(None)
+
+            if DUPLICATE_FRAME_MODE == "drop" and representative != index:
+                await finish(index, {"status": "duplicate", "detections": [], "quality_skips": {}, "duplicate_of": representative})
+                continue
+
+            item = {
+                "index": index, "bytes": image_bytes, "context": context,
+                "detections": None, "budget": request_budget, "charge": 0
+            }
+            admitted.append(item)
+            # Charge the worst case: the detection bitmap plus a finer re-decode for small faces
+            await _charge_memory(item, len(image_bytes) + estimate_decode_bytes(image_bytes, include_refine=True))
+            yield item
+
+    async def processed(item: dict):
+        index = item["index"]
+        duplicate_of = representatives[index] if representatives[index] != index else None
+        await finish(index, {
+            "status": "done", "detections": item["detections"],
+            "quality_skips": item["skips"], "duplicate_of": duplicate_of
+        })
+
+    # OPTIMIZATION: Photos overlap across stages - one decodes while another
+    # is in YOLO and a third is being matched
+    try:
+        await _pipeline.run(admit(), on_done=processed)
+    finally:
+        for item in admitted:
+            await _release_memory(item)
+
+    result = summarize_image_results(image_results)
+    if result["duplicate_frames"]:
+        logger.info(f"Found {result['duplicate_frames']} near-duplicate frames among {len(image_results)} uploads")
+    return result
+
+
+# ========== VIDEO ==========
+def _track_detection(track, fps: float, detections: list[dict], crops: int) -> dict:
+    """
+    Per-track vote: the student matched by most of the track's embedded
+    crops wins, ties going to the higher match confidence.
+    """
+    votes = Counter(det["student_id"] for det in detections if det["student_id"])
+    best = max(detections, key=lambda det: det["match_confidence"], default=None)
+    if votes:
+        winner = max(votes, key=lambda sid: (votes[sid], max(
+            det["match_confidence"] for det in detections if det["student_id"] == sid
+        )))
+        best = max((det for det in detections if det["student_id"] == winner), key=lambda det: det["match_confidence"])
+
+    if best is None:
+        x1, y1, x2, y2 = (int(v) for v in track.filter.box())
+        best = {
+            "bbox": [x1, y1, x2, y2], "detection_confidence": 0.0, "match_confidence": 0.0,
+            "student_id": None, "match_scope": None, "match_stage": None
+        }
+
+    return {
+        **best,
+        "track_id": track.track_id,
+        "first_seen": round(track.first_frame / fps, 2),
+        "last_seen": round(track.last_frame / fps, 2),
+        "frames": track.hits,
+        "crops_embedded": crops,
+        "track_votes": dict(votes),
+    }
+
+
+async def recognize_video(
+    path: str,
+    class_session_id: str | None = None,
+    school_fallback: bool | None = None
+) -> dict | None:
+    """
+    Recognize the students in a classroom video.
+    OPTIMIZATION: Faces are tracked across adaptively sampled frames and only
+    the best-quality crops of each track (VIDEO_CROPS_PER_TRACK) are embedded,
+    all in one micro-batched ArcFace pass - a long clip costs about one
+    embedding per student instead of one per face per frame.
+
+    Args:
+        path: Video file on disk
+        class_session_id: Optional session whose roster scopes the search
+        school_fallback: Retry unmatched faces school-wide (config default if None)
+
+    Returns:
+        None if the video cannot be read, else the recognize_multiple_images
+        result shape with one detection per track (vote_counts counts tracks)
+        plus a "video" dict of sampling and tracking figures
+    """
+    if school_fallback is None:
+        school_fallback = RECOGNITION_SCHOOL_FALLBACK
+
+    class_gallery, light_gallery = await _session_galleries(class_session_id)
+
+    tracked = await run_inference(track_faces_in_video, path)
+    if tracked is None:
+        return None
+
+    tracks = tracked["tracks"]
+    faces_per_track = [track.best_faces() for track in tracks]
+    records, stage1 = await _embed_faces(
+        [face for faces in faces_per_track for face in faces], class_gallery, light_gallery
+    )
+
+    all_detections = []
+    vote_counts = {}
+    offset = 0
+    for track, faces in zip(tracks, faces_per_track):
+        end = offset + len(faces)
+        detections = await _match_records(records[offset:end], stage1[offset:end], class_gallery, school_fallback)
+        offset = end
+
+        detection = _track_detection(track, tracked["fps"], detections, len(faces))
+        all_detections.append(detection)
+        if detection["student_id"]:
+            vote_counts[detection["student_id"]] = vote_counts.get(detection["student_id"], 0) + 1
+
+    detected_students = [sid for sid, _ in sorted(vote_counts.items(), key=lambda x: x[1], reverse=True)]
+    logger.info(
+        f"Video: {len(detected_students)} students from {len(tracks)} tracks, "
+        f"{sum(decision is None for decision in stage1)} ArcFace embeddings for "
+        f"{tracked['frames_sampled']} sampled frames"
+    )
+
+    return {
+        "detected_students": detected_students,
+        "all_detections": all_detections,
+        "vote_counts": vote_counts,
+        "quality_skips": tracked["quality_skips"],
+        "video": {
+            "duration_seconds": round(tracked["duration_seconds"], 2),
+            "frames_read": tracked["frames_read"],
+            "frames_sampled": tracked["frames_sampled"],
+            "truncated": tracked["truncated"],
+            "tracks": len(tracks),
+            "tracks_dropped": tracked["tracks_dropped"],
+            "embeddings": sum(decision is None for decision in stage1),
+        },
+    }
+
+
+def get_recognition_stats() -> dict:
+    """Runtime metrics of the recognition pipeline."""
+    stats = {
+        "embedding_batcher": get_embedding_batcher().stats(),
+        "session_pools": get_session_pool_stats(),
+        "cascade": get_cascade_stats().stats(),
+        "quality_gate": get_quality_stats().stats(),
+        "result_cache": get_result_cache().stats(),
+        "pipeline": _pipeline.stats(),
+        "memory_budget": _memory_budget.stats(),
+    }
+    if process_backend_enabled():
+        stats["inference_processes"] = get_inference_process_pool().stats()
+    return stats
@@ -1,11 +1,16 @@
 from bson import ObjectId
 from app.database.connection import db
+from app.services.gallery_service import set_student_gallery_embedding
 
 student_embeddings = db["student_embeddings"]
 students = db["students"]
 
 
-async def add_student_embedding_service(student_id: str, embedding: list[float]):
+async def add_student_embedding_service(
+    student_id: str,
+    embedding: list[float],
+    light_embedding: list[float] | None = None
+):
     # Check if student exists
     try:
         obj_id = ObjectId(student_id)
@@ -24,9 +29,14 @@ async def add_student_embedding_service(student_id: str, embedding: list[float])
         "student_id": student_id,
         "embedding": embedding
     }
+    if light_embedding is not None:
+        doc["light_embedding"] = light_embedding
 
     result = await student_embeddings.insert_one(doc)
 
+    # Keep the in-memory matching gallery in sync
+    await set_student_gallery_embedding(student_id, embedding, light_embedding)
+
     return {
         "id": str(result.inserted_id),
         "student_id": student_id,
@@ -4,6 +4,7 @@ from app.database.connection import (
     attendance_collection
 )
 from app.database.models import student_helper
+from app.services.gallery_service import remove_student_from_gallery
 from bson import ObjectId, errors
 from fastapi import HTTPException, status
 
@@ -82,6 +83,7 @@ async def delete_student_service(student_id: str):
     
     # Delete student embeddings
     await student_embedding_collection.delete_many({"student_id": student_mongo_id})
+    await remove_student_from_gallery(student_mongo_id)
     
     # Delete attendance records
     await attendance_collection.delete_many({"student_id": student_mongo_id})
@@ -28,12 +28,162 @@ CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
 YOLO_MODEL_PATH = os.getenv("YOLO_MODEL_PATH", "/app/models/yolov8n-face.onnx")
 ARCFACE_MODEL_PATH = os.getenv("ARCFACE_MODEL_PATH", "/app/models/arcface_resnet100.onnx")
 
+# Quantized INT8 variants (produced by app.services.face_recognition.quantization)
+YOLO_INT8_MODEL_PATH = os.getenv("YOLO_INT8_MODEL_PATH", "/app/models/yolov8n-face.int8.onnx")
+ARCFACE_INT8_MODEL_PATH = os.getenv("ARCFACE_INT8_MODEL_PATH", "/app/models/arcface_resnet100.int8.onnx")
+YOLO_MODEL_VARIANT = os.getenv("YOLO_MODEL_VARIANT", "fp32").lower()  # fp32|int8
+ARCFACE_MODEL_VARIANT = os.getenv("ARCFACE_MODEL_VARIANT", "fp32").lower()  # fp32|int8
+
+# Max images per YOLO run when the model has a dynamic batch axis
+YOLO_MAX_BATCH_SIZE = int(os.getenv("YOLO_MAX_BATCH_SIZE", "8"))
+
+# YOLO letterbox input: long side used when the model has dynamic height/width,
+# and whether such models get rectangular (stride-aligned) inputs instead of squares
+YOLO_INPUT_SIZE = int(os.getenv("YOLO_INPUT_SIZE", "640"))
+YOLO_RECT_INPUT = os.getenv("YOLO_RECT_INPUT", "True").lower() == "true"
+
+# Detection mode: "full" squashes the whole photo into one YOLO input; "tiled"
+# also runs overlapping native-scale tiles so faces of EXPECTED_MIN_FACE_RATIO
+# x the photo's long side reach TILE_MIN_FACE_PX at model input; "auto" tiles
+# only when the full-frame pass would shrink them below that
+DETECTION_MODE = os.getenv("DETECTION_MODE", "full").lower()  # full|tiled|auto
+EXPECTED_MIN_FACE_RATIO = float(os.getenv("EXPECTED_MIN_FACE_RATIO", "0.02"))
+TILE_MIN_FACE_PX = int(os.getenv("TILE_MIN_FACE_PX", "32"))
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", "0.2"))
+TILE_MAX_TILES = int(os.getenv("TILE_MAX_TILES", "16"))
+
+# Upload decoding: "reduced" decodes large JPEGs at 1/2, 1/4 or 1/8 scale for
+# detection (long side kept >= DECODE_DETECT_MIN_SIDE, faces of
+# EXPECTED_MIN_FACE_RATIO kept >= FACE_CROP_MIN_SIZE px) and re-reads faces
+# still smaller than that from a finer decode of at most DECODE_MAX_PIXELS
+# pixels; "full" always decodes at full resolution
+DECODE_STRATEGY = os.getenv("DECODE_STRATEGY", "reduced").lower()  # reduced|full
+DECODE_DETECT_MIN_SIDE = int(os.getenv("DECODE_DETECT_MIN_SIDE", "1280"))
+DECODE_MAX_PIXELS = int(os.getenv("DECODE_MAX_PIXELS", "16000000"))
+FACE_CROP_MIN_SIZE = int(os.getenv("FACE_CROP_MIN_SIZE", "112"))
+
+# ONNX Runtime session pools: sessions per model and intra-op threads per session
+# (0 threads = cpu_count // pool size)
+YOLO_SESSION_POOL_SIZE = int(os.getenv("YOLO_SESSION_POOL_SIZE", "2"))
+ARCFACE_SESSION_POOL_SIZE = int(os.getenv("ARCFACE_SESSION_POOL_SIZE", "2"))
+SESSION_INTRA_OP_THREADS = int(os.getenv("SESSION_INTRA_OP_THREADS", "0"))
+
+# ONNX Runtime session options
+ORT_INTER_OP_THREADS = int(os.getenv("ORT_INTER_OP_THREADS", "0"))  # only used in parallel mode
+ORT_GRAPH_OPTIMIZATION_LEVEL = os.getenv("ORT_GRAPH_OPTIMIZATION_LEVEL", "all").lower()  # disabled|basic|extended|all
+ORT_EXECUTION_MODE = os.getenv("ORT_EXECUTION_MODE", "sequential").lower()  # sequential|parallel
+ORT_ENABLE_MEM_PATTERN = os.getenv("ORT_ENABLE_MEM_PATTERN", "True").lower() == "true"
+
+# Serialized ORT-optimised models for fast cold start (empty = disabled)
+ORT_OPTIMIZED_MODEL_CACHE_DIR = os.getenv("ORT_OPTIMIZED_MODEL_CACHE_DIR", "/app/models/cache/optimized")
+
+# Startup thread auto-tuning (skipped when SESSION_INTRA_OP_THREADS is set)
+ORT_AUTOTUNE = os.getenv("ORT_AUTOTUNE", "False").lower() == "true"
+ORT_AUTOTUNE_CONCURRENCY = int(os.getenv("ORT_AUTOTUNE_CONCURRENCY", "0"))  # 0 = session pool size
+ORT_AUTOTUNE_DURATION_SECONDS = float(os.getenv("ORT_AUTOTUNE_DURATION_SECONDS", "1.0"))
+ORT_AUTOTUNE_CACHE_PATH = os.getenv("ORT_AUTOTUNE_CACHE_PATH", "/app/models/cache/ort_tuning.json")
+
+# Load and warm up models in a lifespan hook; /ready stays 503 until done
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "True").lower() == "true"
+
+# Inference executor: worker threads for decode/detection/embedding off the event loop
+INFERENCE_EXECUTOR_WORKERS = int(os.getenv("INFERENCE_EXECUTOR_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Inference backend: "thread" runs detection/embedding on the executor threads,
+# "process" in worker processes that own their ONNX sessions (frames and crops
+# are handed over through shared memory)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "thread").lower()
+INFERENCE_PROCESS_WORKERS = int(os.getenv("INFERENCE_PROCESS_WORKERS", str(max(1, min(4, (os.cpu_count() or 1) // 2)))))
+INFERENCE_PROCESS_SHM_BYTES = int(os.getenv("INFERENCE_PROCESS_SHM_BYTES", str(64 * 1024 * 1024)))  # initial slab per worker, grows on demand
+INFERENCE_PROCESS_TIMEOUT_SECONDS = float(os.getenv("INFERENCE_PROCESS_TIMEOUT_SECONDS", "60"))
+INFERENCE_PROCESS_START_TIMEOUT_SECONDS = float(os.getenv("INFERENCE_PROCESS_START_TIMEOUT_SECONDS", "300"))
+INFERENCE_PROCESS_HEALTH_INTERVAL_SECONDS = float(os.getenv("INFERENCE_PROCESS_HEALTH_INTERVAL_SECONDS", "10"))
+
+# Staged recognition pipeline (decode -> detect -> embed -> match) for multi-photo
+# requests: workers per stage and capacity of the queue in front of each stage
+PIPELINE_DECODE_WORKERS = int(os.getenv("PIPELINE_DECODE_WORKERS", "2"))
+PIPELINE_DETECT_WORKERS = int(os.getenv("PIPELINE_DETECT_WORKERS", "1"))
+PIPELINE_EMBED_WORKERS = int(os.getenv("PIPELINE_EMBED_WORKERS", "2"))
+PIPELINE_MATCH_WORKERS = int(os.getenv("PIPELINE_MATCH_WORKERS", "1"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+
+# ArcFace micro-batching across concurrent requests
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+
 # Face Recognition Thresholds (NEW)
 FACE_DETECTION_THRESHOLD = float(os.getenv("FACE_DETECTION_THRESHOLD", "0.45"))
+NMS_TOP_K = int(os.getenv("NMS_TOP_K", "300"))  # candidates per image kept before NMS
 RECOGNITION_MATCH_THRESHOLD = float(os.getenv("RECOGNITION_MATCH_THRESHOLD", "0.32"))
 
+# Face-quality gate before ArcFace: crops failing any check are not embedded
+QUALITY_GATE_ENABLED = os.getenv("QUALITY_GATE_ENABLED", "True").lower() == "true"
+QUALITY_MIN_FACE_SIZE = int(os.getenv("QUALITY_MIN_FACE_SIZE", "20"))  # px, shorter crop side
+QUALITY_MIN_SHARPNESS = float(os.getenv("QUALITY_MIN_SHARPNESS", "15"))  # Laplacian variance at 112x112
+QUALITY_MIN_BRIGHTNESS = float(os.getenv("QUALITY_MIN_BRIGHTNESS", "35"))  # mean grey level
+QUALITY_MAX_BRIGHTNESS = float(os.getenv("QUALITY_MAX_BRIGHTNESS", "225"))
+QUALITY_MAX_YAW = float(os.getenv("QUALITY_MAX_YAW", "0.6"))  # nose offset / eye distance (landmarks only)
+
+# Two-stage cascade: a light embedder scores every face first; ArcFace only
+# runs when the light top-1 is below threshold or its top-1/top-2 margin is small
+CASCADE_ENABLED = os.getenv("CASCADE_ENABLED", "False").lower() == "true"
+LIGHT_EMBEDDER_MODEL_PATH = os.getenv("LIGHT_EMBEDDER_MODEL_PATH", "/app/models/mobilefacenet.onnx")
+LIGHT_EMBEDDER_POOL_SIZE = int(os.getenv("LIGHT_EMBEDDER_POOL_SIZE", "2"))
+CASCADE_ACCEPT_THRESHOLD = float(os.getenv("CASCADE_ACCEPT_THRESHOLD", "0.5"))
+CASCADE_ACCEPT_MARGIN = float(os.getenv("CASCADE_ACCEPT_MARGIN", "0.15"))
+
+# Near-duplicate (burst) frames within one request: drop them before detection,
+# downweight their votes, or off. The whole-scene hash cannot see face-sized
+# changes (a student turning round), so "drop" can lose faces; "downweight"
+# still recognises every frame and only shares its votes
+DUPLICATE_FRAME_MODE = os.getenv("DUPLICATE_FRAME_MODE", "downweight").lower()  # drop|downweight|off
+DUPLICATE_FRAME_SIMILARITY = float(os.getenv("DUPLICATE_FRAME_SIMILARITY", "0.95"))  # fraction of equal dHash bits
+DUPLICATE_FRAME_HASH_SIZE = int(os.getenv("DUPLICATE_FRAME_HASH_SIZE", "16"))  # hash is size x size bits
+
+# Content-hash cache of detections + embeddings for re-submitted photos
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "True").lower() == "true"
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))  # images kept in memory
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "")  # disk tier (empty = memory only)
+RESULT_CACHE_DISK_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_DISK_MAX_ENTRIES", "5000"))
+
+# Class-scoped matching: retry faces below threshold against the whole school
+RECOGNITION_SCHOOL_FALLBACK = os.getenv("RECOGNITION_SCHOOL_FALLBACK", "False").lower() == "true"
+CLASS_GALLERY_CACHE_SIZE = int(os.getenv("CLASS_GALLERY_CACHE_SIZE", "256"))
+
+# Approximate nearest-neighbour (IVF-flat) index for very large galleries
+ANN_ENABLED = os.getenv("ANN_ENABLED", "True").lower() == "true"
+ANN_MIN_GALLERY_SIZE = int(os.getenv("ANN_MIN_GALLERY_SIZE", "20000"))  # exact search below this
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))  # 0 = auto (4 * sqrt(gallery size))
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))  # higher = better recall, slower
+ANN_RETRAIN_GROWTH = float(os.getenv("ANN_RETRAIN_GROWTH", "2.0"))
+ANN_INDEX_PATH = os.getenv("ANN_INDEX_PATH", "/app/models/cache/gallery_ivf.npz")
+
 # Upload Settings
 MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", "10485760"))  # 10MB
+# Bytes of uploads + detection-scale bitmaps a take-attendance request (and the
+# whole process) may hold at once; further uploads wait until earlier ones are embedded
+RECOGNITION_REQUEST_MEMORY_BUDGET = int(os.getenv("RECOGNITION_REQUEST_MEMORY_BUDGET", "268435456"))  # 256MB
+RECOGNITION_MEMORY_BUDGET = int(os.getenv("RECOGNITION_MEMORY_BUDGET", "1073741824"))  # 1GB
+
+# Video attendance: uploads are spooled to a temp file, frames are sampled
+# adaptively (denser while the camera pans), faces are tracked across frames
+# and only the best crops of each track are embedded
+VIDEO_MAX_UPLOAD_SIZE = int(os.getenv("VIDEO_MAX_UPLOAD_SIZE", "209715200"))  # 200MB
+VIDEO_TEMP_DIR = os.getenv("VIDEO_TEMP_DIR", "") or None  # empty = system temp dir
+VIDEO_MAX_DURATION_SECONDS = float(os.getenv("VIDEO_MAX_DURATION_SECONDS", "60"))  # later frames are ignored
+VIDEO_MIN_SAMPLE_FPS = float(os.getenv("VIDEO_MIN_SAMPLE_FPS", "2"))
+VIDEO_MAX_SAMPLE_FPS = float(os.getenv("VIDEO_MAX_SAMPLE_FPS", "10"))
+VIDEO_TRACK_IOU_THRESHOLD = float(os.getenv("VIDEO_TRACK_IOU_THRESHOLD", "0.3"))
+VIDEO_TRACK_MAX_GAP_SECONDS = float(os.getenv("VIDEO_TRACK_MAX_GAP_SECONDS", "1.0"))
+VIDEO_MIN_TRACK_HITS = int(os.getenv("VIDEO_MIN_TRACK_HITS", "2"))
+VIDEO_CROPS_PER_TRACK = int(os.getenv("VIDEO_CROPS_PER_TRACK", "1"))  # embedded per track, voted within the track
+
+# Asynchronous take-attendance jobs (Mongo-persisted, leased by workers)
+RECOGNITION_JOB_WORKERS = int(os.getenv("RECOGNITION_JOB_WORKERS", "1"))  # in-process workers (0 = separate worker process)
+RECOGNITION_JOB_LEASE_SECONDS = float(os.getenv("RECOGNITION_JOB_LEASE_SECONDS", "60"))
+RECOGNITION_JOB_POLL_SECONDS = float(os.getenv("RECOGNITION_JOB_POLL_SECONDS", "2"))
+RECOGNITION_JOB_MAX_ATTEMPTS = int(os.getenv("RECOGNITION_JOB_MAX_ATTEMPTS", "3"))
+RECOGNITION_JOB_COALESCE_SECONDS = float(os.getenv("RECOGNITION_JOB_COALESCE_SECONDS", "900"))  # identical resubmits reuse a finished job
 
 # Token
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))
\ No newline at end of file
@@ -0,0 +1,116 @@
+"""
+Streaming multipart/form-data reader.
+Yields every form part as soon as it has fully arrived and enforces size
+limits while the bytes stream in, instead of spooling the whole request
+body before the handler runs.
+"""
+from typing import AsyncIterator, BinaryIO, Callable
+from fastapi import HTTPException, Request
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+# Text fields are small; anything bigger is a malformed or hostile request
+MAX_FIELD_SIZE = 64 * 1024
+
+
+async def iter_form_parts(
+    request: Request,
+    max_file_size: int,
+    max_field_size: int = MAX_FIELD_SIZE,
+    file_factory: Callable[[], BinaryIO] | None = None
+) -> AsyncIterator[tuple[str, str | None, bytes | BinaryIO]]:
+    """
+    Parse a multipart request body incrementally.
+
+    Args:
+        request: Incoming request with a multipart/form-data body
+        max_file_size: Maximum bytes of one uploaded file (413 above it)
+        max_field_size: Maximum bytes of one text field (413 above it)
+        file_factory: Optional callable returning a writable binary file
+            (e.g. a temporary file); file parts are then written into it
+            instead of being held in memory, and yielded rewound
+
+    Yields:
+        (field name, filename or None for text fields, content) per part,
+        in the order the client sent them; content is bytes, or the file
+        object for file parts when file_factory is given (the caller closes it)
+
+    Raises:
+        HTTPException: 400 for a missing or malformed multipart body,
+            413 as soon as a part exceeds its limit
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+
+    completed = []
+    part = {}
+
+    def on_part_begin():
+        part.clear()
+        part.update(headers={}, field=bytearray(), value=bytearray(), data=bytearray(), size=0, limit=max_field_size)
+
+    def on_header_field(data: bytes, start: int, end: int):
+        part["field"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][bytes(part["field"]).lower()] = bytes(part["value"])
+        part["field"], part["value"] = bytearray(), bytearray()
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        part["name"] = disposition.get(b"name", b"").decode("utf-8", "replace")
+        filename = disposition.get(b"filename")
+        part["filename"] = None if filename is None else filename.decode("utf-8", "replace")
+        if part["filename"] is not None:
+            part["limit"] = max_file_size
+            if file_factory is not None:
+                part["file"] = file_factory()
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if part["size"] + (end - start) > part["limit"]:
+            what = f"File '{part['filename']}'" if part["filename"] is not None else f"Field '{part['name']}'"
+            raise HTTPException(status_code=413, detail=f"{what} exceeds the {part['limit']} byte limit")
+        part["size"] += end - start
+        if "file" in part:
+            part["file"].write(data[start:end])
+        else:
+            part["data"] += data[start:end]
+
+    def on_part_end():
+        if "file" in part:
+            part["file"].seek(0)
+            completed.append((part["name"], part["filename"], part.pop("file")))
+        else:
+            completed.append((part["name"], part["filename"], bytes(part["data"])))
+        part.clear()
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            # Hand over finished parts while the rest of the body is still arriving
+            while completed:
+                yield completed.pop(0)
+        parser.finalize()
+    except MultipartParseError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed multipart body: {e}")
+    finally:
+        # A file part cut off mid-way is never handed over; close it here
+        if "file" in part:
+            part["file"].close()
+
+    while completed:
+        yield completed.pop(0)